@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django_q.signals import post_spawn
+        from .metrics import register_collector
+        from .monitoring import collect_worker_metrics, install_query_counter
+        from .dispatcher import collect_dispatcher_metrics, send_through_outbox
+        connection_created.connect(install_query_counter)
+        post_spawn.connect(send_through_outbox)
+        register_collector(collect_worker_metrics)
+        register_collector(collect_dispatcher_metrics)
@@ -0,0 +1,166 @@
+import time
+import queue
+import asyncio
+import threading
+from django.db import transaction
+from channels.layers import get_channel_layer
+from .metrics import Counter, Histogram, MetricFamily
+
+
+# Messages waiting to be sent at most. Past that, new messages are dropped rather than blocking the sender.
+DISPATCH_QUEUE_SIZE = 10000
+
+# Functions merging two messages of the same type sent to the same group in one transaction, by message type.
+# Messages of other types are only deduplicated.
+MESSAGE_MERGERS = {}
+
+
+def register_merger(message_type, merger):
+    MESSAGE_MERGERS[message_type] = merger
+
+
+def merge_messages(messages):
+    """
+    The messages of a transaction as one message per group and type, in the order each first appeared.
+    Identical messages are sent once, and different messages of a type with a merger are merged into one.
+    """
+    merged = {}
+    for message in messages:
+        group_name, message_data = message['group_name'], message['message_data']
+        merger = MESSAGE_MERGERS.get(message_data.get('type'))
+        key = (group_name, message_data.get('type')) if merger else (group_name, repr(message_data))
+        if key not in merged:
+            merged[key] = message_data
+        elif merger:
+            merged[key] = merger(merged[key], message_data)
+    return [{'group_name': group_name, 'message_data': message_data}
+            for (group_name, _), message_data in merged.items()]
+
+
+class OutboxBuffer:
+    """The messages sent during one transaction, dispatched merged once it commits."""
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.messages = []
+
+    def flush(self):
+        messages, self.messages = self.messages, []
+        self.dispatcher.send_many(merge_messages(messages))
+
+
+class Dispatcher:
+    """
+    Sends channel layer messages for synchronous code (views, signals, transaction hooks, tasks) from one
+    long-lived thread running one event loop, instead of a new thread and event loop per broadcast.
+
+    Messages go through a bounded queue and are sent in the order they were queued. Sending never blocks the
+    caller: when the queue is full the message is dropped and counted. The time each message spent between
+    being queued and being sent is recorded.
+
+    A process without WebSocket clients, whose channel layer reaches nobody, sends through the outbox instead:
+    its messages are written to the database, and the web processes deliver them (see main.outbox).
+    """
+
+    def __init__(self, maxsize=DISPATCH_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.latency = Histogram()
+        self.sent = Counter()
+        self.dropped = Counter()
+        self.failed = Counter()
+        self.through_outbox = False
+
+    def ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='channel-dispatcher', daemon=True)
+                self.thread.start()
+
+    def send(self, group_name, message_data):
+        """Queue a message for a group."""
+        self.send_many([{'group_name': group_name, 'message_data': message_data}])
+
+    def send_many(self, messages):
+        """Queue messages given as {'group_name': ..., 'message_data': ...} dicts, to be sent in this order."""
+        if self.through_outbox:
+            write_outbox(messages)
+            return
+        self.ensure_started()
+        queued_at = time.monotonic()
+        for message in messages:
+            try:
+                self.queue.put_nowait((queued_at, message['group_name'], message['message_data']))
+            except queue.Full:
+                self.dropped.inc()
+                print(f"Dispatcher queue full, dropped a message for {message['group_name']}.")
+
+    def send_on_commit(self, messages, using=None):
+        """
+        Queue messages once the current transaction commits, merged with the other messages it sends, so clients
+        are never told about state they cannot read yet. Messages of a rolled back transaction are never sent.
+        Outside of a transaction, the messages are sent at once. Through the outbox, the messages are written at once,
+        and only become visible to the web processes once the transaction commits.
+        """
+        if self.through_outbox:
+            write_outbox(messages)
+            return
+        connection = transaction.get_connection(using)
+        buffer = getattr(connection, 'outbox', None)
+        # A buffer whose flush is not pending anymore belongs to a transaction that committed or rolled back
+        if buffer is None or not any(callback[1] == buffer.flush for callback in connection.run_on_commit):
+            buffer = connection.outbox = OutboxBuffer(self)
+            buffer.messages.extend(messages)
+            transaction.on_commit(buffer.flush, using=using)
+        else:
+            buffer.messages.extend(messages)
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        channel_layer = get_channel_layer()
+        while True:
+            queued_at, group_name, message_data = self.queue.get()
+            try:
+                loop.run_until_complete(channel_layer.group_send(group_name, message_data))
+                self.sent.inc()
+            except Exception as e:
+                self.failed.inc()
+                print(f"Error sending message to {group_name}: {e}")
+            self.latency.record(time.monotonic() - queued_at)
+            self.queue.task_done()
+
+    def join(self):
+        """Wait until every queued message has been sent."""
+        self.queue.join()
+
+
+DISPATCHER = Dispatcher()
+
+
+def write_outbox(messages):
+    """Write messages to the outbox, in the current transaction if any, with one bulk insert."""
+    from .models import OutboxMessage
+    OutboxMessage.objects.bulk_create([OutboxMessage(group_name=message['group_name'],
+                                                     message=message['message_data']) for message in messages])
+
+
+def send_through_outbox(**kwargs):
+    """Send the messages of this process through the outbox, for task cluster workers, which have no clients."""
+    DISPATCHER.through_outbox = True
+
+
+def collect_dispatcher_metrics():
+    return [
+        MetricFamily('pong_dispatcher_queue_depth', 'gauge', 'Messages waiting to be sent by the dispatcher.')
+        .add(DISPATCHER.queue.qsize()),
+        MetricFamily('pong_dispatcher_sent_total', 'counter', 'Messages sent by the dispatcher.')
+        .add(DISPATCHER.sent.value),
+        MetricFamily('pong_dispatcher_dropped_total', 'counter', 'Messages dropped because the queue was full.')
+        .add(DISPATCHER.dropped.value),
+        MetricFamily('pong_dispatcher_failed_total', 'counter', 'Messages the channel layer failed to send.')
+        .add(DISPATCHER.failed.value),
+        MetricFamily('pong_dispatcher_latency_seconds', 'summary', 'Time from queueing a message to sending it.')
+        .add_histogram(DISPATCHER.latency),
+    ]
@@ -0,0 +1,83 @@
+import json
+import time
+import asyncio
+from .metrics import Histogram
+
+
+# Seconds between two pings on a WebSocket.
+PING_INTERVAL = 2.0
+# Weight of a new sample in the smoothed round-trip time.
+RTT_SMOOTHING = 0.2
+# Pings still waiting for their pong, older ones are forgotten.
+MAX_PENDING_PINGS = 5
+
+
+class RttTracker:
+    """
+    Smoothed round-trip time per user, an exponentially weighted moving average of the samples measured
+    on any of their WebSockets. Also keeps a histogram of every sample for the metrics.
+    """
+
+    def __init__(self, smoothing=RTT_SMOOTHING):
+        self.smoothing = smoothing
+        self.rtts = {}
+        self.histogram = Histogram(max_value=10.0)
+
+    def record(self, user_id, sample):
+        previous = self.rtts.get(user_id)
+        self.rtts[user_id] = sample if previous is None else previous + self.smoothing * (sample - previous)
+        self.histogram.record(sample)
+
+    def get(self, user_id):
+        """Smoothed round-trip time of the user in seconds, None until measured."""
+        return self.rtts.get(user_id)
+
+    def get_ms(self, user_id):
+        rtt = self.rtts.get(user_id)
+        return None if rtt is None else round(rtt * 1000, 1)
+
+
+USER_RTT = RttTracker()
+
+
+class RttProbe:
+    """
+    Measures the round-trip time of one WebSocket: sends a ping message every PING_INTERVAL seconds
+    and times the pong the client echoes back. Browsers do not expose WebSocket protocol pings to scripts
+    and Channels does not expose them to consumers, so pings are application messages.
+    """
+
+    def __init__(self, consumer, user_id):
+        self.consumer = consumer
+        self.user_id = user_id
+        self.ping_id = 0
+        self.pending = {}
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            self.ping_id += 1
+            self.pending[self.ping_id] = time.perf_counter()
+            if len(self.pending) > MAX_PENDING_PINGS:
+                del self.pending[min(self.pending)]
+            try:
+                await self.consumer.send(text_data=json.dumps({'type': 'ping', 'ping_id': self.ping_id}))
+            except Exception as e:
+                print(f"Error sending ping: {e}")
+                return
+            await asyncio.sleep(PING_INTERVAL)
+
+    def pong(self, ping_id):
+        """Handle the pong of a ping, timed against when we sent it."""
+        sent = self.pending.pop(ping_id, None)
+        if sent is not None:
+            USER_RTT.record(self.user_id, time.perf_counter() - sent)
@@ -0,0 +1,182 @@
+import math
+import threading
+from collections import defaultdict
+
+
+class Histogram:
+    """
+    Bounded histogram with HDR-style log-linear buckets.
+    Values below 2^sub_bucket_bits get a bucket each, above that every power of two is split into
+    2^(sub_bucket_bits - 1) linear buckets, so a quantile is off by at most 1 / 2^(sub_bucket_bits - 1)
+    of its value whatever the range. Memory is fixed by max_value, recording is O(1).
+
+    Values are recorded in seconds and stored as integer multiples of 1 / scale (microseconds by default).
+    """
+
+    def __init__(self, max_value=60.0, scale=1_000_000, sub_bucket_bits=6):
+        self.scale = scale
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_sub_bucket_count = self.sub_bucket_count // 2
+        self.max_units = int(max_value * scale)
+        self.counts = [0] * (self.index_for(self.max_units) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def index_for(self, units):
+        """Bucket index for a value expressed in units."""
+        if units < self.sub_bucket_count:
+            return units
+        shift = units.bit_length() - self.half_sub_bucket_count.bit_length()
+        offset = (units >> shift) - self.half_sub_bucket_count
+        return self.sub_bucket_count + (shift - 1) * self.half_sub_bucket_count + offset
+
+    def highest_value_at(self, index):
+        """Highest value, in units, that falls in the bucket at index."""
+        if index < self.sub_bucket_count:
+            return index
+        shift, offset = divmod(index - self.sub_bucket_count, self.half_sub_bucket_count)
+        shift += 1
+        return ((offset + self.half_sub_bucket_count) << shift) + (1 << shift) - 1
+
+    def record(self, value):
+        """Record a value in seconds. Values are clamped to [0, max_value]."""
+        units = min(max(int(value * self.scale), 0), self.max_units)
+        self.counts[self.index_for(units)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Value in seconds under which a share q of the recorded values fall."""
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self.highest_value_at(index) / self.scale, self.max)
+        return self.max
+
+    def summary(self):
+        """p50, p99 and max in milliseconds, with the number of recorded values."""
+        return {
+            'count': self.count,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Counter:
+    """Monotonic counter, safe to increment from several threads."""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Gauge:
+    """
+    Value that goes up and down. It stays unset until it is first given a value,
+    so collectors can seed it lazily from the database once and then keep it up to date in memory.
+    """
+
+    def __init__(self):
+        self.value = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            if self.value is not None:
+                self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class ConnectionTracker:
+    """
+    Keeps the channel names of the open WebSocket connections per consumer type.
+    Opening or closing the same channel twice is harmless, which matters since consumers may run disconnect twice.
+    """
+
+    def __init__(self):
+        self.channels = defaultdict(set)
+
+    def opened(self, kind, channel_name):
+        self.channels[kind].add(channel_name)
+
+    def closed(self, kind, channel_name):
+        self.channels[kind].discard(channel_name)
+
+    def counts(self):
+        return {kind: len(channel_names) for kind, channel_names in self.channels.items()}
+
+
+class MetricFamily:
+    """A named metric and its samples, rendered in the Prometheus text exposition format."""
+
+    def __init__(self, name, metric_type, documentation):
+        self.name = name
+        self.metric_type = metric_type
+        self.documentation = documentation
+        self.samples = []
+
+    def add(self, value, suffix='', **labels):
+        self.samples.append((self.name + suffix, labels, value))
+        return self
+
+    def add_histogram(self, histogram, **labels):
+        """Add a Histogram as summary samples: p50, p99, max (quantile 1), sum and count."""
+        for quantile in (0.5, 0.99):
+            self.add(histogram.quantile(quantile), quantile=str(quantile), **labels)
+        self.add(histogram.max, quantile='1', **labels)
+        self.add(histogram.total, suffix='_sum', **labels)
+        self.add(histogram.count, suffix='_count', **labels)
+        return self
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for name, labels, value in self.samples:
+            label_string = ','.join(f'{key}="{escape_label_value(label_value)}"'
+                                    for key, label_value in labels.items())
+            lines.append(f'{name}{{{label_string}}} {value}' if label_string else f'{name} {value}')
+        return '\n'.join(lines)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# Callables returning lists of MetricFamily, registered by each app when it is ready.
+COLLECTORS = []
+
+
+def register_collector(collector):
+    if collector not in COLLECTORS:
+        COLLECTORS.append(collector)
+
+
+def render_metrics():
+    """Collect every registered metric and render them in the text exposition format."""
+    families = []
+    for collector in COLLECTORS:
+        try:
+            families.extend(collector())
+        except Exception as e:
+            print(f"Error collecting metrics from {collector.__name__}: {e}")
+    return '\n'.join(family.render() for family in families) + '\n'
+
+
+DB_QUERIES = Counter()
+WEBSOCKET_CONNECTIONS = ConnectionTracker()
@@ -1,3 +1,14 @@
 from django.db import models
 
-# Create your models here.
+
+class OutboxMessage(models.Model):
+    """
+    A channel layer message sent by a process without WebSocket clients, such as a task cluster worker,
+    written in the transaction it is about, for every web process to deliver to its own clients.
+    """
+    group_name = models.CharField(max_length=100)
+    message = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.message.get('type')} for {self.group_name} at {self.created_at}"
@@ -0,0 +1,162 @@
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import defaultdict
+from django.conf import settings
+from channels.layers import get_channel_layer
+from .metrics import Histogram, MetricFamily, DB_QUERIES, WEBSOCKET_CONNECTIONS
+from .latency import USER_RTT
+
+
+# How often the event loop checks in, in seconds. Lag is measured against this schedule.
+LOOP_LAG_INTERVAL = 0.05
+# How long past its check-in the loop may be before we consider it blocked and capture what it is running.
+BLOCKING_THRESHOLD = 0.1
+# At most one blocking report is logged per this many seconds, the others are counted.
+BLOCKING_LOG_INTERVAL = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs a callback scheduled LOOP_LAG_INTERVAL seconds ahead.
+    Every game, consumer and broadcast shares that loop, so its lag is the delay they all see.
+
+    A watchdog thread also watches the loop's check-ins: when the loop is more than BLOCKING_THRESHOLD late,
+    something is blocking it right now, so the watchdog captures the stack of the loop's thread,
+    counts it per code location, and logs it (rate limited).
+    """
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, blocking_threshold=BLOCKING_THRESHOLD):
+        self.interval = interval
+        self.blocking_threshold = blocking_threshold
+        self.loop = None
+        self.task = None
+        self.watchdog = None
+        self.loop_thread_id = None
+        self.last_check_in = None
+        self.reported_check_in = None
+        self.lag = 0.0
+        self.histogram = Histogram()
+        self.blocked = defaultdict(int)
+        self.last_log_time = 0.0
+        self.suppressed_logs = 0
+
+    def ensure_started(self):
+        """Start sampling on the running event loop, if we are not already sampling it."""
+        loop = asyncio.get_running_loop()
+        if self.loop is loop and self.task and not self.task.done():
+            return
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.last_check_in = time.monotonic()
+        self.task = loop.create_task(self.run())
+        if self.watchdog is None:
+            self.watchdog = threading.Thread(target=self.watch, name='loop-watchdog', daemon=True)
+            self.watchdog.start()
+
+    async def run(self):
+        while True:
+            scheduled = self.loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_check_in = time.monotonic()
+            self.lag = max(0.0, self.loop.time() - scheduled)
+            self.histogram.record(self.lag)
+
+    def watch(self):
+        """Watchdog thread: report the loop once per stall when it misses its check-in by the threshold."""
+        while True:
+            time.sleep(self.blocking_threshold / 2)
+            check_in = self.last_check_in
+            overdue = time.monotonic() - check_in - self.interval
+            if overdue >= self.blocking_threshold and check_in != self.reported_check_in:
+                self.reported_check_in = check_in
+                self.report_blocking(overdue)
+
+    def report_blocking(self, overdue):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        location = blocking_location(stack)
+        self.blocked[location] += 1
+        now = time.monotonic()
+        if now - self.last_log_time < BLOCKING_LOG_INTERVAL:
+            self.suppressed_logs += 1
+            return
+        logger.warning(json.dumps({
+            'event': 'event_loop_blocked',
+            'blocked_ms_at_capture': round(overdue * 1000, 1),
+            'location': location,
+            'suppressed_since_last_report': self.suppressed_logs,
+            'stack': [f'{entry.filename}:{entry.lineno} in {entry.name}' for entry in stack[-15:]],
+        }))
+        self.last_log_time = now
+        self.suppressed_logs = 0
+
+
+def blocking_location(stack):
+    """Innermost frame of the stack that is our own code, or the innermost frame if none is."""
+    base_dir = str(settings.BASE_DIR)
+    for entry in reversed(stack):
+        if entry.filename.startswith(base_dir) and 'site-packages' not in entry.filename:
+            return f'{entry.filename[len(base_dir) + 1:]}:{entry.lineno} {entry.name}'
+    entry = stack[-1]
+    return f'{entry.filename}:{entry.lineno} {entry.name}'
+
+
+LOOP_MONITOR = LoopLagMonitor()
+
+
+def channel_layer_queue_depths():
+    """
+    Queued messages per channel of the channel layer. Only the in-memory layer exposes its queues,
+    other backends report nothing.
+    """
+    channels = getattr(get_channel_layer(), 'channels', None)
+    if not isinstance(channels, dict):
+        return {}
+    return {name: queue.qsize() for name, queue in list(channels.items())}
+
+
+def collect_worker_metrics():
+    """Metrics of the worker process: database queries, WebSockets, channel layer, event loop and latency."""
+    depths = channel_layer_queue_depths()
+    websockets = MetricFamily('pong_websocket_connections', 'gauge', 'Open WebSocket connections per consumer.')
+    for kind, count in WEBSOCKET_CONNECTIONS.counts().items():
+        websockets.add(count, consumer=kind)
+    blocked = MetricFamily('pong_event_loop_blocked_total', 'counter',
+                           'Times the event loop was caught blocked, per code location.')
+    for location, count in list(LOOP_MONITOR.blocked.items()):
+        blocked.add(count, location=location)
+    return [
+        MetricFamily('pong_db_queries_total', 'counter', 'Database queries run by this worker.')
+        .add(DB_QUERIES.value),
+        websockets,
+        MetricFamily('pong_channel_layer_messages', 'gauge', 'Messages waiting in the channel layer queues.')
+        .add(sum(depths.values())),
+        MetricFamily('pong_channel_layer_max_queue_depth', 'gauge', 'Deepest channel layer queue.')
+        .add(max(depths.values(), default=0)),
+        MetricFamily('pong_event_loop_lag_seconds', 'summary', 'Delay of the event loop in running callbacks.')
+        .add_histogram(LOOP_MONITOR.histogram),
+        blocked,
+        MetricFamily('pong_websocket_rtt_seconds', 'summary', 'Round-trip time measured on the WebSockets.')
+        .add_histogram(USER_RTT.histogram),
+    ]
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper counting every query run on the connection."""
+    DB_QUERIES.inc()
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Install count_queries on every new database connection."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
@@ -0,0 +1,74 @@
+import time
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .dispatcher import DISPATCHER, merge_messages
+from .models import OutboxMessage
+
+# How long after being written a message may still become visible: a transaction of a task commits at the latest
+# when the cluster kills its worker, at the task timeout. Messages are kept twice as long before being deleted.
+OUTBOX_WINDOW = timedelta(seconds=settings.Q_CLUSTER['timeout'])
+OUTBOX_RETENTION = 2 * OUTBOX_WINDOW
+# Seconds between two reads of the outbox, and between two deletions of the messages past their retention.
+OUTBOX_POLL_INTERVAL = 0.25
+OUTBOX_PRUNE_INTERVAL = 60
+
+
+class OutboxRelay:
+    """
+    Delivers the messages of the outbox to the WebSocket clients of this process, through the dispatcher.
+    Every web process delivers every message, as each one has its own clients, so messages are never claimed:
+    each relay remembers which messages of the window it delivered. Transactions commit in any order, so the
+    whole window is read again on every poll, rather than only the messages after the last one delivered.
+    """
+
+    def __init__(self):
+        self.delivered = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='outbox-relay', daemon=True)
+                self.thread.start()
+
+    def poll(self):
+        """
+        Deliver the messages of the window not delivered yet, merged per group. The first poll only takes note of
+        the messages already there, written before this process had clients to deliver them to.
+        Returns how many messages were delivered.
+        """
+        ids = set(OutboxMessage.objects.filter(created_at__gt=timezone.now() - OUTBOX_WINDOW)
+                  .values_list('id', flat=True))
+        new = sorted(ids - self.delivered) if self.delivered is not None else []
+        self.delivered = ids
+        if not new:
+            return 0
+        messages = OutboxMessage.objects.filter(id__in=new).order_by('id').values_list('group_name', 'message')
+        DISPATCHER.send_many(merge_messages([{'group_name': group_name, 'message_data': message}
+                                             for group_name, message in messages]))
+        return len(new)
+
+    def prune(self):
+        """Delete the messages past their retention, which every relay has read by now."""
+        OutboxMessage.objects.filter(created_at__lt=timezone.now() - OUTBOX_RETENTION).delete()
+
+    def run(self):
+        pruned_at = 0
+        while True:
+            try:
+                self.poll()
+                if time.monotonic() - pruned_at > OUTBOX_PRUNE_INTERVAL:
+                    self.prune()
+                    pruned_at = time.monotonic()
+            except Exception as e:
+                print(f"Error relaying the outbox: {e}")
+            finally:
+                close_old_connections()
+            time.sleep(OUTBOX_POLL_INTERVAL)
+
+
+OUTBOX_RELAY = OutboxRelay()
@@ -1,3 +1,161 @@
-from django.test import TestCase
+import time
+import asyncio
+import threading
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .dispatcher import DISPATCHER, Dispatcher
+from .models import OutboxMessage
+from .outbox import OutboxRelay, OUTBOX_RETENTION
 
-# Create your tests here.
+
+def broadcast_in_new_thread(group_name, message_data):
+    """The former way of broadcasting from synchronous code: a new thread and event loop per message."""
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(get_channel_layer().group_send(group_name, message_data))
+        loop.close()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+class DispatcherBenchmarkTest(SimpleTestCase):
+    """Broadcasting through the dispatcher, against a new thread and event loop per broadcast."""
+
+    BROADCASTS = 1000
+    GROUP = 'dispatcher_benchmark'
+
+    def setUp(self):
+        self.channel_layer = get_channel_layer()
+        self.channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(self.GROUP, self.channel)
+
+    def tearDown(self):
+        async_to_sync(self.channel_layer.flush)()
+
+    def receive_all(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.channel_layer.channels[self.channel].get_nowait())
+            except (KeyError, asyncio.QueueEmpty):
+                return messages
+
+    def test_messages_are_sent_in_order_from_one_thread(self):
+        dispatcher = Dispatcher()
+        for number in range(50):
+            dispatcher.send(self.GROUP, {'type': 'benchmark', 'number': number})
+        dispatcher.join()
+        received = [message[1]['number'] for message in self.receive_all()]
+        self.assertEqual(received, list(range(50)))
+        self.assertEqual(dispatcher.sent.value, 50)
+        self.assertEqual(dispatcher.dropped.value, 0)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        dispatcher = Dispatcher(maxsize=1)
+        dispatcher.ensure_started = lambda: None  # nothing drains the queue
+        dispatcher.send(self.GROUP, {'type': 'benchmark'})
+        dispatcher.send(self.GROUP, {'type': 'benchmark'})
+        self.assertEqual(dispatcher.dropped.value, 1)
+
+    def test_benchmark_against_thread_per_broadcast(self):
+        threads_before = threading.active_count()
+        start = time.perf_counter()
+        threads = [broadcast_in_new_thread(self.GROUP, {'type': 'benchmark'}) for _ in range(self.BROADCASTS)]
+        for thread in threads:
+            thread.join()
+        thread_per_broadcast = time.perf_counter() - start
+        async_to_sync(self.channel_layer.flush)()
+        async_to_sync(self.channel_layer.group_add)(self.GROUP, self.channel)
+
+        dispatcher = Dispatcher()
+        start = time.perf_counter()
+        for _ in range(self.BROADCASTS):
+            dispatcher.send(self.GROUP, {'type': 'benchmark'})
+        queued = time.perf_counter() - start
+        dispatcher.join()
+        dispatched = time.perf_counter() - start
+
+        self.assertEqual(dispatcher.sent.value, self.BROADCASTS)
+        self.assertEqual(dispatcher.dropped.value, 0)
+        self.assertLessEqual(threading.active_count(), threads_before + 1)
+        latency = dispatcher.latency.summary()
+        print(f"\n{self.BROADCASTS} broadcasts: thread per broadcast {thread_per_broadcast:.3f}s "
+              f"({len(threads)} threads), dispatcher {dispatched:.3f}s (1 thread, callers blocked {queued:.3f}s), "
+              f"queue to send p50 {latency['p50_ms']}ms p99 {latency['p99_ms']}ms")
+
+
+class OutboxTest(TestCase):
+    """Messages sent through the outbox are written in their transaction and delivered once by each relay."""
+
+    GROUP = 'outbox_test'
+
+    def setUp(self):
+        self.channel_layer = get_channel_layer()
+        self.channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(self.GROUP, self.channel)
+        self.dispatcher = Dispatcher()
+        self.dispatcher.through_outbox = True
+
+    def tearDown(self):
+        async_to_sync(self.channel_layer.flush)()
+
+    def receive_all(self):
+        DISPATCHER.join()
+        messages = []
+        while True:
+            try:
+                messages.append(self.channel_layer.channels[self.channel].get_nowait()[1])
+            except (KeyError, asyncio.QueueEmpty):
+                return messages
+
+    def test_relay_delivers_new_messages_once(self):
+        self.dispatcher.send_on_commit([{'group_name': self.GROUP, 'message_data': {'type': 'outbox', 'number': 0}}])
+        relay = OutboxRelay()
+        # Messages written before the relay started had nobody to go to
+        self.assertEqual(relay.poll(), 0)
+
+        self.dispatcher.send_on_commit([{'group_name': self.GROUP, 'message_data': {'type': 'outbox', 'number': 1}},
+                                        {'group_name': self.GROUP, 'message_data': {'type': 'outbox', 'number': 1}}])
+        self.dispatcher.send(self.GROUP, {'type': 'outbox', 'number': 2})
+        self.assertEqual(self.dispatcher.queue.qsize(), 0)
+        self.assertEqual(relay.poll(), 3)
+        self.assertEqual(relay.poll(), 0)
+        self.assertEqual([message['number'] for message in self.receive_all()], [1, 2])
+
+    def test_prune_deletes_messages_past_retention(self):
+        self.dispatcher.send(self.GROUP, {'type': 'outbox'})
+        self.dispatcher.send(self.GROUP, {'type': 'outbox'})
+        old = OutboxMessage.objects.first()
+        OutboxMessage.objects.filter(id=old.id).update(created_at=timezone.now() - OUTBOX_RETENTION - timedelta(1))
+        OutboxRelay().prune()
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertFalse(OutboxMessage.objects.filter(id=old.id).exists())
+
+
+@override_settings(METRICS_ALLOWED_IPS=['10.0.0.9'])
+class MetricsViewTest(TestCase):
+    """The metrics are only exposed to staff users and to the allowed addresses, such as the Prometheus server."""
+
+    def setUp(self):
+        self.url = reverse('metrics_view')
+        User = get_user_model()
+        self.player = User.objects.create_user(username='player', password='password', alias='player')
+        self.staff = User.objects.create_user(username='staff', password='password', alias='staff', is_staff=True)
+
+    def test_anonymous_and_players_are_refused(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.1').status_code, 403)
+        self.client.force_login(self.player)
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    def test_staff_and_allowed_addresses_read_the_metrics(self):
+        response = self.client.get(self.url, REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE', response.content)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.1').status_code, 200)
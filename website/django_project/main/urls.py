@@ -7,4 +7,5 @@ urlpatterns = [
     path('navbar/', views.navbar_view, name='navbar_view'),
     path('sidebar/', views.sidebar_view, name='sidebar_view'),
     path('queue/', views.queue_view, name='queue_view'),
+    path('metrics', views.metrics_view, name='metrics_view'),
 ]
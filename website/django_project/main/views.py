@@ -1,8 +1,12 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 from users.models import CustomUser
 from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
 from .utils import render_template 
+from .metrics import render_metrics
 
 def main_view(request):
     return render_template(request, 'main_template.html')
@@ -21,4 +25,14 @@ def sidebar_view(request):
 
 @login_required
 def queue_view(request):
-    return render_template(request, 'queue.html')
\ No newline at end of file
+    return render_template(request, 'queue.html')
+
+
+def metrics_view(request):
+    """
+    Expose the worker's metrics in the Prometheus text format. Everything is read from in-memory counters.
+    Only staff users and the addresses of METRICS_ALLOWED_IPS may read them.
+    """
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
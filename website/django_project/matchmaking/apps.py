@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MatchmakingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'matchmaking'
+
+    def ready(self):
+        from main.metrics import register_collector
+        from .signals import collect_queue_metrics
+        from .matchmaking import collect_matchmaker_metrics
+        register_collector(collect_queue_metrics)
+        register_collector(collect_matchmaker_metrics)
@@ -2,8 +2,11 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import QueueEntry
-from .matchmaking import match_users
+from .matchmaking import MATCHMAKER
 from users.consumers import add_channel_name_to_session, remove_channel_name_from_session
+from main.metrics import WEBSOCKET_CONNECTIONS
+from main.monitoring import LOOP_MONITOR
+from main.latency import RttProbe
 
 
 class QueueConsumer(AsyncWebsocketConsumer):
@@ -13,34 +16,45 @@ class QueueConsumer(AsyncWebsocketConsumer):
         super().__init__(*args, **kwargs)
         self.user = None
         self.room_group_name = None
+        self.rtt_probe = None
 
     async def connect(self):
         """
         Handle new WebSocket connection.
-        Assigns a unique group for each user and initiates the matchmaking process.
+        Assigns a unique group for each user and adds them to the matchmaker.
         """
         # Assign a unique group based on the user's ID to manage matchmaking
         self.user = self.scope["user"]
         self.room_group_name = f'queue_{self.user.id}'
 
         # Add the user to their group and accept the WebSocket connection
+        LOOP_MONITOR.ensure_started()
         await self.accept()
+        WEBSOCKET_CONNECTIONS.opened('queue', self.channel_name)
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await add_channel_name_to_session(self.scope, self.channel_name)
 
-        # Start matchmaking process
-        await match_users()
+        self.rtt_probe = RttProbe(self, self.user.id)
+        self.rtt_probe.start()
+
+        # Hand the user to the matchmaker, which pairs the queue on its own cadence
+        MATCHMAKER.enqueue(self.user.id, self.user.rating)
+        MATCHMAKER.ensure_started()
 
     async def disconnect(self, close_code):
         """
         Handle disconnection of WebSocket.
         Removes the user from the matchmaking group and deletes their queue entry.
         """
+        WEBSOCKET_CONNECTIONS.closed('queue', self.channel_name)
+        if self.rtt_probe:
+            self.rtt_probe.stop()
         # Remove the user from their matchmaking group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
         # Remove the channel from the user's session
         await remove_channel_name_from_session(self.scope, self.channel_name)
-        # Remove the user's entry from the matchmaking queue
+        # Remove the user from the matchmaker and their entry from the queue backup
+        MATCHMAKER.remove(self.user.id)
         await self.delete_queue_entry()
         await self.close()
 
@@ -60,6 +74,8 @@ class QueueConsumer(AsyncWebsocketConsumer):
 
                         if message_type == 'leave_message':
                             await self.leave_message(self)
+                        elif message_type == 'pong':
+                            self.rtt_probe.pong(text_data_json.get('ping_id'))
         except json.JSONDecodeError as e:
             print(f'Error decoding JSON: {e}')
 
@@ -77,3 +93,7 @@ class QueueConsumer(AsyncWebsocketConsumer):
             'session_id': data['message']['session_id']
         }))
         await self.close()
+
+    async def queue_status(self, data):
+        """Send the user their position in the queue and the estimated time until they are matched."""
+        await self.send(text_data=json.dumps({'type': 'queue_status', **data['message']}))
@@ -0,0 +1,83 @@
+import heapq
+import base64
+from datetime import datetime
+from django.db.models import Q
+from .models import GameSession
+
+# Matches per page of history, by default and at most.
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a history cursor cannot be decoded."""
+
+
+def encode_cursor(session):
+    """Opaque cursor pointing right after a session, in (created_at, id) order."""
+    return base64.urlsafe_b64encode(f'{session.created_at.isoformat()}|{session.id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(session_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+
+def history_branch(user_id, role, position, limit):
+    """
+    Finished games where the user played as `role` ('player1' or 'player2'), newest first, starting after
+    `position`. Served by the (role, created_at, id) index: the created_at bound gives the start of the index
+    range and the id condition only breaks ties, so every page costs one index seek and `limit` rows.
+    """
+    games = GameSession.objects.filter(**{role: user_id}, status='finished')
+    if position is not None:
+        created_at, session_id = position
+        games = games.filter(Q(created_at__lt=created_at) | Q(id__lt=session_id), created_at__lte=created_at)
+    return (games.select_related('player1', 'player2', 'winner')
+            .order_by('-created_at', '-id')[:limit])
+
+
+def get_match_history_page(user_id, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """
+    One page of a user's finished games as player1 or player2, newest first, with keyset pagination:
+    each role is read from its own index and the two branches are merged.
+
+    Args:
+        user_id (int): The user whose history is read.
+        cursor (str): The cursor returned with the previous page, None for the first page.
+        limit (int): Number of games in the page.
+
+    Returns:
+        tuple: The games of the page and the cursor of the next page, None on the last page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    branches = [history_branch(user_id, role, position, limit + 1) for role in ('player1', 'player2')]
+    merged = heapq.merge(*branches, key=lambda session: (session.created_at, session.id), reverse=True)
+    games, seen = [], set()
+    for session in merged:
+        # Local games have the user in both roles
+        if session.id not in seen:
+            seen.add(session.id)
+            games.append(session)
+        if len(games) > limit:
+            break
+    next_cursor = encode_cursor(games[limit - 1]) if len(games) > limit else None
+    return games[:limit], next_cursor
+
+
+def serialize_game(session, user_id):
+    """Convert a game to a dictionary for serialization, from the point of view of the user."""
+    as_player1 = session.player1_id == user_id
+    opponent = session.player2 if as_player1 else session.player1
+    return {
+        'id': session.id,
+        'created_at': session.created_at.isoformat(),
+        'mode': session.mode,
+        'opponent': opponent.alias,
+        'result': 'win' if session.winner_id == user_id else 'loss',
+        'score': [session.player1_score, session.player2_score] if as_player1
+        else [session.player2_score, session.player1_score],
+    }
@@ -0,0 +1,129 @@
+import time
+import threading
+from datetime import timedelta
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.utils import timezone
+from .models import GameSession
+
+
+# Players shown on the leaderboards.
+LEADERBOARD_SIZE = 10
+# Ratings are ranked by their integer part, clamped to [0, MAX_RANKED_RATING].
+MAX_RANKED_RATING = 4000
+# The rank tree is seeded from the database again after this many seconds, to pick up the rating changes made
+# outside the web process (rebuild_ratings, admin edits, bulk inserts of users), which it is not told about.
+RANKS_RESEED_INTERVAL = 600
+# Leaderboards are invalidated whenever a game finishes, this only bounds how long the per-period ones
+# keep counting games that fell out of their period.
+LEADERBOARD_CACHE_TIMEOUT = 300
+# Periods of the wins leaderboards, and how far back they go.
+PERIODS = {'week': timedelta(days=7), 'month': timedelta(days=30)}
+LEADERBOARD_CACHE_KEYS = ['leaderboard:rating'] + [f'leaderboard:wins:{period}' for period in PERIODS]
+
+
+class RatingRanks:
+    """
+    Fenwick tree counting players per integer rating, so the rank of a rating is answered in O(log n)
+    instead of counting the players above it in the database. Seeded with one grouped query,
+    then kept up to date as ratings change.
+
+    The tree lives in the memory of one process and only hears of the rating changes committed there: it assumes
+    a single web process, the one running the games, whose finished games are the only rating writes while it
+    runs. Ranks drift from the database by the changes made elsewhere until the next reseed, at most
+    RANKS_RESEED_INTERVAL later; running several web processes needs a shared rank index instead.
+    """
+
+    def __init__(self, max_rating=MAX_RANKED_RATING):
+        self.size = max_rating + 1
+        self.tree = [0] * (self.size + 1)
+        self.total = 0
+        self.seeded_at = None
+        self.lock = threading.Lock()
+
+    def index_for(self, rating):
+        return min(max(int(rating), 0), self.size - 1) + 1
+
+    def add(self, rating, count=1):
+        index = self.index_for(rating)
+        while index <= self.size:
+            self.tree[index] += count
+            index += index & -index
+        self.total += count
+
+    def count_up_to(self, rating):
+        """Number of players whose rating is at most `rating`, by integer part."""
+        index = self.index_for(rating)
+        count = 0
+        while index > 0:
+            count += self.tree[index]
+            index -= index & -index
+        return count
+
+    def ensure_seeded(self):
+        if self.seeded_at is not None and time.monotonic() - self.seeded_at < RANKS_RESEED_INTERVAL:
+            return
+        counts = get_user_model().objects.values_list('rating').annotate(players=Count('id')).order_by()
+        with self.lock:
+            self.tree = [0] * (self.size + 1)
+            self.total = 0
+            for rating, players in counts:
+                self.add(rating, players)
+            self.seeded_at = time.monotonic()
+
+    def rank(self, rating):
+        """1-based rank of a rating: one more than the number of players rated strictly higher."""
+        self.ensure_seeded()
+        with self.lock:
+            return self.total - self.count_up_to(rating) + 1
+
+    def player_added(self, rating):
+        with self.lock:
+            if self.seeded_at is not None:
+                self.add(rating)
+
+    def player_removed(self, rating):
+        with self.lock:
+            if self.seeded_at is not None:
+                self.add(rating, -1)
+
+    def rating_changed(self, old_rating, new_rating):
+        with self.lock:
+            if self.seeded_at is not None:
+                self.add(old_rating, -1)
+                self.add(new_rating)
+
+
+RATING_RANKS = RatingRanks()
+
+
+def get_rating_leaderboard():
+    """Top players by rating, from the cache."""
+    leaderboard = cache.get('leaderboard:rating')
+    if leaderboard is None:
+        leaderboard = list(get_user_model().objects.order_by('-rating', 'id')
+                           .values('id', 'alias', 'rating', 'rated_games')[:LEADERBOARD_SIZE])
+        cache.set('leaderboard:rating', leaderboard, LEADERBOARD_CACHE_TIMEOUT)
+    return leaderboard
+
+
+def get_wins_leaderboard(period):
+    """Top players by games won over the last week or month, from the cache."""
+    cache_key = f'leaderboard:wins:{period}'
+    leaderboard = cache.get(cache_key)
+    if leaderboard is None:
+        leaderboard = list(GameSession.objects
+                           .filter(status='finished', winner__isnull=False,
+                                   created_at__gte=timezone.now() - PERIODS[period])
+                           .exclude(mode='local')
+                           .values('winner_id', 'winner__alias')
+                           .annotate(wins=Count('id'))
+                           .order_by('-wins', 'winner_id')[:LEADERBOARD_SIZE])
+        cache.set(cache_key, leaderboard, LEADERBOARD_CACHE_TIMEOUT)
+    return leaderboard
+
+
+def invalidate_leaderboards():
+    """Drop the cached leaderboards, called once a finished game is committed."""
+    cache.delete_many(LEADERBOARD_CACHE_KEYS)
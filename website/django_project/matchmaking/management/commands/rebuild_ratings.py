@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from matchmaking.models import GameSession
+from matchmaking.ratings import DEFAULT_RATING, FINISH_ORDER, rating_changes
+from matchmaking.leaderboard import invalidate_leaderboards
+
+# Finished games read from the database per round trip.
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = ('Recompute every rating from the full game history, in the order games finished. '
+            'Only needed for backfills: ratings are otherwise updated incrementally when games finish.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Compute the ratings without saving them.')
+
+    def handle(self, *args, dry_run=False, **options):
+        User = get_user_model()
+        ratings = {}
+        games = (GameSession.objects
+                 .filter(status='finished', winner__isnull=False)
+                 .exclude(mode='local').exclude(player1=F('player2'))
+                 .order_by(*FINISH_ORDER)
+                 .values_list('player1_id', 'player2_id', 'winner_id')
+                 .iterator(chunk_size=CHUNK_SIZE))
+        game_count = 0
+        for player1_id, player2_id, winner_id in games:
+            player1 = ratings.setdefault(player1_id, [DEFAULT_RATING, 0])
+            player2 = ratings.setdefault(player2_id, [DEFAULT_RATING, 0])
+            change1, change2 = rating_changes(tuple(player1), tuple(player2), winner_id == player1_id)
+            player1[0] += change1
+            player2[0] += change2
+            player1[1] += 1
+            player2[1] += 1
+            game_count += 1
+        self.stdout.write(f'Replayed {game_count} games for {len(ratings)} players.')
+        if dry_run:
+            return
+
+        with transaction.atomic():
+            User.objects.update(rating=DEFAULT_RATING, rated_games=0)
+            users = [User(id=user_id, rating=rating, rated_games=rated_games)
+                     for user_id, (rating, rated_games) in ratings.items()]
+            User.objects.bulk_update(users, ['rating', 'rated_games'], batch_size=CHUNK_SIZE)
+        invalidate_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f'Ratings rebuilt for {len(users)} players.'))
@@ -1,50 +1,306 @@
+import time
+import asyncio
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict, deque
+from django.db import transaction
+from django.contrib.auth import get_user_model
 from channels.db import database_sync_to_async
-from .models import QueueEntry, GameSession
 from channels.layers import get_channel_layer
-from users.consumers import update_user_session_id
-from pong_app.consumers import create_game_instance_async
+from main.metrics import Histogram, MetricFamily
+from main.latency import USER_RTT
+from .models import QueueEntry, GameSession
+from .ratings import DEFAULT_RATING
+from pong_app.consumers import start_game_instance, GOVERNOR
 
 
-@database_sync_to_async
-def get_queued_users():
+# Width of the rating buckets the queue is indexed by.
+RATING_BUCKET_SIZE = 100
+# Rating difference accepted as soon as a player joins, how much it widens per second of waiting, and its cap.
+BASE_RATING_WINDOW = 50
+RATING_WINDOW_GROWTH = 10
+MAX_RATING_WINDOW = 1000
+# Round-trip time difference, in seconds, accepted as soon as a player joins, how much it widens per second
+# of waiting, and its cap. Players whose RTT is not measured yet are compatible with anyone.
+BASE_RTT_WINDOW = 0.04
+RTT_WINDOW_GROWTH = 0.01
+MAX_RTT_WINDOW = 0.5
+# Rating points a millisecond of round-trip time difference is worth when choosing between candidates.
+RTT_COST_WEIGHT = 1.0
+# How many of the next players in rating order each player is compared with.
+MATCH_LOOKAHEAD = 3
+# Seconds between two pairing passes.
+MATCHMAKING_INTERVAL = 1.0
+# Seconds of recent matches the match rate, and so the estimated wait, is computed over.
+MATCH_RATE_WINDOW = 60.0
+# Seconds between two queue status updates, and how many are sent before yielding to the event loop.
+QUEUE_STATUS_INTERVAL = 5.0
+QUEUE_STATUS_BATCH_SIZE = 100
+
+
+class QueuedPlayer:
+    """A player waiting in the matchmaker, with their rating and the time they joined the queue."""
+
+    __slots__ = ('user_id', 'rating', 'joined_at')
+
+    def __init__(self, user_id, rating, joined_at):
+        self.user_id = user_id
+        self.rating = rating
+        self.joined_at = joined_at
+
+    def rating_window(self, now):
+        """Rating difference this player accepts, widening the longer they wait."""
+        return min(BASE_RATING_WINDOW + RATING_WINDOW_GROWTH * (now - self.joined_at), MAX_RATING_WINDOW)
+
+    def rtt_window(self, now):
+        """Round-trip time difference this player accepts, widening the longer they wait."""
+        return min(BASE_RTT_WINDOW + RTT_WINDOW_GROWTH * (now - self.joined_at), MAX_RTT_WINDOW)
+
+    def sort_key(self):
+        """The order of players in their bucket: by rating, ties broken by user ID so each player has one place."""
+        return self.rating, self.user_id
+
+
+class Matchmaker:
     """
-    Retrieve all users in the queue with their related User objects.
+    Keeps the matchmaking queue in memory, bucketed by rating, and pairs it in batches on a fixed cadence.
+    Each bucket is a list kept sorted by rating as players join and leave, so a pass walks the queue in rating
+    order without sorting it. Only one pass runs at a time, so a player can never be paired twice. QueueEntry rows are only a durable
+    backup: they are written when players join and leave, and read once at startup to restore wait times.
+    """
+
+    def __init__(self):
+        self.buckets = defaultdict(list)
+        self.players = {}
+        self.restored_joined_at = {}
+        self.task = None
+        self.lock = asyncio.Lock()
+        self.pass_duration = Histogram()
+        self.wait_time = Histogram(max_value=3600.0)
+        self.recent_matches = deque()
+        # The metrics view reads the match rate from another thread while the loop records matches.
+        self.recent_matches_lock = threading.Lock()
+        self.sent_statuses = {}
+        self.last_status_time = 0.0
+
+    def enqueue(self, user_id, rating=DEFAULT_RATING, joined_at=None):
+        """Add a player to the queue, keeping the time they originally joined if we know it."""
+        self.remove(user_id)
+        if joined_at is None:
+            joined_at = self.restored_joined_at.pop(user_id, time.time())
+        player = QueuedPlayer(user_id, rating, joined_at)
+        self.players[user_id] = player
+        insort(self.buckets[int(rating // RATING_BUCKET_SIZE)], player, key=QueuedPlayer.sort_key)
+
+    def remove(self, user_id):
+        self.sent_statuses.pop(user_id, None)
+        player = self.players.pop(user_id, None)
+        if player is not None:
+            bucket_key = int(player.rating // RATING_BUCKET_SIZE)
+            bucket = self.buckets[bucket_key]
+            index = bisect_left(bucket, player.sort_key(), key=QueuedPlayer.sort_key)
+            if index < len(bucket) and bucket[index] is player:
+                del bucket[index]
+            if not bucket:
+                del self.buckets[bucket_key]
+
+    def sorted_players(self):
+        """Queued players ordered by rating: the buckets, each kept sorted, walked in order."""
+        ordered = []
+        for bucket_key in sorted(self.buckets):
+            ordered.extend(self.buckets[bucket_key])
+        return ordered
+
+    def find_pairs(self, now):
+        """
+        Walk the players in rating order and pair each with the cheapest compatible player among the next
+        MATCH_LOOKAHEAD, so players of similar rating and similar latency are preferred.
+        O(n) in the size of the queue, which is kept sorted.
+        """
+        players = self.sorted_players()
+        rtts = {player.user_id: USER_RTT.get(player.user_id) for player in players}
+        paired = set()
+        pairs = []
+        for index, player in enumerate(players):
+            if player.user_id in paired:
+                continue
+            best_cost, best_match = None, None
+            for other in players[index + 1:index + 1 + MATCH_LOOKAHEAD]:
+                if other.user_id in paired:
+                    continue
+                cost = match_cost(player, other, rtts[player.user_id], rtts[other.user_id], now)
+                if cost is not None and (best_cost is None or cost < best_cost):
+                    best_cost, best_match = cost, other
+            if best_match is not None:
+                paired.update((player.user_id, best_match.user_id))
+                pairs.append((player, best_match))
+        return pairs
 
-    This function uses `select_related` to fetch related User objects in the same query,
-    optimizing database access and avoiding additional queries when accessing user instances.
-    It returns a list instead of a QuerySet to ensure compatibility with async context.
+    def ensure_started(self):
+        """Start the pairing loop on the running event loop, restoring the queue backup first."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        self.restored_joined_at = await get_queue_backup()
+        while True:
+            try:
+                await self.match_once()
+            except Exception as e:
+                print(f"Matchmaking pass failed: {e}")
+            if time.monotonic() - self.last_status_time >= QUEUE_STATUS_INTERVAL:
+                self.last_status_time = time.monotonic()
+                try:
+                    await self.send_queue_statuses()
+                except Exception as e:
+                    print(f"Queue status update failed: {e}")
+            await asyncio.sleep(MATCHMAKING_INTERVAL)
+
+    def record_matches(self, pairs, now):
+        """Account the players of a batch in the wait times and in the rolling window of recent matches."""
+        for player in [player for pair in pairs for player in pair]:
+            self.wait_time.record(now - player.joined_at)
+        with self.recent_matches_lock:
+            self.recent_matches.append((now, len(pairs) * 2))
+
+    def match_rate(self, now):
+        """Players matched per second over the last MATCH_RATE_WINDOW seconds."""
+        with self.recent_matches_lock:
+            while self.recent_matches and self.recent_matches[0][0] < now - MATCH_RATE_WINDOW:
+                self.recent_matches.popleft()
+            return sum(players for _, players in self.recent_matches) / MATCH_RATE_WINDOW
+
+    def queue_statuses(self, now):
+        """
+        Position in the queue, by time waited, and estimated seconds until matched of every waiting player.
+        The estimate is the number of players ahead drained at the recent match rate, None while nothing matches.
+        """
+        rate = self.match_rate(now)
+        statuses = {}
+        for position, player in enumerate(sorted(self.players.values(), key=lambda player: player.joined_at), 1):
+            estimate = round(position / rate) if rate else None
+            statuses[player.user_id] = {'position': position, 'estimated_wait': estimate}
+        return statuses
+
+    async def send_queue_statuses(self):
+        """
+        Send every waiting player their queue status, at most once per QUEUE_STATUS_INTERVAL and only when
+        it changed: one message per player per interval, sent in batches that yield to the event loop.
+        """
+        channel_layer = get_channel_layer()
+        changed = [(user_id, status) for user_id, status in self.queue_statuses(time.time()).items()
+                   if self.sent_statuses.get(user_id) != status]
+        for start in range(0, len(changed), QUEUE_STATUS_BATCH_SIZE):
+            batch = changed[start:start + QUEUE_STATUS_BATCH_SIZE]
+            await asyncio.gather(*[channel_layer.group_send(f'queue_{user_id}',
+                                                            {'type': 'queue_status', 'message': status})
+                                   for user_id, status in batch])
+            for user_id, status in batch:
+                if user_id in self.players:
+                    self.sent_statuses[user_id] = status
+            await asyncio.sleep(0)
+
+    async def match_once(self):
+        """Run one pairing pass: pair the queue in memory, then persist and start every game of the batch."""
+        async with self.lock:
+            if not GOVERNOR.accepting_games():
+                return
+            start = time.perf_counter()
+            now = time.time()
+            pairs = self.find_pairs(now)
+            self.pass_duration.record(time.perf_counter() - start)
+            if not pairs:
+                return
+            for player1, player2 in pairs:
+                self.remove(player1.user_id)
+                self.remove(player2.user_id)
+            try:
+                sessions, left_out = await create_game_sessions([(player1.user_id, player2.user_id)
+                                                                 for player1, player2 in pairs])
+            except Exception:
+                # Put the batch back in the queue, with the time they joined, so nobody loses their place.
+                for player in [player for pair in pairs for player in pair]:
+                    self.enqueue(player.user_id, player.rating, player.joined_at)
+                raise
+            # Players whose partner was already taken by another worker go back in the queue.
+            batch = {player.user_id: player for pair in pairs for player in pair}
+            for user_id in left_out:
+                self.enqueue(user_id, batch[user_id].rating, batch[user_id].joined_at)
+            matched = {session.player1_id for session in sessions}
+            self.record_matches([pair for pair in pairs if pair[0].user_id in matched], now)
+            await start_matched_games(sessions)
+
+
+MATCHMAKER = Matchmaker()
+
+
+def match_cost(player, other, player_rtt, other_rtt, now):
+    """
+    Cost of pairing two players: their rating difference plus their round-trip time difference
+    weighted by RTT_COST_WEIGHT. None if either difference is outside the windows of either player.
     """
-    return list(QueueEntry.objects.select_related('user').all())
+    rating_gap = abs(other.rating - player.rating)
+    if rating_gap > min(player.rating_window(now), other.rating_window(now)):
+        return None
+    if player_rtt is None or other_rtt is None:
+        return rating_gap
+    rtt_gap = abs(other_rtt - player_rtt)
+    if rtt_gap > min(player.rtt_window(now), other.rtt_window(now)):
+        return None
+    return rating_gap + RTT_COST_WEIGHT * rtt_gap * 1000
 
 
 @database_sync_to_async
-def create_game_session_db(user1, user2):
-    """Create a new game session in the database for two users."""
-    return GameSession.objects.create(player1=user1, player2=user2, mode='online')
+def get_queue_backup():
+    """Join times of the users in the QueueEntry backup, so restored players keep their place."""
+    return {user_id: joined_at.timestamp()
+            for user_id, joined_at in QueueEntry.objects.values_list('user_id', 'joined_at')}
 
 
 @database_sync_to_async
-def delete_queue_entries(users):
-    """Delete QueueEntry objects for specified users."""
-    QueueEntry.objects.filter(user__in=users).delete()
+def create_game_sessions(user_id_pairs):
+    """
+    Create the game sessions of a batch of pairs found in memory, in one transaction.
+    The pairs' queue entries are claimed with SKIP LOCKED first, so a pair whose entry another worker is pairing,
+    or has already paired, is left out. Returns the created sessions and the ids of the users left unmatched.
+    """
+    with transaction.atomic():
+        claimed = set(QueueEntry.objects.select_for_update(skip_locked=True)
+                      .filter(user_id__in=[user_id for pair in user_id_pairs for user_id in pair])
+                      .values_list('user_id', flat=True))
+        pairs = [pair for pair in user_id_pairs if claimed.issuperset(pair)]
+        left_out = [user_id for pair in user_id_pairs if not claimed.issuperset(pair)
+                    for user_id in pair if user_id in claimed]
+        return create_sessions_for_pairs(pairs), left_out
 
 
-async def match_users():
+def create_sessions_for_pairs(user_id_pairs):
     """
-    Match users into game sessions asynchronously.
-
-    This function iterates through queued users, pairs them, creates game sessions,
-    notifies the users of the match, and then removes them from the queue.
+    Create a game session per pair of users, whose queue entries the caller has claimed within its transaction:
+    one query to load the users, one bulk insert of the sessions, one bulk update of the users' session_id
+    and one delete of their queue entries.
     """
-    queued_users = await get_queued_users()
-    for i in range(0, len(queued_users), 2):
-        if i + 1 < len(queued_users):
-            session = await create_game_session_db(queued_users[i].user, queued_users[i + 1].user)
-            await create_game_instance_async(session.id)
-            for user in [session.player1, session.player2]:
-                await update_user_session_id(user, session.id)
-            await notify_users_of_match(queued_users[i].user.id, queued_users[i + 1].user.id, session.id)
-            await delete_queue_entries([queued_users[i].user, queued_users[i + 1].user])
+    if not user_id_pairs:
+        return []
+    User = get_user_model()
+    users = User.objects.in_bulk([user_id for pair in user_id_pairs for user_id in pair])
+    sessions = GameSession.objects.bulk_create([
+        GameSession(player1=users[user1_id], player2=users[user2_id], mode='online')
+        for user1_id, user2_id in user_id_pairs
+    ])
+    for session in sessions:
+        session.player1.session_id = session.id
+        session.player2.session_id = session.id
+    User.objects.bulk_update(users.values(), ['session_id'])
+    QueueEntry.objects.filter(user__in=users.keys()).delete()
+    return sessions
+
+
+async def start_matched_games(sessions):
+    """Start the games of freshly created sessions and tell their players where to go."""
+    for session in sessions:
+        start_game_instance(session)
+        await notify_users_of_match(session.player1.id, session.player2.id, session.id)
 
 
 async def notify_users_of_match(user1_id, user2_id, session_id):
@@ -61,3 +317,15 @@ async def notify_users_of_match(user1_id, user2_id, session_id):
             {'type': 'game_matched', 'message': {'session_id': session_id}}
         )
 
+
+def collect_matchmaker_metrics():
+    return [
+        MetricFamily('pong_matchmaker_players', 'gauge', 'Players waiting in the in-memory matchmaker.')
+        .add(len(MATCHMAKER.players)),
+        MetricFamily('pong_matchmaker_pass_seconds', 'summary', 'Time spent pairing the queue in one pass.')
+        .add_histogram(MATCHMAKER.pass_duration),
+        MetricFamily('pong_matchmaker_wait_seconds', 'summary', 'Time matched players waited in the queue.')
+        .add_histogram(MATCHMAKER.wait_time),
+        MetricFamily('pong_matchmaker_match_rate', 'gauge', 'Players matched per second over the last minute.')
+        .add(MATCHMAKER.match_rate(time.time())),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2024-06-05 11:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matchmaking', '0008_gamesession_player1_score_gamesession_player2_score'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['player1', 'created_at', 'id'], name='gamesession_player1_history'),
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['player2', 'created_at', 'id'], name='gamesession_player2_history'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2024-06-13 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matchmaking', '0009_gamesession_player1_history_gamesession_player2_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
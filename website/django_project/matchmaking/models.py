@@ -33,6 +33,15 @@ class GameSession(models.Model):
                                              null=True, blank=True)
     player1_score = models.IntegerField(default=0)
     player2_score = models.IntegerField(default=0)
+    # When the game was accounted in its players' ratings and statistics: the order rebuilds replay games in.
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Serve the match history of a user in either role in (created_at, id) order, without sorting.
+        indexes = [
+            models.Index(fields=['player1', 'created_at', 'id'], name='gamesession_player1_history'),
+            models.Index(fields=['player2', 'created_at', 'id'], name='gamesession_player2_history'),
+        ]
 
     def __str__(self):
         return (f"{self.mode} game between {self.player1.alias} and {self.player2.alias} "
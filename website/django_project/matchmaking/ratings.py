@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from .leaderboard import RATING_RANKS, invalidate_leaderboards
+
+
+# Rating of players who have not played a rated game yet.
+DEFAULT_RATING = 1000
+# Rating change factor: larger while a player's rating is provisional, so new players converge quickly.
+PROVISIONAL_K_FACTOR = 40
+K_FACTOR = 20
+PROVISIONAL_GAMES = 20
+# The order finished games were accounted in, which rebuilds replay them in. Games finished before finish times
+# were recorded have none, and come first in the order they were created.
+FINISH_ORDER = [F('finished_at').asc(nulls_first=True), 'created_at', 'id']
+
+
+def expected_score(rating, opponent_rating):
+    """Probability, according to Elo, that a player rated `rating` beats one rated `opponent_rating`."""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def k_factor(rated_games):
+    return PROVISIONAL_K_FACTOR if rated_games < PROVISIONAL_GAMES else K_FACTOR
+
+
+def rating_changes(player1, player2, player1_won):
+    """
+    Rating change of both players after one game.
+
+    Args:
+        player1 (tuple): Rating and number of rated games of the first player.
+        player2 (tuple): Rating and number of rated games of the second player.
+        player1_won (bool): Whether the first player won.
+
+    Returns:
+        tuple: The rating change of each player.
+    """
+    (rating1, games1), (rating2, games2) = player1, player2
+    score1 = 1.0 if player1_won else 0.0
+    expected1 = expected_score(rating1, rating2)
+    return k_factor(games1) * (score1 - expected1), k_factor(games2) * (expected1 - score1)
+
+
+def is_rated(session):
+    """Only finished online and tournament games between two different players with a winner count."""
+    return (session.status == 'finished' and session.winner_id is not None
+            and session.mode != 'local' and session.player1_id != session.player2_id)
+
+
+def apply_game_result(session):
+    """
+    Update the ratings of both players of a finished game, from their current ratings only.
+    Must run in the transaction that marks the session finished: the players' rows are locked
+    so concurrent games of the same player are applied one after the other.
+    """
+    if not is_rated(session):
+        return
+    User = get_user_model()
+    players = User.objects.select_for_update().in_bulk([session.player1_id, session.player2_id])
+    player1, player2 = players[session.player1_id], players[session.player2_id]
+    change1, change2 = rating_changes((player1.rating, player1.rated_games), (player2.rating, player2.rated_games),
+                                      session.winner_id == player1.id)
+    for player, change in [(player1, change1), (player2, change2)]:
+        transaction.on_commit(lambda old=player.rating, new=player.rating + change:
+                              RATING_RANKS.rating_changed(old, new))
+        player.rating += change
+        player.rated_games += 1
+    User.objects.bulk_update([player1, player2], ['rating', 'rated_games'])
+    transaction.on_commit(invalidate_leaderboards)
+    print(f"Ratings updated after game {session.id}: "
+          f"{player1.alias} {player1.rating:.0f} ({change1:+.1f}), {player2.alias} {player2.rating:.0f} ({change2:+.1f})")
@@ -0,0 +1,39 @@
+from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from django.dispatch import receiver
+from main.metrics import Gauge, MetricFamily
+from .models import QueueEntry
+from .leaderboard import RATING_RANKS
+
+
+# Users waiting in the queue, seeded from the database on the first scrape and then kept up to date by signals.
+QUEUED_USERS = Gauge()
+
+
+@receiver(post_save, sender=QueueEntry)
+def queue_entry_created(sender, instance, created, **kwargs):
+    if created:
+        QUEUED_USERS.inc()
+
+
+@receiver(post_delete, sender=QueueEntry)
+def queue_entry_deleted(sender, instance, **kwargs):
+    QUEUED_USERS.dec()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        RATING_RANKS.player_added(instance.rating)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    RATING_RANKS.player_removed(instance.rating)
+
+
+def collect_queue_metrics():
+    if QUEUED_USERS.value is None:
+        QUEUED_USERS.set(QueueEntry.objects.count())
+    return [MetricFamily('pong_queued_users', 'gauge', 'Users waiting in the matchmaking queue.')
+            .add(QUEUED_USERS.value)]
@@ -1,3 +1,290 @@
-from django.test import TestCase
+import time
+import random
+import threading
+from io import StringIO
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.contrib.auth import get_user_model
+from unittest import skipUnless
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from pong_app.consumers import update_game_session_status
+from .models import QueueEntry, GameSession
+from .matchmaking import Matchmaker, QueuedPlayer, MATCH_RATE_WINDOW, create_game_sessions
+from .ratings import DEFAULT_RATING, PROVISIONAL_K_FACTOR, apply_game_result
+from .leaderboard import RATING_RANKS, MAX_RANKED_RATING
+from .history import get_match_history_page, history_branch
 
-# Create your tests here.
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class CreateGameSessionsConcurrencyTest(TransactionTestCase):
+    """
+    Several workers creating the sessions of overlapping pairs of the same queue at once must never put a user
+    in two sessions, and must leave every user they did not match in the queue.
+    """
+
+    QUEUED_USERS = 400
+    WORKERS = 8
+    BATCH_SIZE = 20
+
+    def setUp(self):
+        User = get_user_model()
+        users = User.objects.bulk_create([User(username=f'queued{i}', alias=f'queued{i}')
+                                          for i in range(self.QUEUED_USERS)])
+        QueueEntry.objects.bulk_create([QueueEntry(user=user) for user in users])
+        self.user_ids = [user.id for user in users]
+
+    def worker_pairs(self, worker):
+        """The pairs a worker found in memory: every queued user, paired differently by each worker."""
+        user_ids = list(self.user_ids)
+        random.Random(worker).shuffle(user_ids)
+        return list(zip(user_ids[0::2], user_ids[1::2]))
+
+    def run_worker(self, pairs, results, errors):
+        try:
+            for start in range(0, len(pairs), self.BATCH_SIZE):
+                results.append(async_to_sync(create_game_sessions)(pairs[start:start + self.BATCH_SIZE]))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_workers_never_double_match(self):
+        results, errors = [], []
+        proposed = [self.worker_pairs(worker) for worker in range(self.WORKERS)]
+        workers = [threading.Thread(target=self.run_worker, args=(pairs, results, errors)) for pairs in proposed]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(errors, [])
+        sessions = list(GameSession.objects.select_related('player1', 'player2'))
+        self.assertTrue(sessions)
+        proposed = {frozenset(pair) for pairs in proposed for pair in pairs}
+        for session in sessions:
+            self.assertIn(frozenset((session.player1_id, session.player2_id)), proposed)
+            self.assertEqual(session.player1.session_id, session.id)
+            self.assertEqual(session.player2.session_id, session.id)
+        players = [player for session in sessions for player in (session.player1_id, session.player2_id)]
+        self.assertEqual(len(players), len(set(players)))
+        # Every user is either in exactly one session or still queued, including those reported left out.
+        queued = set(QueueEntry.objects.values_list('user_id', flat=True))
+        self.assertFalse(queued & set(players))
+        self.assertEqual(len(queued) + len(players), self.QUEUED_USERS)
+        for _, left_out in results:
+            self.assertTrue(queued.issuperset(left_out))
+        print(f"\ncreate_game_sessions: {len(sessions)} sessions from {self.WORKERS} workers' overlapping pairs "
+              f"in {elapsed:.3f}s ({len(sessions) / elapsed:.0f} matches/s)")
+
+
+class MatchmakerPassTest(SimpleTestCase):
+    """A pairing pass over a large queue walks the buckets, kept sorted as players join and leave, in bounded time."""
+
+    PLAYERS = 10000
+    PASSES = 20
+    MAX_PASS_SECONDS = 0.1
+
+    def setUp(self):
+        self.matchmaker = Matchmaker()
+        now = time.time()
+        for user_id in random.sample(range(1, self.PLAYERS * 10), self.PLAYERS):
+            self.matchmaker.enqueue(user_id, random.gauss(1000, 300), joined_at=now - random.uniform(0, 120))
+
+    def test_queue_stays_sorted(self):
+        for user_id in random.sample(list(self.matchmaker.players), self.PLAYERS // 10):
+            self.matchmaker.remove(user_id)
+        players = self.matchmaker.sorted_players()
+        self.assertEqual(len(players), self.PLAYERS - self.PLAYERS // 10)
+        self.assertEqual({player.user_id for player in players}, set(self.matchmaker.players))
+        self.assertEqual([player.rating for player in players], sorted(player.rating for player in players))
+
+    def test_pass_time(self):
+        durations = []
+        for _ in range(self.PASSES):
+            start = time.perf_counter()
+            pairs = self.matchmaker.find_pairs(time.time())
+            durations.append(time.perf_counter() - start)
+        paired = [player.user_id for pair in pairs for player in pair]
+        self.assertGreater(len(pairs), self.PLAYERS // 4)
+        self.assertEqual(len(paired), len(set(paired)))
+        durations.sort()
+        print(f"\nPairing pass over {self.PLAYERS} queued players: {durations[len(durations) // 2] * 1000:.1f}ms "
+              f"median, {durations[-1] * 1000:.1f}ms at most")
+        self.assertLess(durations[len(durations) // 2], self.MAX_PASS_SECONDS)
+
+
+class MatchRateTest(SimpleTestCase):
+    """The match rate is read by the metrics view from another thread while the matchmaker records matches."""
+
+    def test_concurrent_reads_and_records(self):
+        matchmaker = Matchmaker()
+        errors = []
+        done = threading.Event()
+
+        def scrape():
+            while not done.is_set():
+                try:
+                    matchmaker.match_rate(time.time() + 30)
+                except Exception as e:
+                    errors.append(e)
+
+        scraper = threading.Thread(target=scrape)
+        scraper.start()
+        start = time.time()
+        player = QueuedPlayer(1, DEFAULT_RATING, start)
+        for offset in range(20000):
+            matchmaker.record_matches([(player, player)], start + offset * 0.01)
+        done.set()
+        scraper.join()
+        self.assertEqual(errors, [])
+        # A pair recorded every 10ms is 200 players matched per second
+        self.assertAlmostEqual(matchmaker.match_rate(start + 200), 200, delta=1)
+        self.assertLessEqual(len(matchmaker.recent_matches), MATCH_RATE_WINDOW * 100 + 1)
+
+
+class RatingTest(TransactionTestCase):
+    """
+    A finished game moves the ratings of its players once, however many of them end it, and rebuilding the ratings
+    from the history replays the same updates. Games are ended through the consumers' database hop, which closes
+    the connection it ran on, so the test runs outside a test transaction.
+    """
+
+    def setUp(self):
+        User = get_user_model()
+        self.players = User.objects.bulk_create([User(username=f'rated{i}', alias=f'rated{i}') for i in range(3)])
+
+    def finish(self, player1, player2, winner, mode='online'):
+        """Finish a game the way both its players' consumers do, each from its own copy of the session."""
+        session = GameSession.objects.create(player1=player1, player2=player2, winner=winner, mode=mode,
+                                             status='in progress')
+        for copy in GameSession.objects.get(id=session.id), GameSession.objects.get(id=session.id):
+            async_to_sync(update_game_session_status)(copy, 'finished')
+        return session
+
+    def ratings(self):
+        return dict(get_user_model().objects.filter(id__in=[player.id for player in self.players])
+                    .values_list('id', 'rating'))
+
+    def test_winner_takes_the_expected_points(self):
+        first, second, _ = self.players
+        with transaction.atomic():
+            apply_game_result(GameSession.objects.create(player1=first, player2=second, winner=first,
+                                                         status='finished'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        # Evenly rated provisional players: half the provisional factor changes hands
+        self.assertEqual(first.rating, DEFAULT_RATING + PROVISIONAL_K_FACTOR / 2)
+        self.assertEqual(second.rating, DEFAULT_RATING - PROVISIONAL_K_FACTOR / 2)
+        self.assertEqual((first.rated_games, second.rated_games), (1, 1))
+
+    def test_unrated_games_leave_ratings_alone(self):
+        first, second, _ = self.players
+        self.finish(first, second, first, mode='local')
+        self.finish(first, first, first)
+        self.assertEqual(set(self.ratings().values()), {DEFAULT_RATING})
+
+    def test_game_finished_twice_is_rated_once(self):
+        first, second, _ = self.players
+        self.finish(first, second, first)
+        first.refresh_from_db()
+        self.assertEqual(first.rating, DEFAULT_RATING + PROVISIONAL_K_FACTOR / 2)
+        self.assertEqual(first.rated_games, 1)
+
+    def test_rebuild_replays_the_incremental_updates(self):
+        for _ in range(20):
+            player1, player2 = random.sample(self.players, 2)
+            self.finish(player1, player2, random.choice([player1, player2]))
+        incremental = self.ratings()
+
+        get_user_model().objects.update(rating=0, rated_games=0)
+        call_command('rebuild_ratings', '--dry-run', stdout=StringIO())
+        self.assertEqual(set(self.ratings().values()), {0})
+        call_command('rebuild_ratings', stdout=StringIO())
+        for user_id, rating in self.ratings().items():
+            self.assertAlmostEqual(rating, incremental[user_id])
+        self.assertEqual(sum(get_user_model().objects.values_list('rated_games', flat=True)), 40)
+
+
+class RatingRanksTest(TestCase):
+    """The ranks of the in-memory rank tree match a count in the database, as seeded and as ratings change."""
+
+    PLAYERS = 200
+    GAMES = 100
+
+    def setUp(self):
+        User = get_user_model()
+        User.objects.bulk_create([User(username=f'ranked{i}', alias=f'ranked{i}', rating=random.uniform(-50, 4100))
+                                  for i in range(self.PLAYERS)])
+        RATING_RANKS.seeded_at = None
+        RATING_RANKS.ensure_seeded()
+        self.addCleanup(setattr, RATING_RANKS, 'seeded_at', None)
+
+    def assert_ranks_match_database(self):
+        User = get_user_model()
+        for rating in User.objects.values_list('rating', flat=True):
+            # Ratings are ranked by their integer part, clamped to the ranked range
+            integer_part = min(max(int(rating), 0), MAX_RANKED_RATING)
+            above = User.objects.filter(rating__gte=integer_part + 1).count() if integer_part < MAX_RANKED_RATING \
+                else 0
+            self.assertEqual(RATING_RANKS.rank(rating), above + 1, f'rank of rating {rating}')
+
+    def test_seeded_ranks_match_database(self):
+        self.assert_ranks_match_database()
+
+    def test_ranks_follow_rating_changes(self):
+        User = get_user_model()
+        players = list(User.objects.all()) + [User.objects.create(username=f'newcomer{i}', alias=f'newcomer{i}')
+                                              for i in range(5)]
+        for _ in range(self.GAMES):
+            player1, player2 = random.sample(players, 2)
+            session = GameSession.objects.create(player1=player1, player2=player2, status='finished',
+                                                 winner=random.choice([player1, player2]))
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                apply_game_result(session)
+        User.objects.get(username='newcomer0').delete()
+        self.assertIsNotNone(RATING_RANKS.seeded_at)
+        self.assert_ranks_match_database()
+
+
+class MatchHistoryTest(TestCase):
+    """Match history pages are read through the history indexes, whatever the page."""
+
+    GAMES = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user, cls.other = User.objects.bulk_create([User(username='historian', alias='historian'),
+                                                        User(username='opponent', alias='opponent')])
+        GameSession.objects.bulk_create([
+            GameSession(player1=cls.user if i % 2 else cls.other, player2=cls.other if i % 2 else cls.user,
+                        winner=cls.user, status='finished', player1_score=3, player2_score=i % 3)
+            for i in range(cls.GAMES)
+        ])
+
+    def test_pages_cover_history_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            games, cursor = get_match_history_page(self.user.id, cursor, limit=7)
+            seen.extend(games)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), self.GAMES)
+        self.assertEqual(len({game.id for game in seen}), self.GAMES)
+        keys = [(game.created_at, game.id) for game in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are checked on PostgreSQL')
+    def test_history_plan_uses_indexes_without_sorting(self):
+        games, _ = get_match_history_page(self.user.id, limit=10)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for role in ('player1', 'player2'):
+            for position in (None, (games[-1].created_at, games[-1].id)):
+                plan = history_branch(self.user.id, role, position, 20).explain()
+                self.assertNotIn('Seq Scan', plan)
+                self.assertNotIn('Sort', plan)
+                self.assertIn(f'gamesession_{role}_history', plan)
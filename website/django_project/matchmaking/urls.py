@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import join_queue, local_game
+from .views import join_queue, local_game, match_history
 
 urlpatterns = [
     path('', join_queue, name='join_queue'),
     path('local_game/', local_game, name='local_game'),
+    path('history/<int:user_id>/', match_history, name='match_history'),
 ]
\ No newline at end of file
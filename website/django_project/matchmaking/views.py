@@ -2,7 +2,9 @@ from django.http import JsonResponse
 from .models import QueueEntry, GameSession
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
-from pong_app.consumers import create_game_instance
+from pong_app.consumers import create_game_instance, GOVERNOR
+from .history import (get_match_history_page, serialize_game, InvalidCursor, HISTORY_PAGE_SIZE,
+                      MAX_HISTORY_PAGE_SIZE)
 
 
 @require_http_methods(["POST"])
@@ -35,6 +37,9 @@ def local_game(request):
         return JsonResponse({'status': 'error', 'message': 'User already in queue'}, status=400)
     if request.user.tournament_id is not None:
         return JsonResponse({'status': 'error', 'message': 'User already in a tournament'}, status=400)
+    if not GOVERNOR.accepting_games():
+        return JsonResponse({'status': 'error', 'message': 'Server is at capacity, please try again in a moment'},
+                            status=503)
 
     session = GameSession.objects.create(player1=request.user, player2=request.user, mode='local')
     create_game_instance(session.id)
@@ -43,3 +48,14 @@ def local_game(request):
     return JsonResponse({'status': 'success', 'message': 'Successfully created a local game', 'session_id': session.id})
 
 
+@require_http_methods(["GET"])
+@login_required
+def match_history(request, user_id):
+    """Return one page of a user's finished games, newest first. Pass the returned cursor to get the next page."""
+    try:
+        limit = min(max(int(request.GET.get('limit', HISTORY_PAGE_SIZE)), 1), MAX_HISTORY_PAGE_SIZE)
+        games, next_cursor = get_match_history_page(user_id, request.GET.get('cursor'), limit)
+    except (InvalidCursor, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid cursor or limit'}, status=400)
+    return JsonResponse({'status': 'success', 'matches': [serialize_game(game, user_id) for game in games],
+                         'next_cursor': next_cursor})
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PongGameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pong_app'
+
+    def ready(self):
+        from main.metrics import register_collector
+        from .consumers import collect_game_metrics
+        register_collector(collect_game_metrics)
@@ -1,17 +1,51 @@
 import json
+import time
 import asyncio
+import secrets
+from collections import deque, Counter
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
 from .pong import Game
+from .governor import TickGovernor
+from .instrumentation import GameTickStats, WORKER_TICK_STATS
 from matchmaking.models import GameSession
+from matchmaking.ratings import apply_game_result
+from users.stats import record_game_result
 from users.consumers import remove_channel_name_from_session, add_channel_name_to_session, update_user_session_id
 from asgiref.sync import async_to_sync
 from main.views import main_view
+from main.metrics import MetricFamily, WEBSOCKET_CONNECTIONS
+from main.monitoring import LOOP_MONITOR
+from main.latency import RttProbe, USER_RTT
 
 
 FPS = 60
+# Number of recent frames kept per game, so a reattaching client can be served the latest one immediately.
+FRAME_BUFFER_SIZE = FPS * 2
 GLOBAL_GAMES_STORE = {}
+GOVERNOR = TickGovernor(tick_budget=1 / FPS)
+
+
+def collect_game_metrics():
+    """Metrics of the games hosted by this worker, read from memory."""
+    games = MetricFamily('pong_games', 'gauge', 'Games in GLOBAL_GAMES_STORE per status.')
+    for status, count in Counter(instance.game.status for instance in list(GLOBAL_GAMES_STORE.values())).items():
+        games.add(count, status=status)
+    ticks = MetricFamily('pong_tick_phase_seconds', 'summary', 'Duration of each phase of the game ticks.')
+    for phase, histogram in WORKER_TICK_STATS.histograms.items():
+        ticks.add_histogram(histogram, phase=phase)
+    return [
+        games,
+        ticks,
+        MetricFamily('pong_frames_sent_total', 'counter', 'Game state frames broadcast.')
+        .add(WORKER_TICK_STATS.frames_sent),
+        MetricFamily('pong_tick_load', 'gauge', 'Share of the tick budget used by the games of this worker.')
+        .add(GOVERNOR.load),
+    ]
 
 
 def delete_game_for_session(session_id):
@@ -38,15 +72,10 @@ def create_game_instance(session_id):
     async_to_sync(GLOBAL_GAMES_STORE[session_id].start_game_tasks)()
 
 
-async def create_game_instance_async(session_id):
-    game_session = await get_game_session_async(session_id)
-    GLOBAL_GAMES_STORE[session_id] = GameInstance(game_session=game_session)
-    asyncio.create_task(GLOBAL_GAMES_STORE[session_id].start_game_tasks())
-
-
-@database_sync_to_async
-def get_game_session_async(session_id):
-    return GameSession.objects.select_related('player1', 'player2').get(id=session_id)
+def start_game_instance(game_session):
+    """Create and start the Game instance of a session whose players are already loaded, from the event loop."""
+    GLOBAL_GAMES_STORE[game_session.id] = GameInstance(game_session=game_session)
+    asyncio.create_task(GLOBAL_GAMES_STORE[game_session.id].start_game_tasks())
 
 
 @database_sync_to_async
@@ -59,16 +88,32 @@ def update_game_session_winner(session, winner_alias):
 
 @database_sync_to_async
 def update_game_session_status(session, status):
+    """
+    Update the status of a session. Both players end the game, so the session row is locked
+    and only the update that actually marks it finished applies the result to the players' ratings,
+    and the players' statistics, in the same transaction. The finish time is taken once the players' rows are
+    locked, so the games of a player are ordered by it as they were accounted, which rebuilds replay.
+    """
     if session.status != status:
+        with transaction.atomic():
+            locked_session = GameSession.objects.select_for_update().get(id=session.id)
+            if locked_session.status != status:
+                locked_session.status = status
+                update_fields = ['status']
+                if status == 'finished':
+                    apply_game_result(locked_session)
+                    record_game_result(locked_session)
+                    locked_session.finished_at = timezone.now()
+                    update_fields.append('finished_at')
+                locked_session.save(update_fields=update_fields)
         session.status = status
-        session.save()
 
 
 @database_sync_to_async
 def update_game_session_score(session, player1_score, player2_score):
     session.player1_score = player1_score
     session.player2_score = player2_score
-    session.save()
+    session.save(update_fields=['player1_score', 'player2_score'])
 
 class GameInstance:
     """Class to run the game loop and broadcast game state updates."""
@@ -77,6 +122,12 @@ class GameInstance:
         self.game = Game(winning_score=3)
         self.game.session = game_session
         self.game_group_name = f'game_{self.game.session.id}'
+        self.frame_number = 0
+        self.frames = deque(maxlen=FRAME_BUFFER_SIZE)
+        self.resume_tokens = {}
+        # The channel of the connection holding each player slot, by player number
+        self.player_channels = {}
+        self.tick_stats = GameTickStats(WORKER_TICK_STATS)
         self.assign_players()
 
     def assign_players(self):
@@ -90,32 +141,88 @@ class GameInstance:
             return f'Player {player_number}'
         return self.game.session.player1.alias if player_number == 1 else self.game.session.player2.alias
 
-    async def start_game_tasks(self):
-        """Start the game loop and game state broadcast tasks."""
-        tasks = [self.run_game_loop('Ball'), self.run_game_loop('Paddles'), self.broadcast_game_state()]
-        for task in tasks:
-            asyncio.create_task(task)
+    def record_frame(self):
+        """Snapshot the current game state into the ring buffer of recent frames and return it."""
+        self.frame_number += 1
+        frame = {'frame': self.frame_number, **self.game.get_state(), 'rtt': self.players_rtt()}
+        self.frames.append(frame)
+        return frame
+
+    def players_rtt(self):
+        """Smoothed round-trip time of both players in milliseconds, None until measured."""
+        return {'player1': USER_RTT.get_ms(self.game.session.player1.id),
+                'player2': USER_RTT.get_ms(self.game.session.player2.id)}
+
+    def latest_frame(self):
+        """Return the most recent frame, or the current state if nothing has been broadcast yet."""
+        if self.frames:
+            return self.frames[-1]
+        return {'frame': self.frame_number, **self.game.get_state(), 'rtt': self.players_rtt()}
+
+    def issue_resume_token(self, user):
+        """Issue a new resume token for the user, replacing any previous one."""
+        self.resume_tokens = {token: user_id for token, user_id in self.resume_tokens.items() if user_id != user.id}
+        token = secrets.token_urlsafe(16)
+        self.resume_tokens[token] = user.id
+        return token
+
+    def valid_resume_token(self, token, user):
+        """Check that the resume token was issued to this user for this game."""
+        return token is not None and self.resume_tokens.get(token) == user.id
+
+    def attach_channel(self, player_number, channel_name):
+        """Give a player slot to a connection, replacing the one that held it, if any."""
+        self.player_channels[player_number] = channel_name
+
+    def detach_channel(self, channel_name):
+        """
+        Release the player slots a connection holds. A connection replaced by a resumed one holds none anymore,
+        so its disconnect, however late it comes, leaves the slots of the resumed connection alone.
+        Returns the numbers of the player slots released.
+        """
+        player_numbers = [number for number, channel in self.player_channels.items() if channel == channel_name]
+        for number in player_numbers:
+            del self.player_channels[number]
+        return player_numbers
 
-    async def run_game_loop(self, target):
-        """Run the main game loop, updating the game state."""
-        while True:
-            if target == 'Ball':
-                await self.game.ball_loop()
-            elif target == 'Paddles':
-                await self.game.paddles_loop()
-            await asyncio.sleep(1 / FPS)
-            if self.game.status == 'finished':
-                break
+    async def start_game_tasks(self):
+        """Start the game loop task."""
+        asyncio.create_task(self.run_game_loop())
 
-    async def broadcast_game_state(self):
-        """Broadcast the current game state to all players."""
+    async def run_game_loop(self):
+        """
+        Run the game loop: process the queued moves, move the ball and broadcast the game state once per tick.
+        Ticks are scheduled against fixed deadlines, and the time each tick takes is reported to the governor,
+        which may ask us to broadcast less often when the worker runs out of tick budget.
+        """
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        tick_number = 0
         while True:
-            await broadcast_message(self.game_group_name,
-                                    {'type': 'game_state_update', 'message': self.game.get_state()})
-            await asyncio.sleep(1 / FPS)
-            if self.game.status == 'finished':
+            self.tick_stats.record('lateness', loop.time() - next_tick)
+            tick_start = time.perf_counter()
+            await self.game.paddles_loop()
+            input_done = time.perf_counter()
+            await self.game.ball_loop()
+            physics_done = time.perf_counter()
+            self.tick_stats.record('input', input_done - tick_start)
+            self.tick_stats.record('physics', physics_done - input_done)
+            tick_number += 1
+            finished = self.game.status == 'finished'
+            if finished or tick_number % GOVERNOR.broadcast_stride == 0:
+                await broadcast_message(self.game_group_name,
+                                        {'type': 'game_state_update', 'message': self.record_frame()})
+                self.tick_stats.record('broadcast', time.perf_counter() - physics_done)
+                self.tick_stats.record_frame_sent()
+            GOVERNOR.record_tick(time.perf_counter() - tick_start)
+            if finished:
                 await broadcast_message(self.game_group_name, {'type': 'finished_message'})
+                print(f"Game {self.game.session.id} tick stats: {self.tick_stats.summary()}")
                 break
+            next_tick += 1 / FPS
+            # Skip the ticks we are late for rather than running them back to back.
+            next_tick = max(next_tick, loop.time())
+            await asyncio.sleep(next_tick - loop.time())
 
 
 class GameConsumer(AsyncWebsocketConsumer):
@@ -124,22 +231,58 @@ class GameConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(args, kwargs)
         self.game = None
+        self.game_instance = None
         self.game_group_name = None
         self.user = None
+        self.rtt_probe = None
 
     async def connect(self):
         """Handle new WebSocket connection."""
         self.user = self.scope['user']
+        LOOP_MONITOR.ensure_started()
+        if await self.resume_game():
+            return
         self.game = await self.get_game_in_store()
         if self.game is None:
             print(f"Game session not found.")
             await self.close()
             return
-        await self.verify_user_in_game_session()
+        if not await self.verify_user_in_game_session():
+            return
         await self.channel_setup()
         await self.update_game_status()
+        await self.send_game_init()
+        self.start_rtt_probe()
         print(f"PLAYERS: {self.game.players}")
 
+    def start_rtt_probe(self):
+        self.rtt_probe = RttProbe(self, self.user.id)
+        self.rtt_probe.start()
+
+    async def resume_game(self):
+        """
+        Reattach a client that presents a valid resume token in one handshake.
+        The game lives in memory, so the token is checked without touching the database, and the latest frame
+        is sent before the session bookkeeping is written.
+        """
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('resume', [None])[0]
+        game_instance = GLOBAL_GAMES_STORE.get(self.scope['url_route']['kwargs']['game_session_id'])
+        if game_instance is None or not game_instance.valid_resume_token(token, self.user):
+            return False
+        self.game_instance = game_instance
+        self.game = game_instance.game
+        self.assign_player_slot()
+        await self.accept()
+        WEBSOCKET_CONNECTIONS.opened('game', self.channel_name)
+        self.game_group_name = game_instance.game_group_name
+        await self.channel_layer.group_add(self.game_group_name, self.channel_name)
+        await self.update_game_status()
+        await self.send_game_init()
+        self.start_rtt_probe()
+        await add_channel_name_to_session(self.scope, self.channel_name)
+        print(f"{self.user.alias} resumed game {self.game.session.id} at frame {game_instance.frame_number}.")
+        return True
+
     async def get_game_in_store(self):
         """Retrieve or create a Game instance for the session ID."""
         game_session_id = self.scope['url_route']['kwargs']['game_session_id']
@@ -147,18 +290,28 @@ class GameConsumer(AsyncWebsocketConsumer):
         if game_session_id not in GLOBAL_GAMES_STORE:
             await update_user_session_id(self.user, None)
             return None
-        return GLOBAL_GAMES_STORE[game_session_id].game
+        self.game_instance = GLOBAL_GAMES_STORE[game_session_id]
+        return self.game_instance.game
 
     async def verify_user_in_game_session(self):
         """Verify if the connected user is part of the game session."""
         if self.user not in [self.game.session.player1, self.game.session.player2]:
             print(f"User {self.user.alias} is not part of the game session.")
-            return await self.close()
+            await self.close()
+            return False
+        self.assign_player_slot()
+        await self.accept()
+        WEBSOCKET_CONNECTIONS.opened('game', self.channel_name)
+        return True
+
+    def assign_player_slot(self):
+        """Put the connected user in their player slot(s), held by this connection; both slots in local games."""
         if self.user == self.game.session.player1:
             self.game.players[0] = self.user
+            self.game_instance.attach_channel(1, self.channel_name)
         if self.user == self.game.session.player2:
             self.game.players[1] = self.user
-        await self.accept()
+            self.game_instance.attach_channel(2, self.channel_name)
 
     async def channel_setup(self):
         """Set up the WebSocket connection."""
@@ -187,21 +340,31 @@ class GameConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
+        WEBSOCKET_CONNECTIONS.closed('game', self.channel_name)
+        if self.rtt_probe:
+            self.rtt_probe.stop()
         if self.game:
             await self.handle_disconnect(self.user)
             await remove_channel_name_from_session(self.scope, self.channel_name)
         await self.close()
 
     async def handle_disconnect(self, user):
-        """Handle a player's disconnection."""
+        """
+        Handle a player's disconnection. Only the connection holding a player slot frees it: the disconnect of
+        a connection replaced by a resumed one is ignored, whether it comes before or after the resume.
+        """
+        player_numbers = self.game_instance.detach_channel(self.channel_name)
+        if not player_numbers:
+            print(f"{user.alias}: ignoring the disconnect of a replaced connection to game {self.game.session.id}.")
+            return
         if self.local_game():
             await update_user_session_id(user, None)
             delete_game_for_session(self.game.session.id)
             await update_game_session_status(self.game.session, 'finished')
         else:
-            player_number = 1 if user == self.game.players[0] else 2
-            self.game.players[player_number - 1] = None
-            self.game.pause_request(player_number)
+            for player_number in player_numbers:
+                self.game.players[player_number - 1] = None
+                self.game.pause_request(player_number)
 
     async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages from WebSocket."""
@@ -213,6 +376,9 @@ class GameConsumer(AsyncWebsocketConsumer):
                 await self.send_game_init()
             elif data.get('type') == "move_command":
                 self.handle_player_movement(data)
+            elif data.get('type') == "pong":
+                if self.rtt_probe:
+                    self.rtt_probe.pong(data.get('ping_id'))
             elif data.get('type') == "forfeit_message":
                 await self.handle_forfeit()
             elif data.get('type') == "quit_message":
@@ -228,8 +394,12 @@ class GameConsumer(AsyncWebsocketConsumer):
             print(f"Invalid JSON received: {text_data}")
 
     async def send_game_init(self):
-        """Send initial game data to the WebSocket client."""
-        init_message = self.game.get_initial_data(self.local_game())
+        """
+        Send initial game data to the WebSocket client, along with the latest frame of the game
+        and a resume token the client can use to reattach after a dropped connection.
+        """
+        init_message = {**self.game.get_initial_data(self.local_game()), **self.game_instance.latest_frame()}
+        init_message['resume_token'] = self.game_instance.issue_resume_token(self.user)
         await self.send_json({'type': 'game_init', 'data': init_message})
 
     async def send_json(self, message):
@@ -252,10 +422,11 @@ class GameConsumer(AsyncWebsocketConsumer):
             await update_user_session_id(user, None)
             print(f"{user.alias}'s session ID updated to {user.session_id}.")
             await update_game_session_winner(self.game.session, self.game.winner)
-            await update_game_session_status(self.game.session, 'finished')
             print(f"Updating GameSession Score: \
             {self.game.paddle2.player_name} {self.game.paddle1.score} - {self.game.paddle2.score} {self.game.paddle2.player_name}")
+            # The score is saved before the status, so it is there when the finished game is accounted.
             await update_game_session_score(self.game.session, self.game.paddle1.score, self.game.paddle2.score)
+            await update_game_session_status(self.game.session, 'finished')
 
     async def game_state_update(self, event):
         """Send game state updates to the WebSocket client."""
@@ -0,0 +1,87 @@
+import time
+
+
+# Share of the tick budget the games of this worker may use before we start degrading.
+DEGRADED_LOAD = 0.7
+# Share of the tick budget above which new games are refused.
+OVERLOADED_LOAD = 0.9
+# How far below a threshold the load must drop before we step back to a lighter state.
+RECOVERY_MARGIN = 0.1
+# Broadcast every Nth tick in each state, physics keeps running every tick.
+BROADCAST_STRIDES = {'normal': 1, 'degraded': 2, 'overloaded': 3}
+
+
+class GameCapacityError(Exception):
+    """Raised when the worker is too loaded to host a new game."""
+
+
+class TickGovernor:
+    """
+    Measures the wall time every GameInstance of this worker spends in its ticks, and degrades service when
+    the total no longer fits in the tick budget: first by lowering the broadcast rate, then by refusing new games.
+    All games share one event loop, so the busy share of wall time is the share of each tick they use.
+    """
+
+    def __init__(self, tick_budget, window=1.0):
+        self.tick_budget = tick_budget
+        self.window = window
+        self.window_start = time.perf_counter()
+        self.busy_time = 0.0
+        self.load = 0.0
+        self.tick_time = 0.0
+        self.state = 'normal'
+
+    @property
+    def broadcast_stride(self):
+        return BROADCAST_STRIDES[self.state]
+
+    def record_tick(self, elapsed):
+        """Account for the time one game spent in one tick."""
+        self.busy_time += elapsed
+        self.refresh()
+
+    def refresh(self):
+        """Close the measurement window once it has elapsed, and re-evaluate the state."""
+        now = time.perf_counter()
+        span = now - self.window_start
+        if span >= self.window:
+            self.load = self.busy_time / span
+            self.tick_time = self.load * self.tick_budget
+            self.busy_time = 0.0
+            self.window_start = now
+            self.update_state()
+
+    def update_state(self):
+        """Move between normal, degraded and overloaded, with some hysteresis to avoid flapping."""
+        previous_state = self.state
+        if self.load >= OVERLOADED_LOAD:
+            self.state = 'overloaded'
+        elif self.load >= DEGRADED_LOAD:
+            recovering = self.state == 'overloaded' and self.load >= OVERLOADED_LOAD - RECOVERY_MARGIN
+            self.state = 'overloaded' if recovering else 'degraded'
+        else:
+            recovering = self.state != 'normal' and self.load >= DEGRADED_LOAD - RECOVERY_MARGIN
+            self.state = 'degraded' if recovering else 'normal'
+        if self.state != previous_state:
+            print(f"Tick governor: {previous_state} -> {self.state} "
+                  f"(load {self.load:.0%} of the {self.tick_budget * 1000:.1f} ms tick budget)")
+
+    def accepting_games(self):
+        self.refresh()
+        return self.state != 'overloaded'
+
+    def check_admission(self):
+        """Raise a GameCapacityError if the worker is too loaded to take a new game."""
+        if not self.accepting_games():
+            raise GameCapacityError('Server is at capacity, please try again in a moment')
+
+    def to_dict(self):
+        """Convert the governor's state to a dictionary for serialization."""
+        return {
+            'state': self.state,
+            'accepting_games': self.accepting_games(),
+            'load': round(self.load, 3),
+            'tick_time_ms': round(self.tick_time * 1000, 3),
+            'tick_budget_ms': round(self.tick_budget * 1000, 3),
+            'broadcast_stride': self.broadcast_stride,
+        }
@@ -0,0 +1,47 @@
+from main.metrics import Histogram
+
+
+# Longest duration we keep exact track of in tick histograms, anything above is clamped.
+MAX_TICK_DURATION = 10.0
+TICK_PHASES = ('input', 'physics', 'broadcast', 'lateness')
+
+
+class TickStats:
+    """
+    Latency histograms for the phases of a game tick: processing the queued moves (input), moving the ball
+    (physics), broadcasting the state (broadcast), and how late the tick started against its deadline (lateness).
+    Also counts the frames sent.
+    """
+
+    def __init__(self):
+        self.histograms = {phase: Histogram(max_value=MAX_TICK_DURATION) for phase in TICK_PHASES}
+        self.frames_sent = 0
+
+    def record(self, phase, seconds):
+        self.histograms[phase].record(seconds)
+
+    def summary(self):
+        """p50/p99/max of every phase, in milliseconds."""
+        return {
+            'frames_sent': self.frames_sent,
+            **{phase: histogram.summary() for phase, histogram in self.histograms.items()},
+        }
+
+
+class GameTickStats(TickStats):
+    """Tick statistics of a single game, also accounted in the statistics of the whole worker."""
+
+    def __init__(self, worker_stats):
+        super().__init__()
+        self.worker_stats = worker_stats
+
+    def record(self, phase, seconds):
+        super().record(phase, seconds)
+        self.worker_stats.record(phase, seconds)
+
+    def record_frame_sent(self):
+        self.frames_sent += 1
+        self.worker_stats.frames_sent += 1
+
+
+WORKER_TICK_STATS = TickStats()
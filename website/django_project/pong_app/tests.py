@@ -1,3 +1,85 @@
-from django.test import TestCase
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+from matchmaking.models import GameSession
+from .consumers import GameConsumer, GameInstance, GLOBAL_GAMES_STORE
 
-# Create your tests here.
+
+@mock.patch('pong_app.consumers.add_channel_name_to_session', mock.AsyncMock())
+@mock.patch('pong_app.consumers.remove_channel_name_from_session', mock.AsyncMock())
+class GameResumeTest(SimpleTestCase):
+    """
+    A client reattaches to its game with the resume token of its last connection, and the connection it replaced
+    can no longer free its player slot, even when its disconnect comes after the resume.
+    """
+
+    def setUp(self):
+        User = get_user_model()
+        self.player1, self.player2 = User(id=1, alias='left'), User(id=2, alias='right')
+        session = GameSession(id=42, player1=self.player1, player2=self.player2, mode='ranked')
+        self.instance = GameInstance(session)
+        self.game = self.instance.game
+        GLOBAL_GAMES_STORE[session.id] = self.instance
+        self.addCleanup(GLOBAL_GAMES_STORE.pop, session.id, None)
+        self.addCleanup(async_to_sync(get_channel_layer().flush))
+
+    def connect(self, user, channel_name, token=None):
+        """A consumer of the game for a user, connected through the resume token if given, or as a new player."""
+        consumer = GameConsumer()
+        consumer.scope = {'user': user, 'url_route': {'kwargs': {'game_session_id': self.game.session.id}},
+                          'query_string': f'resume={token}'.encode() if token else b'', 'session': {}}
+        consumer.channel_name = channel_name
+        consumer.channel_layer = get_channel_layer()
+        consumer.accept, consumer.close = mock.AsyncMock(), mock.AsyncMock()
+        consumer.send_json = mock.AsyncMock()
+        consumer.start_rtt_probe = mock.Mock()
+        async_to_sync(consumer.connect)()
+        return consumer
+
+    def resume_token(self, consumer):
+        return consumer.send_json.call_args.args[0]['data']['resume_token']
+
+    def test_valid_token_reattaches_the_player(self):
+        first = self.connect(self.player1, 'first')
+        self.connect(self.player2, 'other')
+        async_to_sync(first.disconnect)(1006)
+        self.assertIsNone(self.game.players[0])
+
+        resumed = self.connect(self.player1, 'resumed', self.resume_token(first))
+        resumed.accept.assert_awaited_once()
+        self.assertEqual(self.game.players[0], self.player1)
+        self.assertEqual(self.instance.player_channels, {1: 'resumed', 2: 'other'})
+        self.assertFalse(self.game.paddle1.pause_request)
+        # The token is used up: the resumed connection got a new one
+        self.assertFalse(self.instance.valid_resume_token(self.resume_token(first), self.player1))
+        self.assertTrue(self.instance.valid_resume_token(self.resume_token(resumed), self.player1))
+
+    def test_expired_token_is_refused(self):
+        first = self.connect(self.player1, 'first')
+        token = self.resume_token(first)
+        self.instance.issue_resume_token(self.player1)
+        consumer = GameConsumer()
+        consumer.user = self.player1
+        consumer.scope = {'user': self.player1, 'query_string': f'resume={token}'.encode(),
+                          'url_route': {'kwargs': {'game_session_id': self.game.session.id}}}
+        self.assertFalse(async_to_sync(consumer.resume_game)())
+        self.assertIsNone(consumer.game)
+        # Nor does another player's token resume their slot
+        self.assertFalse(self.instance.valid_resume_token(self.instance.issue_resume_token(self.player2),
+                                                          self.player1))
+
+    def test_stale_disconnect_after_resume_is_ignored(self):
+        stale = self.connect(self.player1, 'stale')
+        self.connect(self.player2, 'other')
+        resumed = self.connect(self.player1, 'resumed', self.resume_token(stale))
+
+        async_to_sync(stale.disconnect)(1006)
+        self.assertEqual(self.game.players[0], self.player1)
+        self.assertFalse(self.game.paddle1.pause_request)
+        self.assertEqual(self.instance.player_channels, {1: 'resumed', 2: 'other'})
+
+        async_to_sync(resumed.disconnect)(1006)
+        self.assertIsNone(self.game.players[0])
+        self.assertTrue(self.game.paddle1.pause_request)
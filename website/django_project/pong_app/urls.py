@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import game_view
+from .views import game_view, worker_status
 
 urlpatterns = [
     path('<int:session_id>/', game_view, name='game_view'),
+    path('status/', worker_status, name='worker_status'),
 ]
 
@@ -1,7 +1,10 @@
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from matchmaking.models import GameSession
 from django.contrib.auth.decorators import login_required
 from main.utils import render_template
+from .consumers import GLOBAL_GAMES_STORE, GOVERNOR
+from .instrumentation import WORKER_TICK_STATS
 
 @login_required
 def game_view(request, session_id):
@@ -10,3 +13,12 @@ def game_view(request, session_id):
         return render_template(request, 'home_template.html')
     context = {'game_session': game_session}
     return render_template(request, 'pong_template.html', context)
+
+
+def worker_status(request):
+    """
+    Report the tick governor's state, so load balancers can route new games away from an overloaded worker.
+    Answers 503 while the worker refuses new games.
+    """
+    status = {**GOVERNOR.to_dict(), 'games': len(GLOBAL_GAMES_STORE), 'tick_stats': WORKER_TICK_STATS.summary()}
+    return JsonResponse(status, status=200 if status['accepting_games'] else 503)
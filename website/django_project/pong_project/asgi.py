@@ -10,3 +10,7 @@ application = ProtocolTypeRouter({
     'http': get_asgi_application(),
     'websocket': channels_application,  # Use the combined channels application
 })
+
+# The process serving the WebSockets delivers to its clients the messages the task cluster writes to the outbox.
+from main.outbox import OUTBOX_RELAY  # noqa: E402
+OUTBOX_RELAY.ensure_started()
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django_q',
 
     'users',
     'pong_app',
@@ -95,8 +96,28 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Task queue running deferred tournament work (round deadlines, blockchain records), see tournaments/tasks.py.
+# Its workers send their broadcasts through the outbox (main/outbox.py), and 'timeout' bounds how late they commit.
+# Tasks and schedules are stored in the database through the ORM broker, and each poll takes up to 'bulk' tasks.
+Q_CLUSTER = {
+    'name': 'pong',
+    'orm': 'default',
+    'workers': 2,
+    'bulk': 10,
+    'poll': 0.5,
+    'timeout': 60,
+    'retry': 120,
+    'catch_up': False,
+}
+
 WSGI_APPLICATION = 'pong_project.wsgi.application'
 
+# Addresses allowed to scrape /metrics without logging in, besides staff users: loopback, and the comma separated
+# addresses of METRICS_ALLOWED_IPS (the Prometheus server). Requests proxied by nginx come from nginx's address.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1'] + [
+    ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()
+]
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
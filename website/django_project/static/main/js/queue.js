@@ -22,6 +22,16 @@ function startQueueTimer() {
     }, 1000);
 }
 
+// Shows the position and estimated wait pushed by the matchmaker.
+export function updateQueueStatus(position, estimatedWait) {
+    let queuePosition = document.getElementById('queuePosition');
+    let queueEstimate = document.getElementById('queueEstimate');
+    if (queuePosition)
+        queuePosition.textContent = position;
+    if (queueEstimate)
+        queueEstimate.textContent = estimatedWait === null ? '--:--' : formatTime(estimatedWait * 1000);
+}
+
 function formatTime(milliseconds) {
     let totalSeconds = Math.floor(milliseconds / 1000);
     let minutes = Math.floor(totalSeconds / 60);
@@ -1,5 +1,5 @@
 import {getCsrfToken, loadGame } from "/static/main/js/SPAContentLoader.js";
-import {showQueueUI, hideQueueUI} from "/static/main/js/queue.js";
+import {showQueueUI, hideQueueUI, updateQueueStatus} from "/static/main/js/queue.js";
 
 export let queueSocket = null;
 
@@ -13,7 +13,14 @@ function connectToQueueWebSocket() {
 
     queueSocket.onmessage = (event) => {
         const data = JSON.parse(event.data);
-        if (data.type === 'game_matched') {
+        if (data.type === 'ping') {
+            // Echo pings right away so the matchmaker knows our round-trip time.
+            queueSocket.send(JSON.stringify({type: 'pong', ping_id: data.ping_id}));
+        }
+        else if (data.type === 'queue_status') {
+            updateQueueStatus(data.position, data.estimated_wait);
+        }
+        else if (data.type === 'game_matched') {
             console.log('Game matched:', data);
             // Display "Match found" in the queue container
             const queueContent = document.getElementById('queueContent');
@@ -29,9 +29,15 @@ function initGameData() {
     canvasContainerHeight: null,
     keyState: {},
     touchState: {},
+    sessionId: null,
+    resume_token: null,
+    resumeAttempts: 0,
   };
 }
 
+// How many times we try to reattach to a running game after the connection drops.
+const MAX_RESUME_ATTEMPTS = 5;
+
 export let gameData = initGameData();
 
 let render3d = false; // changer cette valeur depuis les settings, pas ingame;
@@ -75,7 +81,9 @@ export function changeRender() {
 // Initializes a new game session.
 async function initGame(sessionId) {
   console.log("Initializing game session");
+  stopAnimationLoop();
   gameData = initGameData();
+  gameData.sessionId = sessionId;
   gameData.socket = createGameSessionWebSocket(sessionId);
   window.gameSocket = gameData.socket;
   setupWebSocketListeners();
@@ -86,9 +94,11 @@ async function initGame(sessionId) {
 }
 
 // Creates and returns a WebSocket connection for the game session.
-function createGameSessionWebSocket(sessionId) {
+// A resume token lets the server reattach us to the running game in a single handshake.
+function createGameSessionWebSocket(sessionId, resumeToken = null) {
   const protocol = window.location.protocol === "https:" ? "wss" : "ws";
-  const url = `${protocol}://${window.location.host}/ws/game/${sessionId}/`;
+  let url = `${protocol}://${window.location.host}/ws/game/${sessionId}/`;
+  if (resumeToken) url += `?resume=${encodeURIComponent(resumeToken)}`;
   return new WebSocket(url);
 }
 
@@ -96,18 +106,24 @@ function createGameSessionWebSocket(sessionId) {
 async function setupWebSocketListeners() {
   gameData.socket.onopen = () => {
     console.log("Game WebSocket connection opened");
-    requestAnimationFrame(createAnimationLoop());
+    gameData.resumeAttempts = 0;
+    // A resumed connection keeps the loop started by the first one.
+    if (gameData.animationId === null)
+      gameData.animationId = requestAnimationFrame(createAnimationLoop());
   };
   gameData.socket.onmessage = handleWebSocketMessage;
   gameData.socket.onclose = await handleWebSocketClose;
   gameData.socket.onerror = (event) => {
     console.error("Game WebSocket error:", event);
-    loadView("/home/").catch((error) => console.error("Error:", error));
+    // The close handler decides whether to resume the game or leave it.
+    if (!gameData.resume_token)
+      loadView("/home/").catch((error) => console.error("Error:", error));
   };
 }
 
 // Animation loop for handling continuous tasks (keyhold).
 // Limits movement updates per second for better compatibility across browsers.
+// It runs until the game is left, through reconnections: moves are only sent while the socket is open.
 function createAnimationLoop() {
   let lastTime = performance.now();
 
@@ -121,13 +137,18 @@ function createAnimationLoop() {
       lastTime = currentTime;
     }
 
-    if (gameData.socket && gameData.socket.readyState === WebSocket.OPEN)
-      requestAnimationFrame(animate);
+    gameData.animationId = requestAnimationFrame(animate);
   }
 
   return animate;
 }
 
+// Stops the animation loop, once the game is left for good.
+function stopAnimationLoop() {
+  if (gameData.animationId !== null) cancelAnimationFrame(gameData.animationId);
+  gameData.animationId = null;
+}
+
 // Sets up key event listeners for player movement.
 function setupPlayerMovement() {
   window.addEventListener("keydown", handleKeyDown);
@@ -318,6 +339,11 @@ function getMoveMessages() {
 // Handles incoming WebSocket messages.
 function handleWebSocketMessage(event) {
   const message = JSON.parse(event.data);
+  if (message.type === "ping") {
+    // Echo pings right away so the server can measure our round-trip time.
+    gameData.socket.send(JSON.stringify({ type: "pong", ping_id: message.ping_id }));
+    return;
+  }
   if (!gameData.window && message.type !== "game_init") return;
   switch (message.type) {
     case "game_init":
@@ -403,9 +429,37 @@ export async function sleep(ms) {
   return new Promise((resolve) => setTimeout(resolve, ms));
 }
 
+// Abnormal closures (code 1006) happen on network blips, the server closes normally when the game ends.
+function shouldResumeGame(event) {
+  return (
+    event.code === 1006 &&
+    gameData.resume_token &&
+    !gameData.winner &&
+    gameData.resumeAttempts < MAX_RESUME_ATTEMPTS
+  );
+}
+
+// Reopens the game WebSocket with the resume token, backing off between attempts.
+async function resumeGame() {
+  gameData.resumeAttempts++;
+  await sleep(250 * 2 ** (gameData.resumeAttempts - 1));
+  console.log(`Resuming game session, attempt ${gameData.resumeAttempts}`);
+  gameData.socket = createGameSessionWebSocket(
+    gameData.sessionId,
+    gameData.resume_token
+  );
+  window.gameSocket = gameData.socket;
+  setupWebSocketListeners();
+}
+
 // Handles the closing event of the WebSocket connection.
 async function handleWebSocketClose(event) {
   console.log("Game WebSocket connection closed:", event);
+  if (shouldResumeGame(event)) {
+    await resumeGame();
+    return;
+  }
+  stopAnimationLoop();
   window.removeEventListener("keydown", handleKeyDown);
   window.removeEventListener("keyup", handleKeyUp);
   // window.removeEventListener('resize', handleResize);
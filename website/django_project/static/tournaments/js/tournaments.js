@@ -67,7 +67,10 @@ export function tournamentWebSocketConnection(tournamentId) {
         const message = JSON.parse(event.data);
         switch (message.type) {
             case 'tournament_message':
-                await updateTournament(tournamentId);
+                console.log('Tournament message:', message.message);
+                break;
+            case 'tournament_delta':
+                await receiveTournamentDelta(tournamentId, message);
                 break;
             case 'game_start':
                 console.log("Server session id: ", message["session_id"]);
@@ -103,6 +106,225 @@ async function updateTournament(tournamentId) {
        await loadView(`/tournaments/${tournamentId}/`).catch(error => console.error('Error:', error));
 }
 
+// Deltas ahead of the version displayed wait this long for the missing ones before the page is fetched again.
+const DELTA_GAP_TIMEOUT = 1000;
+const pendingDeltas = new Map();
+let deltaGapTimer = null;
+
+const bracketLabels = {
+    'en': {
+        tbd: 'TBD', ready: 'Ready', notReady: 'Not Ready', wonBy: 'Match won by', avatar: alias => `${alias}'s Avatar`,
+        participantAvatar: "Participant's Avatar", inProgress: '<p>Match in progress</p>',
+        statuses: {'open': 'Open', 'created': 'Upcoming', 'scheduled': 'Scheduled', 'in progress': 'In Progress',
+                   'completed': 'Completed'},
+    },
+    'es': {
+        tbd: 'Por determinar', ready: 'Listo', notReady: 'No listo', wonBy: 'Partido ganado por',
+        avatar: alias => `Avatar de ${alias}`, participantAvatar: 'Avatar del participante',
+        inProgress: '<span class="score-number">0</span><span class="score-separator">:</span><span class="score-number">0</span>',
+        statuses: {'open': 'Abierto', 'created': 'Próximamente', 'scheduled': 'Programado',
+                   'in progress': 'En progreso', 'completed': 'Completado'},
+    },
+    'fr': {
+        tbd: 'À déterminer', ready: 'Prêt', notReady: 'Pas prêt', wonBy: 'Match gagné par',
+        avatar: alias => `Avatar de ${alias}`, participantAvatar: 'Avatar du participant',
+        inProgress: '<p>Match en cours</p>',
+        statuses: {'open': 'Ouvert', 'created': 'À venir', 'scheduled': 'Programmé', 'in progress': 'En cours',
+                   'completed': 'Terminé'},
+    },
+};
+
+async function receiveTournamentDelta(tournamentId, delta) {
+    // Deltas are applied in version order: each one moves the page from its base version to its version,
+    // a transaction's changes coming as one delta. A delta that does not start from the displayed version waits
+    // for the ones in between, and the page is only fetched again if they do not come.
+    const tournamentContainer = document.getElementById('tournament');
+    if (!tournamentContainer) return;
+    let version = parseInt(tournamentContainer.dataset.version, 10);
+    if (delta.version <= version) return;
+    pendingDeltas.set(delta.base, delta);
+    while (pendingDeltas.has(version)) {
+        const next = pendingDeltas.get(version);
+        pendingDeltas.delete(version);
+        if (!applyTournamentEvents(next.events)) {
+            pendingDeltas.clear();
+            return updateTournament(tournamentId);
+        }
+        version = next.version;
+        tournamentContainer.dataset.version = version;
+    }
+    for (const [base, pending] of pendingDeltas)
+        if (pending.version <= version) pendingDeltas.delete(base);
+    clearTimeout(deltaGapTimer);
+    if (pendingDeltas.size) {
+        deltaGapTimer = setTimeout(() => {
+            pendingDeltas.clear();
+            updateTournament(tournamentId);
+        }, DELTA_GAP_TIMEOUT);
+    }
+}
+
+function applyTournamentEvents(events) {
+    // Patches the displayed bracket. Returns false if the page has to be fetched again instead.
+    const labels = bracketLabels[getLanguage()] || bracketLabels['en'];
+    for (const event of events) {
+        const match = event.match_id ? document.querySelector(`.match[data-match-id="${event.match_id}"]`) : null;
+        const round = event.round_id ? document.querySelector(`.round[data-round-id="${event.round_id}"]`) : null;
+        switch (event.event) {
+            case 'participant_joined':
+            case 'participant_left':
+                if (!updateParticipants(event, labels)) return false;
+                break;
+            case 'ready_toggled':
+                if (!match) return false;
+                setReadyIcon(match, event.slot, event.ready, labels);
+                if (event.own) setReadyButton(match, event.match_id, event.ready, labels);
+                break;
+            case 'player_placed':
+                if (!match) return false;
+                setPlayer(match, event.slot, event.alias, labels);
+                break;
+            case 'match_scheduled':
+                if (!match) return false;
+                setMatchState(match, readyStateHtml(event, labels));
+                break;
+            case 'match_started':
+                if (!match) return false;
+                setMatchState(match, `<div class="score">${labels.inProgress}</div>`);
+                break;
+            case 'match_completed':
+                if (!match) return false;
+                setMatchState(match, `<div class="score"><p>${labels.wonBy} ${escapeHtml(event.winner || '')}</p></div>`);
+                break;
+            case 'round_scheduled':
+                if (!round) return false;
+                setRoundStatus(round, 'scheduled', event.start_time, labels);
+                break;
+            case 'round_updated':
+                if (!round) return false;
+                setRoundStatus(round, event.status, null, labels);
+                break;
+            case 'standings_updated':
+                if (!updateStandings(event)) return false;
+                break;
+            case 'tournament_completed':
+                document.getElementById('tournamentStatus').textContent = labels.statuses['completed'];
+                break;
+            default:
+                // The start of the tournament, or anything this page cannot patch.
+                return false;
+        }
+    }
+    return true;
+}
+
+function escapeHtml(text) {
+    const element = document.createElement('span');
+    element.textContent = text;
+    return element.innerHTML;
+}
+
+function updateParticipants(event, labels) {
+    const participants = document.getElementById('tournamentParticipants');
+    const count = document.getElementById('tournamentParticipantCount');
+    if (!participants || !count) return false;
+    if (event.event === 'participant_joined') {
+        participants.insertAdjacentHTML('beforeend', `<tr><td>
+            <img src="/static/main/img/default_avatar.jpg" alt="${labels.participantAvatar}" class="participant-list-avatar">
+            <span class="participant-list-username">${escapeHtml(event.alias)}</span></td></tr>`);
+    } else {
+        participants.querySelectorAll('.participant-list-username').forEach(username => {
+            if (username.textContent === event.alias) username.closest('tr').remove();
+        });
+    }
+    count.textContent = participants.querySelectorAll('tr').length;
+    return true;
+}
+
+function compareStandings(first, second) {
+    // Best ranked first: by points, then Buchholz score, then alias, as the server ranks them.
+    return second.score - first.score || second.buchholz - first.buchholz
+        || (first.alias < second.alias ? -1 : first.alias > second.alias ? 1 : 0);
+}
+
+function updateStandings(event) {
+    // Patches the points of the players whose standing changed, then ranks the table again.
+    const standings = document.getElementById('tournamentStandings');
+    if (!standings || !event.standings) return false;
+    const rows = new Map();
+    standings.querySelectorAll('tr').forEach(row => {
+        const alias = row.querySelector('.participant-list-username').textContent;
+        rows.set(alias, {row, alias, score: parseInt(row.cells[2].textContent, 10),
+                         buchholz: parseInt(row.cells[3].textContent, 10)});
+    });
+    for (const standing of event.standings) {
+        const entry = rows.get(standing.alias);
+        if (!entry) return false;
+        entry.score = standing.score;
+        entry.buchholz = standing.buchholz;
+        entry.row.cells[2].textContent = standing.score;
+        entry.row.cells[3].textContent = standing.buchholz;
+    }
+    [...rows.values()].sort(compareStandings).forEach((entry, index) => {
+        entry.row.cells[0].textContent = index + 1;
+        standings.appendChild(entry.row);
+    });
+    return true;
+}
+
+function setPlayer(match, slot, alias, labels) {
+    const player = match.querySelector(slot === 0 ? '.player.left' : '.player.right');
+    player.innerHTML = alias
+        ? `<img src="/static/main/img/default_avatar.jpg" alt="${escapeHtml(labels.avatar(alias))}" class="player-avatar" />
+           <span class="player-username">${escapeHtml(alias)}</span>`
+        : `<span class="player-username">${labels.tbd}</span>`;
+}
+
+function readyIconHtml(ready, labels) {
+    return ready
+        ? `<img class="ready-state-icon" src="/static/tournaments/img/ready.png" alt="${labels.ready}" />`
+        : `<img class="ready-state-icon" src="/static/tournaments/img/not_ready.png" alt="${labels.notReady}" />`;
+}
+
+function readyButtonHtml(matchId, ready, labels) {
+    return ready
+        ? `<button id="tournamentUserNotReadyButton" class="ready-state-button not-ready btn btn-danger w-100" data-match-id="${matchId}">${labels.notReady}</button>`
+        : `<button id="tournamentUserReadyButton" class="ready-state-button ready btn btn-primary w-100" data-match-id="${matchId}">${labels.ready}</button>`;
+}
+
+function readyStateHtml(event, labels) {
+    const players = event.players.map(player =>
+        `<span class="ready-state-player">${readyIconHtml(player.ready, labels)}</span>`).join('');
+    const button = event.own_slot === null || event.own_slot === undefined ? ''
+        : readyButtonHtml(event.match_id, event.players[event.own_slot].ready, labels);
+    return `<div class="ready-state"><div class="ready-state-players">${players}</div>${button}</div>`;
+}
+
+function setReadyIcon(match, slot, ready, labels) {
+    const players = match.querySelectorAll('.ready-state-player');
+    if (players[slot]) players[slot].innerHTML = readyIconHtml(ready, labels);
+}
+
+function setReadyButton(match, matchId, ready, labels) {
+    const button = match.querySelector('.ready-state-button');
+    if (button) button.outerHTML = readyButtonHtml(matchId, ready, labels);
+}
+
+function setMatchState(match, html) {
+    // The state of a match sits between its two players: the ready check, the game in progress or its winner.
+    match.querySelectorAll(':scope > .ready-state, :scope > .score').forEach(element => element.remove());
+    match.querySelector('.player.right').insertAdjacentHTML('beforebegin', html);
+}
+
+function setRoundStatus(round, status, startTime, labels) {
+    const title = round.querySelector('.round-title');
+    title.querySelector('.round-status').textContent = labels.statuses[status] || status;
+    const timer = title.querySelector('.round-timer');
+    if (timer) timer.remove();
+    if (status === 'scheduled')
+        title.insertAdjacentHTML('beforeend', `<h3 class="round-timer" data-start-time="${startTime}"></h3>`);
+}
+
 export function updateReadyState(event, ws, ready_state) {
     if (!ws || !event.target) {
         console.error("WebSocket or event target is not available.");
@@ -178,6 +400,7 @@ export async function createTournament() {
     await loadView('/tournaments/create/').catch(error => console.error('Error:', error));
         const nameLabel = document.querySelector('label[for="id_name"]');
         const sizeLabel = document.querySelector('label[for="id_size"]');
+        const formatLabel = document.querySelector('label[for="id_format"]');
         const language = getLanguage();
         const names = {
             'es': 'Nombre:',
@@ -189,8 +412,15 @@ export async function createTournament() {
             'en': 'Size:',
             'fr': 'Taille:',
         };
+        const formats = {
+            'es': 'Formato:',
+            'en': 'Format:',
+            'fr': 'Format :',
+        };
         if (nameLabel)
             nameLabel.textContent = names[language];
         if (sizeLabel)
             sizeLabel.textContent = sizes[language];
+        if (formatLabel)
+            formatLabel.textContent = formats[language];
 }
\ No newline at end of file
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class TournamentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tournaments'
+
+    def ready(self):
+        from main.dispatcher import register_merger
+        from .bracket import merge_deltas, merge_tournament_messages, register_format
+        from .swiss import SwissBracket
+        register_merger('tournament_delta', merge_deltas)
+        register_merger('tournament_message', merge_tournament_messages)
+        register_format('swiss', SwissBracket)
@@ -0,0 +1,409 @@
+from datetime import timedelta
+from collections import defaultdict
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from users.stats import record_tournament_result
+from .models import Tournament, TournamentParticipant, TournamentRound, TournamentMatch, MatchParticipant
+
+# Seconds players get to ready up once a round is scheduled.
+ROUND_START_DELAY = 60
+
+# Bracket classes of the tournament formats other than single elimination, by format.
+BRACKET_FORMATS = {}
+
+
+def register_format(format, bracket_class):
+    BRACKET_FORMATS[format] = bracket_class
+
+
+class Bracket:
+    """
+    A single-elimination tournament loaded in memory, with the tournament row locked.
+
+    Completing matches computes the whole progression on the loaded objects: eliminations, placement of the
+    winner in their next match, round completion, scheduling of the next round and tournament completion.
+    persist() then writes every change with one bulk update per table, along with the rebuilt snapshot of the
+    rounds that changed, and the messages to broadcast and rounds to time are left for the caller to act on once
+    the transaction commits.
+    """
+
+    # Fields of the participants written back by persist().
+    entrant_fields = ['status']
+
+    def __init__(self, tournament, matches, slots, entrants):
+        self.tournament = tournament
+        self.matches = {match.id: match for match in matches}
+        self.positions = {(match.round.number, match.number): match for match in matches}
+        self.rounds = {}
+        self.round_matches = defaultdict(list)
+        for match in matches:
+            # Every match of a round shares one instance of it, so a change of the round is seen from all of them
+            match.round = self.rounds.setdefault(match.round.number, match.round)
+            self.round_matches[match.round.number].append(match)
+        self.slots = defaultdict(list)
+        for slot in slots:
+            self.slots[slot.match_id].append(slot)
+        self.entrants = {entrant.user_id: entrant for entrant in entrants}
+        self.last_round = max(self.rounds, default=0)
+
+        self.changed_matches = set()
+        self.changed_slots = set()
+        self.changed_rounds = set()
+        self.changed_entrants = set()
+        self.leaving_users = set()
+        self.tournament_changed = False
+        self.completed = False
+        self.messages = []
+        self.scheduled_rounds = []
+
+    @classmethod
+    def load(cls, tournament_id, match_ids=None):
+        """
+        Load a tournament's bracket, locking the tournament, as the bracket class of its format. Formats whose
+        matches only change their own round load just the matches about to be completed when they are given,
+        the others the whole bracket. Must run in a transaction.
+        """
+        tournament = Tournament.objects.select_for_update().get(id=tournament_id)
+        return BRACKET_FORMATS.get(tournament.format, cls).load_rows(tournament, match_ids)
+
+    @classmethod
+    def load_rows(cls, tournament, match_ids=None):
+        """
+        Load the whole bracket of a locked tournament in three queries: the winner of a match moves on to the
+        next round, so any match can change the rest of the bracket.
+        """
+        matches = list(TournamentMatch.objects.filter(round__tournament_id=tournament.id).select_related('round')
+                       .order_by('round__number', 'number'))
+        slots = list(MatchParticipant.objects.filter(match__round__tournament_id=tournament.id).order_by('id'))
+        entrants = list(TournamentParticipant.objects.filter(tournament_id=tournament.id).select_related('user'))
+        return cls(tournament, matches, slots, entrants)
+
+    @classmethod
+    def read_extras(cls, tournament):
+        """What the format adds to the snapshot of a tournament, read from its rows. Nothing by default."""
+        return {}
+
+    def alias(self, user_id):
+        entrant = self.entrants.get(user_id)
+        return entrant.user.alias if entrant else str(user_id)
+
+    def broadcast(self, group_name, message_data):
+        self.messages.append({'group_name': group_name, 'message_data': message_data})
+
+    def complete_match(self, match, winner_id):
+        """
+        Complete a match and everything that follows from it. A match without a winner eliminates both players.
+        Returns False if the match was already completed.
+        """
+        if match.status == 'completed':
+            return False
+        match.status = 'completed'
+        match.winner_id = winner_id
+        self.changed_matches.add(match)
+
+        for slot in self.slots[match.id]:
+            if slot.player_id is not None and slot.player_id != winner_id:
+                self.eliminate(slot.player_id)
+        if match.round.number == self.last_round:
+            self.complete_tournament(winner_id)
+        elif winner_id is not None:
+            self.advance(match, winner_id)
+        self.progress_round(match.round)
+        return True
+
+    def eliminate(self, user_id):
+        entrant = self.entrants.get(user_id)
+        if entrant is not None:
+            entrant.status = 'eliminated'
+            self.changed_entrants.add(entrant)
+        self.leaving_users.add(user_id)
+        self.broadcast(f"tournament_{self.tournament.id}",
+                       {'type': 'tournament_message',
+                        'message': f"{self.alias(user_id)} has been eliminated from the tournament."})
+        self.broadcast(self.alias(user_id), {'type': 'leave_message'})
+
+    def advance(self, match, winner_id):
+        """Place the winner in their next match: on the left for odd matches, on the right for even ones."""
+        next_match = self.positions.get((match.round.number + 1, (match.number + 1) // 2))
+        if next_match is None:
+            print(f"Error: no next match for match {match.number} of round {match.round.number}.")
+            return
+        slots = self.slots[next_match.id]
+        preferred = slots[(match.number - 1) % 2] if len(slots) == 2 else None
+        slot = preferred if preferred is not None and preferred.player_id is None else \
+            next((slot for slot in slots if slot.player_id is None), None)
+        if slot is None:
+            print(f"Error: no free slot in match {next_match.number} of round {next_match.round.number}.")
+            return
+        slot.player_id = winner_id
+        self.changed_slots.add(slot)
+
+    def progress_round(self, round):
+        """Complete the round once all its matches are, and schedule the next one."""
+        if any(match.status != 'completed' for match in self.round_matches[round.number]):
+            return
+        round.status = 'completed'
+        self.changed_rounds.add(round)
+        next_round = self.rounds.get(round.number + 1)
+        if next_round is None:
+            return
+        next_round.status = 'scheduled'
+        next_round.start_time = timezone.now() + timedelta(seconds=ROUND_START_DELAY)
+        self.changed_rounds.add(next_round)
+        self.scheduled_rounds.append(next_round)
+        for match in self.round_matches[next_round.number]:
+            if match.status == 'created':
+                match.status = 'scheduled'
+                self.changed_matches.add(match)
+
+    def complete_tournament(self, winner_id):
+        if self.tournament.status == 'completed':
+            return
+        self.tournament.status = 'completed'
+        self.tournament.winner_id = winner_id
+        self.tournament_changed = True
+        self.completed = True
+        if winner_id is not None:
+            self.leaving_users.add(winner_id)
+            self.broadcast(f"tournament_{self.tournament.id}",
+                           {'type': 'tournament_message',
+                            'message': f"{self.alias(winner_id)} has won the tournament !"})
+            self.broadcast(self.alias(winner_id), {'type': 'leave_message'})
+
+    def start_round(self, round):
+        """
+        Start a scheduled round once its ready check expires: matches where nobody is ready eliminate both
+        players, matches where only one player is ready are won by that player.
+        """
+        round.status = 'in progress'
+        self.changed_rounds.add(round)
+        for match in self.round_matches[round.number]:
+            if match.status == 'completed':
+                continue
+            ready = [slot.player_id for slot in self.slots[match.id] if slot.is_ready]
+            if len(ready) == len(self.slots[match.id]):
+                continue
+            print(f"Match {match.id}: {len(ready)} participant(s) ready at the start of the round.")
+            self.complete_match(match, ready[0] if ready else None)
+
+    def participant_aliases(self):
+        """Aliases of the participants as recorded on the blockchain, with a slot for empty places."""
+        return [entrant.user.alias for entrant in self.entrants.values()] + ["None"]
+
+    def round_snapshot(self, round):
+        """
+        The snapshot of a round: its matches and the players of each match, with aliases inlined. The matches
+        loaded are rebuilt in the snapshot stored for the round, so a bracket loaded with only some matches of a
+        round patches them in place. Ready states change too often to be written here: see overlay_live_matches().
+        """
+        matches = {match['id']: match for match in round.bracket['matches']} if round.bracket else {}
+        for match in self.round_matches[round.number]:
+            matches[match.id] = {
+                'id': match.id,
+                'number': match.number,
+                'status': match.status,
+                'winner': self.alias(match.winner_id) if match.winner_id else None,
+                'players': [{
+                    'id': slot.player_id,
+                    'alias': self.alias(slot.player_id) if slot.player_id else None,
+                } for slot in self.slots[match.id]],
+            }
+        return {
+            'id': round.id,
+            'number': round.number,
+            'status': round.status,
+            'start_time': round.start_time.isoformat() if round.start_time else None,
+            'matches': list(matches.values()),
+        }
+
+    def snapshot(self):
+        """The bracket as served to the tournament page, with the loaded rounds only."""
+        return {
+            'status': self.tournament.status,
+            'winner': self.alias(self.tournament.winner_id) if self.tournament.winner_id else None,
+            'rounds': [self.round_snapshot(self.rounds[number]) for number in sorted(self.rounds)],
+        }
+
+    def refresh_snapshot(self):
+        """
+        Rebuild the snapshot of the tournament and of its loaded rounds from the bracket in memory, as a new
+        version if it changed. The rounds whose snapshot changed are marked changed, to be written with them.
+        Returns the changes from the previous snapshot as delta events.
+        """
+        snapshot = self.snapshot()
+        rounds = [self.rounds[number] for number in sorted(self.rounds)]
+        header = {key: value for key, value in snapshot.items() if key != 'rounds'}
+        changed = [round for round, round_snapshot in zip(rounds, snapshot['rounds'])
+                   if round.bracket != round_snapshot]
+        if header == self.tournament.bracket and not changed:
+            return []
+        previous = None if self.tournament.bracket is None else \
+            {**self.tournament.bracket, 'rounds': [round.bracket for round in rounds if round.bracket]}
+        events = snapshot_changes(previous, snapshot)
+        for round, round_snapshot in zip(rounds, snapshot['rounds']):
+            round.bracket = round_snapshot
+        self.changed_rounds.update(changed)
+        self.tournament.bracket = header
+        self.tournament.version += 1
+        return events
+
+    def save_snapshot(self):
+        """Write the refreshed snapshot alone: the tournament's and that of the rounds it changed."""
+        self.tournament.save(update_fields=['bracket', 'version'])
+        if self.changed_rounds:
+            TournamentRound.objects.bulk_update(self.changed_rounds, ['bracket'])
+
+    def persist(self):
+        """Write every change with one bulk update per table. Must run in the transaction that loaded the bracket."""
+        events = self.refresh_snapshot()
+        self.tournament.save(update_fields=['status', 'winner', 'bracket', 'version'])
+        if events:
+            self.broadcast(f"tournament_{self.tournament.id}", delta_message(self.tournament.version, events))
+        if self.changed_rounds:
+            TournamentRound.objects.bulk_update(self.changed_rounds, ['status', 'start_time', 'bracket'])
+        if self.changed_matches:
+            TournamentMatch.objects.bulk_update(self.changed_matches, ['status', 'winner'])
+        if self.changed_slots:
+            MatchParticipant.objects.bulk_update(self.changed_slots, ['player'])
+        if self.changed_entrants:
+            TournamentParticipant.objects.bulk_update(self.changed_entrants, self.entrant_fields)
+        if self.leaving_users:
+            get_user_model().objects.filter(id__in=self.leaving_users).update(tournament_id=None)
+        if self.completed:
+            record_tournament_result(self.tournament, list(self.entrants))
+
+
+def delta_message(version, events, base=None):
+    """
+    The message carrying the delta events that moved a tournament from a base version, by default the previous
+    one, to a version, for its group.
+    """
+    return {'type': 'tournament_delta', 'base': version - 1 if base is None else base, 'version': version,
+            'events': events}
+
+
+def merge_deltas(first, second):
+    """
+    One delta for two deltas of a tournament sent in the same transaction. They follow each other since the
+    tournament is locked; if they somehow do not, the merged delta asks clients to fetch the tournament again.
+    """
+    if second['base'] != first['version']:
+        return delta_message(max(first['version'], second['version']), [{'event': 'resync'}],
+                             base=min(first['base'], second['base']))
+    return delta_message(second['version'], first['events'] + second['events'], base=first['base'])
+
+
+def merge_tournament_messages(first, second):
+    """One tournament message for two sent in the same transaction, one line each."""
+    return {**first, 'message': f"{first['message']}\n{second['message']}"}
+
+
+def snapshot_changes(old, new):
+    """
+    The delta events leading from a bracket snapshot to the next one, in bracket order: rounds scheduled or
+    moving on, players placed in matches, matches scheduled, started or won, and the tournament completed.
+    A first snapshot is the start of the tournament, which has no finer delta.
+    """
+    if old is None:
+        return [{'event': 'tournament_started'}]
+    old_rounds = {round['id']: round for round in old['rounds']}
+    old_matches = {match['id']: match for round in old['rounds'] for match in round['matches']}
+    events = []
+    for round in new['rounds']:
+        before = old_rounds.get(round['id'], {})
+        if round['status'] != before.get('status') or round['start_time'] != before.get('start_time'):
+            if round['status'] == 'scheduled':
+                events.append({'event': 'round_scheduled', 'round_id': round['id'], 'start_time': round['start_time']})
+            else:
+                events.append({'event': 'round_updated', 'round_id': round['id'], 'status': round['status']})
+        for match in round['matches']:
+            before = old_matches.get(match['id'], {'players': [], 'status': None, 'winner': None})
+            for slot, player in enumerate(match['players']):
+                previous = before['players'][slot] if slot < len(before['players']) else {}
+                if player['id'] != previous.get('id'):
+                    events.append({'event': 'player_placed', 'match_id': match['id'], 'slot': slot,
+                                   'player_id': player['id'], 'alias': player['alias']})
+            if match['status'] == before['status'] and match['winner'] == before['winner']:
+                continue
+            if match['status'] == 'scheduled':
+                events.append({'event': 'match_scheduled', 'match_id': match['id'], 'players': match['players']})
+            elif match['status'] == 'in progress':
+                events.append({'event': 'match_started', 'match_id': match['id']})
+            elif match['status'] == 'completed':
+                events.append({'event': 'match_completed', 'match_id': match['id'], 'winner': match['winner']})
+    if new.get('status') == 'completed' and old.get('status') != 'completed':
+        events.append({'event': 'tournament_completed', 'winner': new.get('winner')})
+    return events
+
+
+def overlay_live_matches(tournament_id, snapshot):
+    """
+    Put in a bracket snapshot what changed in its pending matches since it was written, read from their players'
+    rows in one query: the ready state of every player, and the matches started once both were ready. Toggling
+    ready only bumps the tournament version, so the snapshot must be read after the version and overlaid after.
+
+    Args:
+        tournament_id (int): The tournament of the snapshot.
+        snapshot (dict): The bracket snapshot, patched in place. None for open tournaments.
+
+    Returns:
+        dict: The snapshot.
+    """
+    if snapshot is None:
+        return snapshot
+    statuses, ready = {}, {}
+    for match_id, player_id, is_ready, status in MatchParticipant.objects.filter(
+            match__round__tournament_id=tournament_id, match__status__in=('scheduled', 'in progress')) \
+            .values_list('match_id', 'player_id', 'is_ready', 'match__status'):
+        statuses[match_id] = status
+        ready[(match_id, player_id)] = is_ready
+    for round in snapshot['rounds']:
+        for match in round['matches']:
+            if match['status'] == 'completed':
+                continue
+            if statuses.get(match['id']) == 'in progress':
+                match['status'] = 'in progress'
+            for player in match['players']:
+                player['ready'] = ready.get((match['id'], player['id']), False)
+    return snapshot
+
+
+def snapshot_pending_slots(snapshot):
+    """
+    The place of every player in their next match that is not completed yet, by user ID,
+    as a dict with the match ID, their slot in it and their ready state. Players with no match to play are left out.
+    """
+    slots = {}
+    for round in snapshot['rounds'] if snapshot else []:
+        for match in round['matches']:
+            if match['status'] == 'completed':
+                continue
+            for slot, player in enumerate(match['players']):
+                if player['id'] is not None and player['id'] not in slots:
+                    slots[player['id']] = {'match_id': match['id'], 'slot': slot,
+                                           'is_ready': player.get('ready', False)}
+    return slots
+
+
+def ensure_snapshot(tournament):
+    """
+    The bracket snapshot of a tournament: its status and winner, the snapshots of its rounds, and what its
+    format adds, like the standings of a Swiss tournament. It is built from the rows of the bracket if the
+    tournament has none yet, as for tournaments started before snapshots existed. Open tournaments have no bracket.
+    """
+    if tournament.status == 'open':
+        return None
+    if tournament.bracket is None:
+        with transaction.atomic():
+            bracket = Bracket.load(tournament.id)
+            if bracket.tournament.bracket is None:
+                bracket.refresh_snapshot()
+                bracket.save_snapshot()
+        tournament.bracket, tournament.version = bracket.tournament.bracket, bracket.tournament.version
+    rounds = TournamentRound.objects.filter(tournament_id=tournament.id, bracket__isnull=False).order_by('number')
+    return {
+        **tournament.bracket,
+        'rounds': list(rounds.values_list('bracket', flat=True)),
+        **BRACKET_FORMATS.get(tournament.format, Bracket).read_extras(tournament),
+    }
@@ -1,10 +1,14 @@
 import json
+import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import TournamentMatch, MatchParticipant
-from pong_app.consumers import broadcast_message, create_game_instance
+from .tournaments import toggle_ready
+from pong_app.consumers import broadcast_message, start_game_instance
+from pong_app.governor import GameCapacityError
 from matchmaking.models import GameSession
-from users.consumers import add_channel_name_to_session, remove_channel_name_from_session, update_user_session_id
+from users.consumers import add_channel_name_to_session, remove_channel_name_from_session
+from main.metrics import WEBSOCKET_CONNECTIONS
+from main.monitoring import LOOP_MONITOR
 
 
 class TournamentConsumer(AsyncWebsocketConsumer):
@@ -30,9 +34,12 @@ class TournamentConsumer(AsyncWebsocketConsumer):
         # Adds the channel to the user's session, so we can close it on user logout
         await add_channel_name_to_session(self.scope, self.channel_name)
 
+        LOOP_MONITOR.ensure_started()
         await self.accept()
+        WEBSOCKET_CONNECTIONS.opened('tournament', self.channel_name)
 
     async def disconnect(self, close_code):
+        WEBSOCKET_CONNECTIONS.closed('tournament', self.channel_name)
         # Leave tournament group
         await self.channel_layer.group_discard(self.tournament_group_name, self.channel_name)
         await self.channel_layer.group_discard(self.user.alias, self.channel_name)
@@ -47,85 +54,38 @@ class TournamentConsumer(AsyncWebsocketConsumer):
 
                     if message['type'] == 'ready_state_update':
                         print(f"{self.user.alias}: Received ready state update: {message['ready_state']}")
-                        await self.update_match_participant_ready_state(message['match_id'], message['ready_state'])
-                        print(f"{self.user.alias}: Updated ready state for match {message['match_id']} to {message['ready_state']}")
-                        if not await self.check_and_start_match(message['match_id']):
-                            await broadcast_message(self.tournament_group_name, {'type': 'tournament_message',
-                                                                                'message': 'ready_state_updated'})
+                        try:
+                            result = await self.update_ready_state(message['match_id'], message['ready_state'])
+                        except GameCapacityError as e:
+                            await self.send(text_data=json.dumps({'type': 'tournament_message', 'message': str(e)}))
+                            return
+                        if result is None:
+                            return
+                        delta, game_session = result
+                        await broadcast_message(self.tournament_group_name, delta)
+                        if game_session is not None:
+                            await self.start_match_game(game_session)
         except json.JSONDecodeError as e:
                 print(f"Error: {str(e)}")
 
 
     @database_sync_to_async
-    def update_match_participant_ready_state(self, match_id, ready_state):
-        try:
-            match = TournamentMatch.objects.get(id=match_id)
-            participant = match.participants.get(player=self.scope["user"])
-            participant.is_ready = ready_state == "ready"
-            participant.save()
-        except (MatchParticipant.DoesNotExist, TournamentMatch.DoesNotExist) as e:
-            print(f"Error: {str(e)}")
-
-    async def check_and_start_match(self, match_id):
-        try:
-            match = await self.get_match(match_id)
-            if await self.all_participants_ready(match):
-                await self.update_match_status(match, 'in progress')
-                await self.create_game_for_match(match)
-                await self.notify_match_participants(match)
-                await broadcast_message(self.tournament_group_name, {'type': 'tournament_message',
-                                                                     'message': 'match_start'})
-                print(f"Broadcasted match start in {self.tournament_group_name}")
-                return True
-            return False
-
-        except TournamentMatch.DoesNotExist as e:
-            print(f"Error: {str(e)}")
-            return False
-
-    @database_sync_to_async
-    def get_match(self, match_id):
-        return TournamentMatch.objects.get(id=match_id)
-
-    @database_sync_to_async
-    def all_participants_ready(self, match):
-        return all(participant.is_ready for participant in match.participants.all())
-
-    @database_sync_to_async
-    def update_match_status(self, match, status):
-        match.status = status
-        match.save()
-
-    @database_sync_to_async
-    def create_game_for_match(self, match):
-        self.game_session = GameSession.objects.create(
-            player1=match.participants.first().player,
-            player2=match.participants.last().player,
-            mode='tournament')
-        create_game_instance(self.game_session.id)
-        match.game_session = self.game_session
-        match.save()
-
-    async def notify_match_participants(self, match):
-        participants = await self.get_match_participants(match)
-        for participant in participants:
-            await update_user_session_id(participant.player, self.game_session.id)
-            message = {'type': 'user_message',
-                        'message': 'game_start',
-                        'session_id': self.game_session.id}
-            print(f"{participant.player.alias} notify_match_participant: {message['session_id']}")
-            await broadcast_message(participant.player.alias, message)
-            
-
-    @database_sync_to_async
-    def get_match_participants(self, match):
-        """
-        Retrieve all participants in a match.
-        Django's database operations are lazy meaning that they are not executed until they are needed.
-        This is why we need to convert the QuerySet to a list to ensure that the database is accessed inside this
-        function.
-        """
-        return list(match.participants.select_related('player').all())
+    def update_ready_state(self, match_id, ready_state):
+        """Set the ready state of the player, starting the match if both its players are now ready, in one hop."""
+        result = toggle_ready(self.user.tournament_id, match_id, self.user.id, ready_state == "ready")
+        if result is None:
+            print(f"Error: {self.user.alias} has no scheduled match {match_id} in tournament {self.user.tournament_id}.")
+        return result
+
+    async def start_match_game(self, game_session):
+        """Start the game of a match on the event loop, without waiting for it, and send its players to it."""
+        self.game_session = game_session
+        start_game_instance(game_session)
+        await asyncio.gather(*[broadcast_message(player.alias, {'type': 'user_message',
+                                                               'message': 'game_start',
+                                                               'session_id': game_session.id})
+                               for player in (game_session.player1, game_session.player2)])
+        print(f"Started match game {game_session.id} in {self.tournament_group_name}")
 
     # Receive message from tournament group
     async def tournament_message(self, event):
@@ -140,6 +100,26 @@ class TournamentConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             print(f"Error: {str(e)}")
 
+    async def tournament_delta(self, event):
+        """Send a delta of the bracket, telling the client which of its events are about its own player."""
+        try:
+            await self.send(text_data=json.dumps({
+                'type': 'tournament_delta',
+                'base': event['base'],
+                'version': event['version'],
+                'events': [self.mark_own_events(delta_event) for delta_event in event['events']],
+            }))
+        except Exception as e:
+            print(f"Error: {str(e)}")
+
+    def mark_own_events(self, event):
+        if 'player_id' in event:
+            return {**event, 'own': event['player_id'] == self.user.id}
+        if 'players' in event:
+            return {**event, 'own_slot': next((slot for slot, player in enumerate(event['players'])
+                                               if player['id'] == self.user.id), None)}
+        return event
+
     async def user_message(self, event):
         message = event['message']
 
@@ -0,0 +1,50 @@
+from django.utils import timezone
+from django_q.brokers.orm import ORM
+from django_q.models import OrmQ
+from django_q.signing import SignedPackage
+from django_q.tasks import async_task
+
+ROUND_DEADLINE_TASK = 'tournaments.tasks.start_round_task'
+
+
+class DeadlineBroker(ORM):
+    """
+    The ORM broker of the cluster, queueing a task the workers only take at a deadline: workers take the tasks
+    whose lock has passed, and the lock of a task queued here is its deadline instead of the time it is queued.
+    Workers so take deadlines as they poll the queue, in batches and within a poll of the deadline, rather than
+    through the scheduler, which only looks for due schedules every 30 seconds.
+    """
+
+    def __init__(self, run_at):
+        super().__init__()
+        self.run_at = run_at
+
+    def enqueue(self, task):
+        return self.get_connection().create(key=self.list_key, payload=task, lock=self.run_at).pk
+
+
+def round_deadline_task_name(round_id):
+    return f'round-start-{round_id}'
+
+
+def queue_round_deadline(round_id, start_time):
+    """
+    Queue the ready check of a round for its start time, in the current transaction: the deadline is written
+    with the round, survives restarts, and the ready checks missed while the cluster was down run once it is up.
+    """
+    async_task(ROUND_DEADLINE_TASK, round_id, task_name=round_deadline_task_name(round_id),
+               broker=DeadlineBroker(start_time or timezone.now()))
+
+
+def queued_round_deadlines():
+    """The IDs of the rounds whose ready check is queued, read from the queued tasks."""
+    round_ids = set()
+    for payload in OrmQ.objects.values_list('payload', flat=True):
+        try:
+            task = SignedPackage.loads(payload)
+        except Exception as e:
+            print(f"Error reading a queued task: {e}")
+            continue
+        if task.get('func') == ROUND_DEADLINE_TASK:
+            round_ids.add(task['args'][0])
+    return round_ids
@@ -1,14 +1,20 @@
 from django import forms
 from .models import Tournament
 
+# Largest tournament that can be created, by format.
+MAX_TOURNAMENT_SIZE = 1024
+MAX_SWISS_TOURNAMENT_SIZE = 10000
+
 
 class TournamentCreationForm(forms.ModelForm):
 
     class Meta:
         model = Tournament
-        fields = ['name']
+        fields = ['name', 'size', 'format']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Default placeholder'}),
+            'size': forms.NumberInput(attrs={'class': 'form-control', 'min': 2, 'max': MAX_SWISS_TOURNAMENT_SIZE}),
+            'format': forms.Select(attrs={'class': 'form-control'}),
         }
 
     def __init__(self, *args, **kwargs):
@@ -17,3 +23,12 @@ class TournamentCreationForm(forms.ModelForm):
         if creator:
             # This will set the placeholder to the creator's alias if a creator is provided
             self.fields['name'].widget.attrs['placeholder'] = f"{creator}'s tournament"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        size, format = cleaned_data.get('size'), cleaned_data.get('format')
+        if size is not None and format is not None:
+            max_size = MAX_SWISS_TOURNAMENT_SIZE if format == 'swiss' else MAX_TOURNAMENT_SIZE
+            if not 2 <= size <= max_size:
+                self.add_error('size', f'Size must be between 2 and {max_size}')
+        return cleaned_data
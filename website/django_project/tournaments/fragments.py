@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from main.singleflight import SingleFlight
+from .bracket import ensure_snapshot, overlay_live_matches, snapshot_pending_slots
+
+LANGUAGES = ('en', 'es', 'fr')
+# A fragment is keyed by the tournament version, so it never goes stale; the timeout only frees memory.
+# No CACHES setting is configured, so fragments live in the local memory cache of each process.
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+RENDERS = SingleFlight()
+
+
+def fragment_key(tournament_id, language, version):
+    return f'tournament:{tournament_id}:{language}:{version}'
+
+
+def get_tournament_fragment(tournament, language):
+    """
+    The rendered tournament page for a language at the current version of the tournament, from the cache of
+    this process. The requests of the process missing the same version at the same time share one render:
+    they wait for the render in flight. Each process renders a version once for its own cache.
+
+    Args:
+        tournament (Tournament): The tournament, with its version.
+        language (str): One of LANGUAGES.
+
+    Returns:
+        dict: The page as 'html', with a placeholder for the ready button of every match, and the 'slots'
+            the players hold in their pending match, by user ID.
+    """
+    key = fragment_key(tournament.id, language, tournament.version)
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = RENDERS.do(key, lambda: render_cached(key, tournament, language))
+    return fragment
+
+
+def render_cached(key, tournament, language):
+    """Render a fragment into the cache, unless a render that finished just before already put it there."""
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = render_fragment(tournament, language)
+        cache.set(key, fragment, FRAGMENT_CACHE_TIMEOUT)
+    return fragment
+
+
+def render_fragment(tournament, language):
+    """
+    Render the tournament page, without anything specific to the player viewing it.
+    The bracket and the ready states of its pending matches are read after the version, so a fragment is never
+    older than its key.
+    """
+    print(f'Rendering tournament {tournament.id} ({language}) at version {tournament.version}')
+    bracket = overlay_live_matches(tournament.id, ensure_snapshot(tournament))
+    participants = list(tournament.participants.select_related('user')) if tournament.status == 'open' else []
+    html = render_to_string(f'tournament_{language}.html', {
+        'tournament': tournament,
+        'bracket': bracket,
+        'participants': participants,
+    })
+    return {'html': html, 'slots': snapshot_pending_slots(bracket)}
+
+
+def ready_button_placeholder(match_id):
+    return f'<!-- ready-button-{match_id} -->'
+
+
+def render_for_player(fragment, user_id, language):
+    """The page of a cached fragment for a player, with their ready button put in their pending match."""
+    slot = fragment['slots'].get(user_id)
+    if slot is None:
+        return fragment['html']
+    button = render_to_string(f'tournament_ready_button_{language}.html', {'participant': slot})
+    return fragment['html'].replace(ready_button_placeholder(slot['match_id']), button, 1)
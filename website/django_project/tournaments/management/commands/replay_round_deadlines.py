@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django_q.models import Schedule
+from tournaments.deadlines import queue_round_deadline, queued_round_deadlines
+from tournaments.models import TournamentRound
+
+
+class Command(BaseCommand):
+    help = ('Queue the ready check of every scheduled round that has none, such as rounds timed by a process that '
+            'stopped or recorded as schedules, which are removed. The cluster runs the ones already past at once.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            removed, _ = Schedule.objects.filter(name__startswith='round-start-').delete()
+            queued = queued_round_deadlines()
+            missing = TournamentRound.objects.filter(status='scheduled', tournament__status='in progress') \
+                .exclude(id__in=queued)
+            now = timezone.now()
+            overdue = 0
+            for round in missing:
+                queue_round_deadline(round.id, round.start_time)
+                overdue += round.start_time is None or round.start_time <= now
+        self.stdout.write(self.style.SUCCESS(f'Queued {len(missing)} round deadlines, {overdue} of them overdue, '
+                                             f'and removed {removed} schedules.'))
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2024-06-08 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournaments', '0014_alter_tournament_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='bracket',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2024-06-09 10:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_participants(apps, schema_editor):
+    Tournament = apps.get_model('tournaments', 'Tournament')
+    tournaments = list(Tournament.objects.annotate(counted=Count('participants')))
+    for tournament in tournaments:
+        tournament.participant_count = tournament.counted
+    Tournament.objects.bulk_update(tournaments, ['participant_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournaments', '0015_tournament_version_tournament_bracket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='participant_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_participants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2024-06-10 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournaments', '0016_tournament_participant_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='format',
+            field=models.CharField(choices=[('single elimination', 'Single Elimination'), ('swiss', 'Swiss')], default='single elimination', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='tournamentparticipant',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.6 on 2024-06-13 10:42
+
+from django.db import migrations, models
+
+
+def split_snapshots(apps, schema_editor):
+    """
+    Move the rounds of every bracket snapshot to their round, and compute the Buchholz score of the participants
+    of Swiss tournaments, whose standings are now read from their rows instead of the snapshot.
+    """
+    Tournament = apps.get_model('tournaments', 'Tournament')
+    TournamentRound = apps.get_model('tournaments', 'TournamentRound')
+    TournamentParticipant = apps.get_model('tournaments', 'TournamentParticipant')
+    MatchParticipant = apps.get_model('tournaments', 'MatchParticipant')
+    for tournament in Tournament.objects.filter(bracket__isnull=False):
+        rounds = {round['id']: round for round in tournament.bracket.get('rounds', [])}
+        changed = list(TournamentRound.objects.filter(id__in=rounds))
+        for round in changed:
+            round.bracket = rounds[round.id]
+        TournamentRound.objects.bulk_update(changed, ['bracket'])
+        tournament.bracket = {'status': tournament.bracket.get('status'), 'winner': tournament.bracket.get('winner')}
+        tournament.save(update_fields=['bracket'])
+
+        if tournament.format != 'swiss':
+            continue
+        participants = list(TournamentParticipant.objects.filter(tournament=tournament))
+        scores = {participant.user_id: participant.score for participant in participants}
+        players = {}
+        for match_id, player_id in MatchParticipant.objects.filter(match__round__tournament=tournament,
+                                                                   player__isnull=False) \
+                .values_list('match_id', 'player_id'):
+            players.setdefault(match_id, []).append(player_id)
+        buchholz = {}
+        for match_players in players.values():
+            if len(match_players) == 2:
+                buchholz[match_players[0]] = buchholz.get(match_players[0], 0) + scores.get(match_players[1], 0)
+                buchholz[match_players[1]] = buchholz.get(match_players[1], 0) + scores.get(match_players[0], 0)
+        for participant in participants:
+            participant.buchholz = buchholz.get(participant.user_id, 0)
+        TournamentParticipant.objects.bulk_update(participants, ['buchholz'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournaments', '0017_tournament_format_tournamentparticipant_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournamentround',
+            name='bracket',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tournamentparticipant',
+            name='buchholz',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tournamentparticipant',
+            index=models.Index(fields=['tournament', '-score', '-buchholz'], name='tournament_standings_idx'),
+        ),
+        migrations.RunPython(split_snapshots, migrations.RunPython.noop),
+    ]
@@ -15,8 +15,16 @@ class Tournament(models.Model):
                                                       ('completed', 'Completed')], default='open')
     creator: 'CustomUser' = models.ForeignKey(User, related_name='creator', on_delete=models.CASCADE)
     size = models.IntegerField(default=4)
+    format = models.CharField(max_length=20, choices=[('single elimination', 'Single Elimination'),
+                                                      ('swiss', 'Swiss')], default='single elimination')
+    # Kept equal to the number of participants by the joins and leaves, so seats are counted without a COUNT.
+    participant_count = models.IntegerField(default=0)
     winner: 'CustomUser' = models.ForeignKey(User, related_name='won_tournaments', on_delete=models.SET_NULL,
                                               null=True, blank=True)
+    # Bumped on every change of the bracket, which is also kept denormalized: the status and winner here, and
+    # the rounds on their own rows, so a change only rewrites the rounds it touches.
+    version = models.IntegerField(default=0)
+    bracket = models.JSONField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
         # Set default name if not provided
@@ -32,10 +40,15 @@ class TournamentParticipant(models.Model):
     tournament = models.ForeignKey(Tournament, related_name='participants', on_delete=models.CASCADE)
     user: 'CustomUser' = models.ForeignKey(User, related_name='tournament_participations', on_delete=models.CASCADE)
     status = models.CharField(max_length=50, choices=[('active', 'Active'), ('eliminated', 'Eliminated')], default='active')
+    # Points of the participant in a Swiss tournament: one per win or bye, and the sum of the points of their
+    # opponents, kept up to date as points are scored so the standings are read in index order.
+    score = models.IntegerField(default=0)
+    buchholz = models.IntegerField(default=0)
 
     class Meta:
         # Ensures that a user can only participate in a tournament once
         unique_together = ('tournament', 'user')
+        indexes = [models.Index(fields=['tournament', '-score', '-buchholz'], name='tournament_standings_idx')]
 
     def __str__(self):
         return f"{self.user.alias} in {self.tournament.name}"
@@ -47,6 +60,8 @@ class TournamentRound(models.Model):
     status = models.CharField(max_length=20, choices=[('scheduled', 'Scheduled'), ('in progress', 'In Progress'),
                                                       ('completed', 'Completed')], default='scheduled')
     start_time = models.DateTimeField(null=True, blank=True)
+    # The snapshot of the round: its matches and their players, as served to the tournament page.
+    bracket = models.JSONField(null=True, blank=True)
 
     class Meta:
         unique_together = ('tournament', 'number')
@@ -0,0 +1,365 @@
+import math
+import random
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import F
+from django.utils import timezone
+from .bracket import Bracket, ROUND_START_DELAY
+from .models import TournamentParticipant, TournamentRound, TournamentMatch, MatchParticipant
+
+# How many of the last pairs are tried when a player is left with only opponents they already played,
+# swapping them into one of these pairs before allowing a rematch.
+REPAIR_WINDOW = 32
+
+
+def swiss_rounds(participant_count):
+    """Number of rounds of a Swiss tournament: as many as a single elimination, so one player can win them all."""
+    return max(1, math.ceil(math.log2(participant_count)))
+
+
+def pair_players(ranking, opponents, had_bye):
+    """
+    Pairs the players of a Swiss round, each with the closest ranked player they have not played yet, so players
+    meet others with the same score or the nearest one. Paired players are skipped with a path-compressed index,
+    so a round is paired in time linear in the number of players times the number of rounds already played.
+
+    Args:
+        ranking (list): The IDs of the players, best ranked first.
+        opponents (dict): The IDs of the players each player has already played, by player ID.
+        had_bye (set): The IDs of the players who already had a bye.
+
+    Returns:
+        tuple: The pairs of player IDs, best ranked pair first, and the ID of the player getting the bye,
+            None if there is an even number of players.
+    """
+    ranking = list(ranking)
+    bye = None
+    if len(ranking) % 2:
+        # The lowest ranked player who has not had a bye yet gets it
+        bye = next((player for player in reversed(ranking) if player not in had_bye), ranking[-1])
+        ranking.remove(bye)
+
+    # next_free[i] leads to the first position at or after i whose player is not paired yet
+    next_free = list(range(len(ranking) + 1))
+
+    def find(position):
+        root = position
+        while next_free[root] != root:
+            root = next_free[root]
+        while next_free[position] != root:
+            next_free[position], position = root, next_free[position]
+        return root
+
+    def take(position):
+        next_free[position] = position + 1
+
+    pairs = []
+    position = find(0)
+    while position < len(ranking):
+        player = ranking[position]
+        take(position)
+        played = opponents.get(player, ())
+        candidate = find(position + 1)
+        while candidate < len(ranking) and ranking[candidate] in played:
+            candidate = find(candidate + 1)
+        if candidate < len(ranking):
+            take(candidate)
+            pairs.append((player, ranking[candidate]))
+        else:
+            repair_pairing(player, pairs, ranking, find, take, opponents)
+        position = find(position + 1)
+    return pairs, bye
+
+
+def repair_pairing(player, pairs, ranking, find, take, opponents):
+    """
+    Pair a player who already played everyone left unpaired: they take the place of a player of one of the last
+    pairs, who gets a new opponent among those left. If no such swap exists, the player gets a rematch.
+    """
+    remaining = []
+    position = find(0)
+    while position < len(ranking):
+        remaining.append(position)
+        position = find(position + 1)
+    for index in range(len(pairs) - 1, max(-1, len(pairs) - REPAIR_WINDOW - 1), -1):
+        for kept, freed in (pairs[index], reversed(pairs[index])):
+            if kept in opponents.get(player, ()):
+                continue
+            partner = next((position for position in remaining
+                            if ranking[position] not in opponents.get(freed, ())), None)
+            if partner is not None:
+                take(partner)
+                pairs[index] = (kept, player)
+                pairs.append((freed, ranking[partner]))
+                return
+    print(f"Swiss pairing: no pairing without a rematch found for player {player}.")
+    take(remaining[0])
+    pairs.append((player, ranking[remaining[0]]))
+
+
+class SwissBracket(Bracket):
+    """
+    A Swiss tournament loaded in memory, with the tournament row locked. Nobody is eliminated: every participant
+    plays every round, scoring a point per win or bye. Once every match of a round is completed, the next round
+    is paired from the standings, until swiss_rounds() rounds were played and the best ranked player wins.
+
+    A match only changes its own round until the round is over, so completing matches loads just them, their
+    players, and the snapshot of their round, whatever the size of the tournament; the rest of the bracket is
+    loaded when the round is over, to pair the next one. Scores and Buchholz scores are written as increments,
+    and the standings that changed are broadcast with the delta. persist() creates the paired rounds with one
+    bulk insert per table before writing the other changes.
+    """
+
+    def __init__(self, tournament, matches, slots, entrants):
+        super().__init__(tournament, matches, slots, entrants)
+        self.total_rounds = swiss_rounds(tournament.participant_count or len(self.entrants))
+        self.paired_rounds = []
+        # Whether only some matches of a round are loaded, and the points and Buchholz points to add, by user ID
+        self.partial = False
+        self.points = defaultdict(int)
+        self.buchholz = defaultdict(int)
+        self.changed_standings = set()
+
+    @classmethod
+    def load_rows(cls, tournament, match_ids=None):
+        """
+        Load the given matches of a locked Swiss tournament, along with their players, in three queries,
+        or the whole bracket if no matches are given.
+        """
+        if match_ids is None:
+            return super().load_rows(tournament)
+        matches = list(TournamentMatch.objects.filter(id__in=match_ids, round__tournament_id=tournament.id)
+                       .select_related('round').order_by('number'))
+        slots = list(MatchParticipant.objects.filter(match_id__in=match_ids).order_by('id'))
+        entrants = list(TournamentParticipant.objects.filter(
+            tournament_id=tournament.id, user_id__in=[slot.player_id for slot in slots if slot.player_id is not None])
+            .select_related('user'))
+        bracket = cls(tournament, matches, slots, entrants)
+        bracket.partial = True
+        return bracket
+
+    def load_remaining(self):
+        """Load the rest of the bracket into a bracket loaded with only some of its matches, keeping their changes."""
+        if not self.partial:
+            return
+        rest = super().load_rows(self.tournament)
+        for match in rest.matches.values():
+            if match.id in self.matches:
+                continue
+            match.round = self.rounds.setdefault(match.round.number, match.round)
+            self.matches[match.id] = match
+            self.positions[(match.round.number, match.number)] = match
+            self.round_matches[match.round.number].append(match)
+            self.slots[match.id] = rest.slots[match.id]
+        for matches in self.round_matches.values():
+            matches.sort(key=lambda match: match.number)
+        for user_id, entrant in rest.entrants.items():
+            self.entrants.setdefault(user_id, entrant)
+        self.last_round = max(self.rounds, default=0)
+        self.partial = False
+
+    @classmethod
+    def read_extras(cls, tournament):
+        """The standings, read from the participants in index order."""
+        return {'standings': [{'alias': alias, 'score': score, 'buchholz': buchholz} for alias, score, buchholz in
+                              TournamentParticipant.objects.filter(tournament_id=tournament.id)
+                              .order_by('-score', '-buchholz', 'user__alias')
+                              .values_list('user__alias', 'score', 'buchholz')]}
+
+    def complete_match(self, match, winner_id):
+        """Complete a match, scoring a point for its winner. Returns False if the match was already completed."""
+        if match.status == 'completed':
+            return False
+        match.status = 'completed'
+        match.winner_id = winner_id
+        self.changed_matches.add(match)
+        if winner_id is not None:
+            self.score(winner_id)
+        self.progress_round(match.round)
+        return True
+
+    def score(self, user_id):
+        """Score a point for a player, written by persist() as an increment of their score."""
+        self.points[user_id] += 1
+        entrant = self.entrants.get(user_id)
+        if entrant is not None:
+            entrant.score += 1
+
+    def round_completed(self, round):
+        """Whether every match of a round is completed, asking the database about the matches not loaded."""
+        if any(match.status != 'completed' for match in self.round_matches[round.number]):
+            return False
+        return not self.partial or not TournamentMatch.objects.filter(round_id=round.id).exclude(
+            status='completed').exclude(id__in=[match.id for match in self.round_matches[round.number]]).exists()
+
+    def progress_round(self, round):
+        """Complete the round once all its matches are, and pair the next one or complete the tournament."""
+        if not self.round_completed(round):
+            return
+        self.load_remaining()
+        round.status = 'completed'
+        self.changed_rounds.add(round)
+        if round.number < self.total_rounds:
+            self.pair_round(round.number + 1)
+        else:
+            standings = self.standings()
+            self.complete_tournament(standings[0]['user_id'] if standings else None)
+
+    def complete_tournament(self, winner_id):
+        """Complete the tournament, and let every participant leave it, as nobody was eliminated along the way."""
+        if self.tournament.status == 'completed':
+            return
+        super().complete_tournament(winner_id)
+        self.leaving_users.update(self.entrants)
+        self.broadcast(f"tournament_{self.tournament.id}", {'type': 'leave_message'})
+
+    def opponents(self):
+        """The IDs of the players each player has played, by player ID."""
+        opponents = {user_id: set() for user_id in self.entrants}
+        for slots in self.slots.values():
+            players = [slot.player_id for slot in slots if slot.player_id is not None]
+            if len(players) == 2:
+                opponents.setdefault(players[0], set()).add(players[1])
+                opponents.setdefault(players[1], set()).add(players[0])
+        return opponents
+
+    def byes(self):
+        """The IDs of the players who had a bye."""
+        return {slots[0].player_id for slots in self.slots.values()
+                if len(slots) == 2 and slots[0].player_id is not None and slots[1].player_id is None}
+
+    def standings(self):
+        """
+        The participants best ranked first, by score, then by Buchholz score (the sum of the scores of their
+        opponents), as dicts with their user ID, alias, score and Buchholz score. Needs the whole bracket.
+        """
+        opponents = self.opponents()
+        standings = [{
+            'user_id': user_id,
+            'alias': entrant.user.alias,
+            'score': entrant.score,
+            'buchholz': sum(self.entrants[opponent].score for opponent in opponents[user_id]
+                            if opponent in self.entrants),
+        } for user_id, entrant in self.entrants.items()]
+        standings.sort(key=lambda standing: (-standing['score'], -standing['buchholz'], standing['alias']))
+        return standings
+
+    def pair_round(self, number):
+        """
+        Pair the next round from the scores, players with the same score in random order, and schedule it.
+        The bye scores its point at once. The round is created by persist().
+        """
+        ranking = list(self.entrants)
+        random.shuffle(ranking)
+        ranking.sort(key=lambda user_id: -self.entrants[user_id].score)
+        pairs, bye = pair_players(ranking, self.opponents(), self.byes())
+        if bye is not None:
+            self.score(bye)
+        round = TournamentRound(tournament=self.tournament, number=number, status='scheduled',
+                                start_time=timezone.now() + timedelta(seconds=ROUND_START_DELAY))
+        self.paired_rounds.append((round, pairs, bye))
+
+    def count_points(self):
+        """
+        Add the points scored to the Buchholz score of the opponents of their scorers. A bracket loaded with only
+        some matches reads the matches the scorers played in two queries. Must run before the paired rounds are
+        created: a new opponent gets the whole score of their opponent when they are paired.
+        """
+        if not self.points:
+            return
+        if self.partial:
+            match_players = defaultdict(list)
+            scorer_matches = MatchParticipant.objects.filter(match__round__tournament_id=self.tournament.id,
+                                                             player_id__in=list(self.points)).values('match_id')
+            for match_id, player_id in MatchParticipant.objects.filter(match_id__in=scorer_matches,
+                                                                       player__isnull=False) \
+                    .values_list('match_id', 'player_id'):
+                match_players[match_id].append(player_id)
+            match_players = match_players.values()
+        else:
+            match_players = [[slot.player_id for slot in slots if slot.player_id is not None]
+                             for slots in self.slots.values()]
+        for players in match_players:
+            if len(players) == 2:
+                self.buchholz[players[0]] += self.points.get(players[1], 0)
+                self.buchholz[players[1]] += self.points.get(players[0], 0)
+
+    def create_paired_rounds(self):
+        """
+        Insert the paired rounds, their matches and players with one bulk insert per table, and load them.
+        Each paired player gets the score of their new opponent added to their Buchholz score.
+        """
+        if not self.paired_rounds:
+            return
+        rounds = TournamentRound.objects.bulk_create([round for round, _, _ in self.paired_rounds])
+        matches, players = [], []
+        for round, pairs, bye in self.paired_rounds:
+            for number, pair in enumerate(pairs, 1):
+                matches.append(TournamentMatch(round=round, number=number, status='scheduled'))
+                players.append(pair)
+                self.buchholz[pair[0]] += self.entrants[pair[1]].score
+                self.buchholz[pair[1]] += self.entrants[pair[0]].score
+            if bye is not None:
+                matches.append(TournamentMatch(round=round, number=len(pairs) + 1, status='completed',
+                                               winner_id=bye))
+                players.append((bye, None))
+        matches = TournamentMatch.objects.bulk_create(matches)
+        slots = MatchParticipant.objects.bulk_create([
+            MatchParticipant(match=match, player_id=player_id, is_ready=False)
+            for match, pair in zip(matches, players) for player_id in pair
+        ])
+
+        for round in rounds:
+            self.rounds[round.number] = round
+            self.scheduled_rounds.append(round)
+        for match in matches:
+            self.matches[match.id] = match
+            self.positions[(match.round.number, match.number)] = match
+            self.round_matches[match.round.number].append(match)
+        for slot in slots:
+            self.slots[slot.match_id].append(slot)
+        self.last_round = max(self.rounds)
+        self.paired_rounds = []
+
+    def write_standings(self):
+        """
+        Add the points and Buchholz points to the participants, with one update per distinct increment, and take
+        note of the participants whose standing changed.
+        """
+        increments = defaultdict(list)
+        for user_id in set(self.points) | set(self.buchholz):
+            increments[(self.points.get(user_id, 0), self.buchholz.get(user_id, 0))].append(user_id)
+        for (points, buchholz), user_ids in increments.items():
+            if points or buchholz:
+                TournamentParticipant.objects.filter(tournament_id=self.tournament.id, user_id__in=user_ids) \
+                    .update(score=F('score') + points, buchholz=F('buchholz') + buchholz)
+        self.changed_standings.update(user_id for (points, buchholz), user_ids in increments.items()
+                                      if points or buchholz for user_id in user_ids)
+        self.points, self.buchholz = defaultdict(int), defaultdict(int)
+
+    def refresh_snapshot(self):
+        """
+        Rebuild the snapshot like any bracket, with the standings that changed in the same delta: those of the
+        players of the completed matches and of their opponents, or everyone's once a round is paired.
+        """
+        events = super().refresh_snapshot()
+        if events and self.changed_standings:
+            participants = TournamentParticipant.objects.filter(tournament_id=self.tournament.id)
+            if self.partial:
+                participants = participants.filter(user_id__in=self.changed_standings)
+            events.append({'event': 'standings_updated', 'standings': [
+                {'alias': alias, 'score': score, 'buchholz': buchholz} for alias, score, buchholz in
+                participants.order_by('-score', '-buchholz', 'user__alias')
+                .values_list('user__alias', 'score', 'buchholz')]})
+            self.changed_standings = set()
+        return events
+
+    def persist(self):
+        """
+        Count the points scored, create the rounds paired since the bracket was loaded and write the standings,
+        then write every change like any bracket.
+        """
+        self.count_points()
+        self.create_paired_rounds()
+        self.write_standings()
+        super().persist()
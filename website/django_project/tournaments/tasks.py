@@ -0,0 +1,20 @@
+from asgiref.sync import async_to_sync
+from .models import Tournament
+from .tournaments import start_round
+from .blockchain import set_tournament_in_blockchain
+
+# Tasks run by the django-q cluster (python manage.py qcluster), queued in the database through the ORM broker.
+
+
+def start_round_task(round_id):
+    """
+    Runs the ready check of a round once its start time is reached, queued with the round (see deadlines.py).
+    Its broadcasts go through the outbox, as the workers have no WebSocket clients.
+    """
+    start_round(round_id)
+
+
+def record_tournament_task(tournament_id, participant_aliases):
+    """Records a completed tournament, its rounds and matches on the blockchain."""
+    tournament = Tournament.objects.get(id=tournament_id)
+    async_to_sync(set_tournament_in_blockchain)(tournament, participant_aliases)
@@ -1,3 +1,527 @@
-from django.test import TestCase
+import time
+import random
+import asyncio
+import threading
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from io import StringIO
+from django.core.management import call_command
+from django_q.brokers.orm import ORM
+from django_q.models import OrmQ, Schedule
+from django_q.signing import SignedPackage
+from main.dispatcher import DISPATCHER
+from main.models import OutboxMessage
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from main.metrics import Histogram
+from matchmaking.models import GameSession
+from pong_app.consumers import GOVERNOR
+from pong_app.governor import GameCapacityError
+from .consumers import TournamentConsumer
+from .models import Tournament, TournamentParticipant, TournamentRound, TournamentMatch, MatchParticipant
+from .tournaments import build_bracket, bracket_rounds, complete_tournament_matches, add_participant_to_tournament, \
+    remove_participant_from_tournament, start_tournament, schedule_round, toggle_ready
+from .bracket import ensure_snapshot, overlay_live_matches
+from .swiss import SwissBracket, pair_players, swiss_rounds
+from .deadlines import ROUND_DEADLINE_TASK, queued_round_deadlines
+from .tasks import start_round_task
 
-# Create your tests here.
+
+class BracketCreationTest(TestCase):
+    """Brackets of any size are inserted with one bulk insert per table, and their snapshot saved once."""
+
+    SIZES = [2, 3, 4, 5, 8, 13, 64, 100, 1024]
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create([User(username=f'player{i}', alias=f'player{i}')
+                                              for i in range(max(cls.SIZES))])
+
+    def create_tournament(self, size):
+        tournament = Tournament.objects.create(name=f'Bracket of {size}', creator=self.users[0], size=size,
+                                               status='in progress')
+        TournamentParticipant.objects.bulk_create([TournamentParticipant(tournament=tournament, user=user)
+                                                   for user in self.users[:size]])
+        return tournament, list(tournament.participants.select_related('user').order_by('id'))
+
+    def test_bracket_is_created_with_constant_queries(self):
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                tournament, participants = self.create_tournament(size)
+                with CaptureQueriesContext(connection) as queries:
+                    rounds = build_bracket(tournament, participants)
+                # Backends with a bound on query parameters (SQLite) split large bulk inserts in batches
+                if connection.features.max_query_params is None or size <= 100:
+                    self.assertEqual(len(queries), 6)
+                self.assertEqual(len(rounds), bracket_rounds(size))
+                self.assert_bracket_is_valid(tournament, size)
+
+    def assert_bracket_is_valid(self, tournament, size):
+        total_rounds = bracket_rounds(size)
+        first_round = TournamentMatch.objects.filter(round__tournament=tournament, round__number=1)
+        for round_number in range(1, total_rounds + 1):
+            self.assertEqual(TournamentMatch.objects.filter(round__tournament=tournament,
+                                                            round__number=round_number).count(),
+                             2 ** (total_rounds - round_number))
+        first_round_players = list(MatchParticipant.objects.filter(match__in=first_round, player__isnull=False)
+                                   .values_list('player_id', flat=True))
+        self.assertEqual(sorted(first_round_players), sorted(user.id for user in self.users[:size]))
+
+        byes = first_round.filter(status='completed')
+        self.assertEqual(byes.count(), 2 ** total_rounds - size)
+        for bye in byes:
+            self.assertTrue(MatchParticipant.objects.filter(match__round__tournament=tournament,
+                                                            match__round__number=2,
+                                                            match__number=(bye.number + 1) // 2,
+                                                            player=bye.winner).exists())
+
+
+class BracketProgressionTest(TestCase):
+    """Completing a match costs a constant number of queries, whatever it sets off."""
+
+    SIZE = 64
+    # Four to load the bracket, at most six bulk updates, three for the statistics of a completed tournament,
+    # and the savepoint around them.
+    MAX_QUERIES_PER_MATCH = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create([User(username=f'entrant{i}', alias=f'entrant{i}', tournament_id=0)
+                                              for i in range(cls.SIZE)])
+
+    def test_queries_per_completed_match(self):
+        tournament = Tournament.objects.create(name='Progression', creator=self.users[0], size=self.SIZE,
+                                               status='in progress')
+        TournamentParticipant.objects.bulk_create([TournamentParticipant(tournament=tournament, user=user)
+                                                   for user in self.users])
+        build_bracket(tournament, list(tournament.participants.select_related('user').order_by('id')))
+
+        query_counts = []
+        for round_number in range(1, bracket_rounds(self.SIZE) + 1):
+            for match in TournamentMatch.objects.filter(round__tournament=tournament, round__number=round_number):
+                winner_id = match.participants.order_by('id').values_list('player_id', flat=True).first()
+                with CaptureQueriesContext(connection) as queries:
+                    complete_tournament_matches(tournament.id, [(match.id, winner_id)])
+                query_counts.append(len(queries))
+
+        tournament.refresh_from_db()
+        self.assertEqual(tournament.status, 'completed')
+        self.assertIsNotNone(tournament.winner_id)
+        self.assertEqual(TournamentParticipant.objects.filter(tournament=tournament, status='eliminated').count(),
+                         self.SIZE - 1)
+        self.assertFalse(get_user_model().objects.filter(tournament_id__isnull=False,
+                                                         id__in=[user.id for user in self.users]).exists())
+        self.assertLessEqual(max(query_counts), self.MAX_QUERIES_PER_MATCH)
+        print(f"\n{len(query_counts)} matches completed, queries per match: "
+              f"{sum(query_counts) / len(query_counts):.1f} on average, {max(query_counts)} at most")
+
+
+class TournamentJoinTest(TestCase):
+    """A join reserves its seat with one conditional update, in a constant number of queries."""
+
+    SIZE = 16
+    # The tournament lock, the alias check, the seat update, the participant and user writes,
+    # and the savepoint around them.
+    MAX_QUERIES_PER_JOIN = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create([User(username=f'joiner{i}', alias=f'joiner{i}')
+                                              for i in range(cls.SIZE + 2)])
+
+    def test_queries_per_join(self):
+        tournament = Tournament.objects.create(name='Join rush', creator=self.users[0], size=self.SIZE)
+        query_counts = []
+        for user in self.users[:self.SIZE]:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertTrue(add_participant_to_tournament(tournament, user))
+            query_counts.append(len(queries))
+        self.assertEqual(tournament.participant_count, self.SIZE)
+
+        self.assertFalse(add_participant_to_tournament(tournament, self.users[self.SIZE]))
+        self.assertFalse(add_participant_to_tournament(tournament, self.users[0]))
+        tournament.refresh_from_db()
+        self.assertEqual(tournament.participant_count, self.SIZE)
+        self.assertEqual(tournament.participants.count(), self.SIZE)
+        self.assertEqual(tournament.version, self.SIZE)
+        self.assertLessEqual(max(query_counts), self.MAX_QUERIES_PER_JOIN)
+
+    def test_leaving_gives_the_seat_back(self):
+        tournament = Tournament.objects.create(name='Leavers', creator=self.users[0], size=2)
+        for user in self.users[:2]:
+            add_participant_to_tournament(tournament, user)
+        remove_participant_from_tournament(tournament, self.users[1])
+        self.assertTrue(add_participant_to_tournament(tournament, self.users[2]))
+        tournament.refresh_from_db()
+        self.assertEqual(tournament.participant_count, 2)
+
+        for user in (self.users[0], self.users[2]):
+            remove_participant_from_tournament(tournament, user)
+        self.assertFalse(Tournament.objects.filter(name='Leavers').exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class TournamentJoinConcurrencyTest(TransactionTestCase):
+    """Players joining the same tournament at once must never overfill it."""
+
+    SIZE = 8
+    JOINERS = 64
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = User.objects.bulk_create([User(username=f'rusher{i}', alias=f'rusher{i}')
+                                               for i in range(self.JOINERS)])
+        self.tournament = Tournament.objects.create(name='Join rush', creator=self.users[0], size=self.SIZE)
+
+    def join(self, user, start, results, errors):
+        try:
+            start.wait()
+            results.append(add_participant_to_tournament(Tournament.objects.get(id=self.tournament.id), user))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_joins_never_overfill(self):
+        start, results, errors = threading.Barrier(self.JOINERS), [], []
+        joiners = [threading.Thread(target=self.join, args=(user, start, results, errors)) for user in self.users]
+        for joiner in joiners:
+            joiner.start()
+        for joiner in joiners:
+            joiner.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results.count(True), self.SIZE)
+        self.tournament.refresh_from_db()
+        self.assertEqual(self.tournament.participant_count, self.SIZE)
+        self.assertEqual(self.tournament.participants.count(), self.SIZE)
+        self.assertEqual(self.tournament.version, self.SIZE)
+
+
+class ReadyCheckBenchmarkTest(TransactionTestCase):
+    """
+    Every player of a tournament getting ready at once: each toggle is one hop that leaves the bracket snapshot
+    untouched, each match starts once, and the hop of a toggle stays within a latency budget. The latency seen by
+    the players also counts the wait for the database thread, which all their toggles share.
+    The toggles go through the consumer, whose database hops close the connection after each call, so the
+    test commits for real instead of running in a test transaction.
+    """
+
+    SIZE = 512
+    MAX_HOP_P99_MS = 50
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = User.objects.bulk_create([User(username=f'ready{i}', alias=f'ready{i}')
+                                               for i in range(self.SIZE)])
+        self.tournament = Tournament.objects.create(name='Ready check', creator=self.users[0], size=self.SIZE,
+                                                    status='in progress', participant_count=self.SIZE)
+        User.objects.filter(id__in=[user.id for user in self.users]).update(tournament_id=self.tournament.id)
+        TournamentParticipant.objects.bulk_create([TournamentParticipant(tournament=self.tournament, user=user)
+                                                   for user in self.users])
+        with transaction.atomic():
+            build_bracket(self.tournament, list(self.tournament.participants.select_related('user').order_by('id')))
+
+    def consumer_for(self, user):
+        consumer = TournamentConsumer()
+        consumer.user = user
+        consumer.tournament_group_name = f'tournament_{self.tournament.id}'
+        consumer.channel_layer = get_channel_layer()
+        return consumer
+
+    async def toggle_all(self, toggles, latency):
+        async def toggle(consumer, match_id):
+            start = time.perf_counter()
+            await consumer.receive(text_data=f'{{"type": "ready_state_update", "match_id": {match_id}, '
+                                             f'"ready_state": "ready"}}')
+            latency.record(time.perf_counter() - start)
+        await asyncio.gather(*[toggle(consumer, match_id) for consumer, match_id in toggles])
+
+    def test_everyone_ready_at_once(self):
+        User = get_user_model()
+        users = {user.id: user for user in User.objects.filter(id__in=[user.id for user in self.users])}
+        toggles = [(self.consumer_for(users[player_id]), match_id) for match_id, player_id in
+                   MatchParticipant.objects.filter(match__round__tournament=self.tournament, match__status='scheduled')
+                   .values_list('match_id', 'player_id')]
+        bracket = ensure_snapshot(Tournament.objects.get(id=self.tournament.id))
+        latency, hop_latency = Histogram(), Histogram()
+
+        def timed_toggle_ready(*args):
+            start = time.perf_counter()
+            try:
+                return toggle_ready(*args)
+            finally:
+                hop_latency.record(time.perf_counter() - start)
+
+        with mock.patch('tournaments.consumers.start_game_instance') as start_game_instance, \
+                mock.patch('tournaments.consumers.toggle_ready', timed_toggle_ready):
+            start = time.perf_counter()
+            async_to_sync(self.toggle_all)(toggles, latency)
+            elapsed = time.perf_counter() - start
+        async_to_sync(get_channel_layer().flush)()
+
+        matches = self.SIZE // 2
+        self.assertEqual(start_game_instance.call_count, matches)
+        self.assertEqual(GameSession.objects.filter(mode='tournament').count(), matches)
+        self.assertFalse(TournamentMatch.objects.filter(round__tournament=self.tournament, round__number=1)
+                         .exclude(status='in progress').exists())
+        self.assertFalse(User.objects.filter(id__in=users, session_id__isnull=True).exists())
+        self.tournament.refresh_from_db()
+        self.assertEqual(self.tournament.version, 1 + self.SIZE)
+        snapshot = ensure_snapshot(self.tournament)
+        self.assertEqual(snapshot, bracket)
+        snapshot = overlay_live_matches(self.tournament.id, snapshot)
+        self.assertTrue(all(match['status'] == 'in progress' and all(player['ready'] for player in match['players'])
+                            for match in snapshot['rounds'][0]['matches']))
+        summary, hop = latency.summary(), hop_latency.summary()
+        print(f"\n{self.SIZE} players ready at once: {matches} matches started in {elapsed:.3f}s, "
+              f"toggle latency p50 {summary['p50_ms']}ms p99 {summary['p99_ms']}ms, "
+              f"database hop p50 {hop['p50_ms']}ms p99 {hop['p99_ms']}ms")
+        self.assertLess(hop['p99_ms'], self.MAX_HOP_P99_MS)
+
+
+class ReadyCheckAdmissionTest(TestCase):
+    """A match is not started on a worker too loaded to host its game: the toggle starting it is rolled back."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = User.objects.bulk_create([User(username=f'admitted{i}', alias=f'admitted{i}') for i in range(2)])
+        self.tournament = Tournament.objects.create(name='Admission', creator=self.users[0], size=2,
+                                                    status='in progress', participant_count=2)
+        TournamentParticipant.objects.bulk_create([TournamentParticipant(tournament=self.tournament, user=user)
+                                                   for user in self.users])
+        build_bracket(self.tournament, list(self.tournament.participants.select_related('user').order_by('id')))
+        self.match = TournamentMatch.objects.get(round__tournament=self.tournament)
+
+    def test_refused_game_rolls_back_toggle(self):
+        first, second = self.users
+        with mock.patch.object(GOVERNOR, 'accepting_games', return_value=False):
+            self.assertIsNotNone(toggle_ready(self.tournament.id, self.match.id, first.id, True))
+            with self.assertRaises(GameCapacityError):
+                toggle_ready(self.tournament.id, self.match.id, second.id, True)
+
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.status, 'scheduled')
+        self.assertFalse(MatchParticipant.objects.get(match=self.match, player=second).is_ready)
+        self.assertFalse(GameSession.objects.exists())
+        self.tournament.refresh_from_db()
+        self.assertEqual(self.tournament.version, 2)
+
+        _, game_session = toggle_ready(self.tournament.id, self.match.id, second.id, True)
+        self.assertIsNotNone(game_session)
+
+
+class SwissPairingTest(SimpleTestCase):
+    """Swiss rounds of ten thousand players are paired in well under a second, without rematches."""
+
+    PLAYERS = 10001
+    MAX_SECONDS_PER_ROUND = 0.5
+
+    def test_pairing_benchmark(self):
+        randomizer = random.Random(42)
+        scores = {player: 0 for player in range(self.PLAYERS)}
+        opponents = {player: set() for player in scores}
+        had_bye = set()
+        durations = []
+        for _ in range(swiss_rounds(self.PLAYERS)):
+            ranking = list(scores)
+            randomizer.shuffle(ranking)
+            ranking.sort(key=lambda player: -scores[player])
+            start = time.perf_counter()
+            pairs, bye = pair_players(ranking, opponents, had_bye)
+            durations.append(time.perf_counter() - start)
+
+            paired = [player for pair in pairs for player in pair] + [bye]
+            self.assertEqual(sorted(paired), sorted(scores))
+            self.assertNotIn(bye, had_bye)
+            had_bye.add(bye)
+            scores[bye] += 1
+            for player1, player2 in pairs:
+                self.assertNotIn(player2, opponents[player1])
+                opponents[player1].add(player2)
+                opponents[player2].add(player1)
+                scores[randomizer.choice((player1, player2))] += 1
+            # Players meet others with the same score, or the nearest one
+            self.assertLessEqual(sum(abs(scores[player1] - scores[player2]) > 1 for player1, player2 in pairs),
+                                 len(pairs) // 100)
+
+        self.assertLess(max(durations), self.MAX_SECONDS_PER_ROUND)
+        print(f"\n{len(durations)} Swiss rounds of {self.PLAYERS} players: pairing took "
+              f"{sum(durations) / len(durations) * 1000:.1f}ms on average, {max(durations) * 1000:.1f}ms at most")
+
+
+class SwissTournamentTest(TestCase):
+    """A Swiss tournament plays every round without rematches, pairing each round with bulk writes."""
+
+    SIZE = 13
+    # Eight to load the match, check its round and load the rest of the bracket, three bulk inserts of the next
+    # round, an update per distinct increment of the standings and their read back, the bulk updates of rounds
+    # and matches, the saved snapshot, its schedule, and the savepoint around them.
+    MAX_QUERIES_PER_MATCH = 25
+    # A match leaving its round in progress: four to lock the tournament and load the match, one to check its
+    # round, one for the opponents of its winner, the winner's and the loser's standings updated and read back,
+    # the tournament, round and match written, and the savepoint around them.
+    MAX_QUERIES_PER_ROUND_MATCH = 14
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create([User(username=f'swiss{i}', alias=f'swiss{i}')
+                                              for i in range(cls.SIZE)])
+
+    def test_tournament_is_played_to_completion(self):
+        tournament = Tournament.objects.create(name='Swiss', creator=self.users[0], size=self.SIZE, format='swiss',
+                                               participant_count=self.SIZE)
+        TournamentParticipant.objects.bulk_create([TournamentParticipant(tournament=tournament, user=user)
+                                                   for user in self.users])
+        start_tournament(tournament)
+
+        query_counts, round_query_counts = [], []
+        for round_number in range(1, swiss_rounds(self.SIZE) + 1):
+            matches = TournamentMatch.objects.filter(round__tournament=tournament, round__number=round_number,
+                                                     status='scheduled')
+            self.assertEqual(matches.count(), self.SIZE // 2)
+            for index, match in enumerate(matches, 1):
+                winner_id = match.participants.order_by('id').values_list('player_id', flat=True).first()
+                with CaptureQueriesContext(connection) as queries:
+                    complete_tournament_matches(tournament.id, [(match.id, winner_id)])
+                query_counts.append(len(queries))
+                if index < self.SIZE // 2:
+                    round_query_counts.append(len(queries))
+            # The standings kept up to date match those computed from the whole bracket
+            with transaction.atomic():
+                computed = SwissBracket.load_rows(Tournament.objects.get(id=tournament.id)).standings()
+            self.assertEqual(ensure_snapshot(Tournament.objects.get(id=tournament.id))['standings'],
+                             [{key: standing[key] for key in ('alias', 'score', 'buchholz')} for standing in computed])
+
+        tournament.refresh_from_db()
+        self.assertEqual(tournament.status, 'completed')
+        self.assertEqual(tournament.rounds.count(), swiss_rounds(self.SIZE))
+        pairs = [tuple(sorted(MatchParticipant.objects.filter(match=match).values_list('player_id', flat=True)))
+                 for match in TournamentMatch.objects.filter(round__tournament=tournament)
+                 if match.participants.filter(player__isnull=True).count() == 0]
+        self.assertEqual(len(pairs), len(set(pairs)))
+        byes = MatchParticipant.objects.filter(match__round__tournament=tournament, player__isnull=True)
+        self.assertEqual(byes.count(), swiss_rounds(self.SIZE))
+        standings = ensure_snapshot(tournament)['standings']
+        self.assertEqual(tournament.winner.alias, standings[0]['alias'])
+        self.assertEqual(sum(standing['score'] for standing in standings),
+                         len(pairs) + swiss_rounds(self.SIZE))
+        self.assertEqual(list(TournamentParticipant.objects.filter(tournament=tournament).order_by('-score')
+                              .values_list('score', flat=True)),
+                         [standing['score'] for standing in standings])
+        self.assertFalse(get_user_model().objects.filter(tournament_id=tournament.id).exists())
+        self.assertLessEqual(max(query_counts), self.MAX_QUERIES_PER_MATCH)
+        self.assertLessEqual(max(round_query_counts), self.MAX_QUERIES_PER_ROUND_MATCH)
+        print(f"\n{len(query_counts)} Swiss matches completed, queries per match: "
+              f"{sum(query_counts) / len(query_counts):.1f} on average, {max(query_counts)} at most")
+
+
+class LargeSwissTournamentTest(TestCase):
+    """
+    Completing a match of a Swiss tournament of the largest size allowed only loads and writes that match, the
+    snapshot of its round and the standings it changed, in a bounded number of queries and time.
+    """
+
+    SIZE = 10000
+    MATCHES = 20
+    MAX_QUERIES_PER_MATCH = SwissTournamentTest.MAX_QUERIES_PER_ROUND_MATCH
+    # Mostly the snapshot of the round of 5000 matches, rewritten as one JSON value.
+    MAX_SECONDS_PER_MATCH = 0.5
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        users = User.objects.bulk_create([User(username=f'large{i}', alias=f'large{i}') for i in range(cls.SIZE)])
+        cls.tournament = Tournament.objects.create(name='Large Swiss', creator=users[0], size=cls.SIZE,
+                                                   format='swiss', participant_count=cls.SIZE)
+        TournamentParticipant.objects.bulk_create([TournamentParticipant(tournament=cls.tournament, user=user)
+                                                   for user in users])
+        start_tournament(cls.tournament)
+
+    def test_match_completion_is_bounded_by_its_round(self):
+        matches = list(TournamentMatch.objects.filter(round__tournament=self.tournament, round__number=1)
+                       .order_by('number')[:self.MATCHES])
+        winners = {match_id: player_id for match_id, player_id in
+                   MatchParticipant.objects.filter(match__in=matches).order_by('-id').values_list('match_id',
+                                                                                                  'player_id')}
+        durations = []
+        for match in matches:
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                bracket = complete_tournament_matches(self.tournament.id, [(match.id, winners[match.id])])
+                durations.append(time.perf_counter() - start)
+            self.assertLessEqual(len(queries), self.MAX_QUERIES_PER_MATCH)
+            self.assertEqual(len(bracket.matches), 1)
+            self.assertEqual(len(bracket.entrants), 2)
+            [delta] = [message['message_data'] for message in bracket.messages
+                       if message['message_data']['type'] == 'tournament_delta']
+            self.assertEqual([event['event'] for event in delta['events']], ['match_completed', 'standings_updated'])
+            # The winner scores, and the loser has one more point of Buchholz: their opponent's point
+            self.assertEqual(sorted((standing['score'], standing['buchholz']) for standing in
+                                    delta['events'][1]['standings']), [(0, 1), (1, 0)])
+
+        snapshot = ensure_snapshot(Tournament.objects.get(id=self.tournament.id))
+        completed = [match for match in snapshot['rounds'][0]['matches'] if match['status'] == 'completed']
+        self.assertEqual(len(snapshot['rounds'][0]['matches']), self.SIZE // 2)
+        self.assertEqual({match['id'] for match in completed}, {match.id for match in matches})
+        self.assertEqual([standing['score'] for standing in snapshot['standings'][:self.MATCHES + 1]],
+                         [1] * self.MATCHES + [0])
+        durations.sort()
+        print(f"\n{self.MATCHES} matches of a {self.SIZE} player Swiss tournament completed: "
+              f"{durations[len(durations) // 2] * 1000:.1f}ms median, {durations[-1] * 1000:.1f}ms at most")
+        self.assertLess(durations[len(durations) // 2], self.MAX_SECONDS_PER_MATCH)
+
+
+class RoundDeadlinesTest(TestCase):
+    """
+    Round deadlines are queued with their round, hidden from the workers until the start time, and their ready
+    check broadcasts through the outbox. Rounds without a queued deadline get one from the replay command.
+    """
+
+    def setUp(self):
+        User = get_user_model()
+        users = User.objects.bulk_create([User(username=f'deadline{i}', alias=f'deadline{i}') for i in range(2)])
+        self.tournament = Tournament.objects.create(name='Deadlines', creator=users[0], size=2, status='in progress')
+        TournamentParticipant.objects.bulk_create([TournamentParticipant(tournament=self.tournament, user=user)
+                                                   for user in users])
+        build_bracket(self.tournament, list(self.tournament.participants.select_related('user')))
+        self.round = self.tournament.rounds.get(number=1)
+
+    def test_deadline_is_taken_at_start_time(self):
+        self.round.start_time = timezone.now() + timedelta(seconds=0.3)
+        self.round.save(update_fields=['start_time'])
+        schedule_round(self.round)
+        self.assertEqual(list(OrmQ.objects.values_list('lock', flat=True)), [self.round.start_time])
+
+        broker = ORM()
+        self.assertFalse(broker.dequeue())
+        while timezone.now() <= self.round.start_time:
+            time.sleep(0.05)
+        [(_, payload)] = broker.dequeue()
+        task = SignedPackage.loads(payload)
+        self.assertEqual((task['func'], task['args']), (ROUND_DEADLINE_TASK, (self.round.id,)))
+
+        # Run it as a worker would, with its broadcasts going through the outbox
+        with mock.patch.object(DISPATCHER, 'through_outbox', True):
+            start_round_task(*task['args'])
+        self.assertFalse(TournamentRound.objects.filter(id=self.round.id, status='scheduled').exists())
+        self.assertTrue(OutboxMessage.objects.filter(group_name=f'tournament_{self.tournament.id}').exists())
+
+    def test_replay_queues_missing_deadlines_once(self):
+        Schedule.objects.create(name=f'round-start-{self.round.id}', func=ROUND_DEADLINE_TASK,
+                                args=repr((self.round.id,)), schedule_type=Schedule.ONCE,
+                                next_run=timezone.now() - timedelta(minutes=1))
+        call_command('replay_round_deadlines', stdout=StringIO())
+        call_command('replay_round_deadlines', stdout=StringIO())
+        self.assertEqual(queued_round_deadlines(), {self.round.id})
+        self.assertEqual(OrmQ.objects.count(), 1)
+        self.assertFalse(Schedule.objects.exists())
@@ -1,50 +1,94 @@
+import math
 import random
-import asyncio
-from threading import Thread
-from functools import partial
 from django.db import transaction, IntegrityError
+from django.db.models import F, Count, OuterRef, Subquery
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from channels.db import database_sync_to_async
+from django_q.tasks import async_task
 from matchmaking.models import GameSession
-from pong_app.consumers import broadcast_message
-from .models import (TournamentParticipant, TournamentRound, TournamentMatch, MatchParticipant)
-from .blockchain import set_tournament_in_blockchain
+from main.dispatcher import DISPATCHER
+from pong_app.consumers import GOVERNOR
+from .deadlines import queue_round_deadline
+from .models import Tournament, TournamentParticipant, TournamentRound, TournamentMatch, MatchParticipant
+from .bracket import Bracket, ROUND_START_DELAY, delta_message
 
 
 def add_participant_to_tournament(tournament, user):
     """
-    Registers a user as a participant in a tournament if there is available space. It attempts to create a new
-    TournamentParticipant object linking the user to the specified tournament. If the tournament has reached its
-    maximum size, or if the user is already registered in the tournament, it fails gracefully.
+    Registers a user as a participant in a tournament if there is available space. The seat is reserved by one
+    conditional UPDATE of the participant count, under the tournament lock, so concurrent joins never overfill it.
+    If the tournament is not open anymore, is full, or if the user or their alias is already registered in it,
+    it fails gracefully and nothing is written.
 
-    Parameters: tournament (Tournament): The tournament instance to add the participant to.
+    Parameters: tournament (Tournament): The tournament instance to add the participant to. Its participant_count
+                                         is refreshed, so the caller can tell whether the join filled it.
                 user (User): The user instance to register as a participant.
     Returns: bool: True if the user is successfully added as a participant, False otherwise.
     """
-    if tournament.participants.count() < tournament.size:
-        try:
+    try:
+        with transaction.atomic():
+            # Ensures that if any of the database operations fail, none of them will be executed.
+            locked = Tournament.objects.select_for_update().values('version', 'participant_count').get(id=tournament.id)
+            tournament.participant_count = locked['participant_count']
             if tournament.participants.filter(user__alias=user.alias).exists():
                 return False
+            reserved = Tournament.objects.filter(id=tournament.id, status='open', participant_count__lt=F('size')) \
+                .update(participant_count=F('participant_count') + 1, version=F('version') + 1)
+            if not reserved:
+                # Tournament is full or has already started
+                return False
+            TournamentParticipant.objects.create(tournament=tournament, user=user)
+            user.tournament_id = tournament.id
+            user.save()
+            tournament.participant_count += 1
+            DISPATCHER.send_on_commit([
+                {'group_name': f"tournament_{tournament.id}",
+                 'message_data': {'type': 'tournament_message',
+                                  'message': f"{user.alias} has joined the tournament."}},
+                {'group_name': f"tournament_{tournament.id}",
+                 'message_data': delta_message(locked['version'] + 1,
+                                               [{'event': 'participant_joined', 'alias': user.alias}])},
+            ])
+        return True
+    except IntegrityError:
+        # This happens if the user is already registered in the tournament.
+        # Comes from the unique_together in the TournamentParticipant model.
+        return False
+
 
-            with transaction.atomic():
-                # Ensures that if any of the database operations fail, none of them will be executed.
-                TournamentParticipant.objects.create(tournament=tournament, user=user)
-                user.tournament_id = tournament.id
-                user.save()
-                run_async_task_in_thread(broadcast_message, f"tournament_{tournament.id}",
-                                         {'type': 'tournament_message',
-                                          'message': f"{user.alias} has joined the tournament."})
-            return True
-        except IntegrityError:
-            # This happens if the user is already registered in the tournament.
-            # Comes from the unique_together in the TournamentParticipant model.
-            return False
+def remove_participant_from_tournament(tournament, user):
+    """
+    Removes a user from a tournament, giving their seat back, and deletes the tournament once nobody is left in it.
+    The broadcasts announcing it are sent once the transaction commits. Must run in a transaction.
+
+    Args:
+        tournament (Tournament): The tournament to leave.
+        user (User): The participant leaving it.
+
+    Raises:
+        TournamentParticipant.DoesNotExist: If the user is not a participant of the tournament.
+    """
+    tournament_id = tournament.id
+    locked = Tournament.objects.select_for_update().values('version', 'participant_count').get(id=tournament_id)
+    TournamentParticipant.objects.get(tournament=tournament, user=user).delete()
+    tournament.participant_count = locked['participant_count'] - 1
+    if tournament.participant_count:
+        Tournament.objects.filter(id=tournament_id) \
+            .update(participant_count=F('participant_count') - 1, version=F('version') + 1)
     else:
-        # Tournament is full
-        return False
+        tournament.delete()
+    user.tournament_id = None
+    user.save()
+    DISPATCHER.send_on_commit([
+        {'group_name': f"{user.alias}", 'message_data': {'type': 'leave_message'}},
+        {'group_name': f"tournament_{tournament_id}",
+         'message_data': {'type': 'tournament_message', 'message': f"{user.alias} has left the tournament."}},
+        {'group_name': f"tournament_{tournament_id}",
+         'message_data': delta_message(locked['version'] + 1,
+                                       [{'event': 'participant_left', 'alias': user.alias}])},
+    ])
 
 
 def start_tournament(tournament):
@@ -55,9 +99,9 @@ def start_tournament(tournament):
     Args:
         tournament (Tournament): The tournament instance to start.
     """
-    if tournament.status == 'open' and tournament.participants.count() == tournament.size:
+    if tournament.status == 'open' and tournament.participant_count == tournament.size:
         tournament.status = 'in progress'
-        tournament.save()
+        tournament.save(update_fields=['status'])
         create_tournament_rounds_and_matches(tournament)
 
 
@@ -65,243 +109,280 @@ def create_tournament_rounds_and_matches(tournament):
     """
     Generates rounds and matches for the tournament based on the number of participants.
     Shuffles participants for random match assignments in the first round, and schedules the first round.
+    A Swiss tournament only gets its first round, paired at random, the next ones are paired from the standings.
 
     Args:
         tournament (Tournament): The tournament for which rounds and matches are created.
     """
-    participants = list(tournament.participants.all())
-    total_rounds = 2 if len(participants) == 4 else 3
+    if tournament.format == 'swiss':
+        with transaction.atomic():
+            bracket = Bracket.load(tournament.id)
+            bracket.pair_round(1)
+            save_bracket(bracket)
+        return
 
+    participants = list(tournament.participants.select_related('user'))
     random.shuffle(participants)
 
     with transaction.atomic():
-        for round_number in range(1, total_rounds + 1):
-            print(f"Creating round {round_number} matches...")
-            round_status = 'scheduled' if round_number == 1 else 'created'
-            tournament_round = TournamentRound.objects.create(
-                tournament=tournament,
-                number=round_number,
-                status=round_status
-            )
-            create_matches_for_round(tournament_round, participants, round_number)
-            if round_number == 1:
-                schedule_round(tournament_round)
-
-
-def create_matches_for_round(tournament_round, participants, round_number):
-    """
-    Creates matches for a given tournament round. Directly pairs participants in the first round,
-    and prepares matches for subsequent rounds without assigning participants immediately.
-
-    Args:
-        tournament_round (TournamentRound): The round for which matches are being created.
-        participants (list): List of tournament participants, shuffled for the first round.
-        round_number (int): The current round number, used to determine pairing and scheduling.
-    """
-    # Number of matches halves each round for a single-elimination tournament
-    num_matches = 2 ** (2 - round_number)
-
-    with transaction.atomic():
-        for i in range(num_matches):
-            match_status = 'scheduled' if round_number == 1 else 'created'
+        rounds = build_bracket(tournament, participants)
+        schedule_round(rounds[0])
 
-            match = TournamentMatch.objects.create(
-                round=tournament_round,
-                status=match_status,
-                number=i + 1
-            )
 
-            players = [participants[i * 2].user, participants[i * 2 + 1].user] if round_number == 1 else [None, None]
-            MatchParticipant.objects.create(match=match, player=players[0], is_ready=False)
-            MatchParticipant.objects.create(match=match, player=players[1], is_ready=False)
+def bracket_rounds(participant_count):
+    """Number of rounds of a single-elimination bracket for this many participants."""
+    return max(1, math.ceil(math.log2(participant_count)))
 
 
-def schedule_round(round):
+def first_round_pairs(participants, total_rounds):
     """
-    Schedules a tournament round to start after a set time interval, marking it as scheduled
-    and setting a start time. It then initializes a timer to check readiness or eliminate participants.
+    Pairs the participants for the first round. When the field is not a power of two, the missing players
+    are byes, spread evenly over the bracket: a bye pairs a participant with None.
 
     Args:
-        round (TournamentRound): The round to be scheduled.
+        participants (list): The tournament participants, in bracket order.
+        total_rounds (int): Number of rounds of the bracket.
+
+    Returns:
+        list: A (participant, participant or None) tuple per first round match.
     """
-    round.status = 'scheduled'
-    start_time = round.start_time = timezone.now() + timezone.timedelta(seconds=60)
-    round.save()
-    run_async_task_in_thread(start_round_timer, start_time, round.id)
-    print(f"Round {round.number} of tournament {round.tournament.id} is scheduled to start at {start_time}.")
+    match_count = 2 ** (total_rounds - 1)
+    byes = 2 * match_count - len(participants)
+    bye_matches = {i * match_count // byes for i in range(byes)} if byes else set()
+    remaining = iter(participants)
+    return [(next(remaining), None) if i in bye_matches else (next(remaining), next(remaining))
+            for i in range(match_count)]
 
 
-def start_async_task(task):
+def build_bracket(tournament, participants):
     """
-    Executes an asynchronous task within its own new event loop in a separate thread,
-    ensuring the asynchronous code executes independently of the synchronous Django view.
+    Creates every round, match and match participant of a single-elimination bracket with one bulk insert
+    each, whatever the size of the tournament, and saves the first snapshot of the bracket as a new version
+    of the locked tournament. Bye matches are created completed, with their winner already placed in their
+    next match. The first round is scheduled. Must run in a transaction.
 
     Args:
-        task (callable): The asynchronous task function to execute.
-    """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(task())
-    loop.close()
+        tournament (Tournament): The tournament for which the bracket is created.
+        participants (list): The tournament participants, in bracket order.
+
+    Returns:
+        list: The rounds of the bracket, in order.
+    """
+    tournament.version = Tournament.objects.select_for_update().values_list('version', flat=True).get(
+        id=tournament.id)
+    total_rounds = bracket_rounds(len(participants))
+    start_time = timezone.now() + timezone.timedelta(seconds=ROUND_START_DELAY)
+    rounds = TournamentRound.objects.bulk_create([
+        TournamentRound(tournament=tournament, number=number, status='scheduled' if number == 1 else 'created',
+                        start_time=start_time if number == 1 else None)
+        for number in range(1, total_rounds + 1)
+    ])
+
+    pairs = first_round_pairs(participants, total_rounds)
+    matches, players = [], []
+    for number, (participant1, participant2) in enumerate(pairs, 1):
+        bye = participant2 is None
+        matches.append(TournamentMatch(round=rounds[0], number=number, status='completed' if bye else 'scheduled',
+                                       winner=participant1.user if bye else None))
+        players.append([participant1.user, None if bye else participant2.user])
+    for round_index in range(1, total_rounds):
+        for number in range(1, 2 ** (total_rounds - round_index - 1) + 1):
+            matches.append(TournamentMatch(round=rounds[round_index], number=number, status='created'))
+            players.append([None, None])
+
+    # Winners of odd matches play on the left of their next match, winners of even matches on the right
+    if total_rounds > 1:
+        for number, (participant1, participant2) in enumerate(pairs, 1):
+            if participant2 is None:
+                players[len(pairs) + (number - 1) // 2][(number - 1) % 2] = participant1.user
+
+    matches = TournamentMatch.objects.bulk_create(matches)
+    slots = MatchParticipant.objects.bulk_create([
+        MatchParticipant(match=match, player=player, is_ready=False)
+        for match, match_players in zip(matches, players) for player in match_players
+    ])
+    bracket = Bracket(tournament, matches, slots, participants)
+    events = bracket.refresh_snapshot()
+    bracket.save_snapshot()
+    DISPATCHER.send_on_commit([{'group_name': f"tournament_{tournament.id}",
+                                'message_data': delta_message(tournament.version, events)}])
+    print(f"Bracket of tournament {tournament.id} created: {len(participants)} participants, {total_rounds} rounds, "
+          f"{len(pairs) * 2 - len(participants)} byes.")
+    return rounds
 
 
-def run_async_task_in_thread(func, *args):
+def schedule_round(round):
     """
-    Wraps an asynchronous function call with its arguments into a synchronous function that
-    is then run in a separate thread, allowing asynchronous tasks to be initiated from synchronous contexts.
+    Schedules the ready check of a round at its start time, which checks readiness or eliminates participants.
+    The deadline is queued for the task cluster with the round, in the same transaction, so it survives restarts.
+    The cluster's broadcasts of the round start reach the WebSocket clients through the outbox.
 
     Args:
-        func (callable): The asynchronous function to be executed.
-        *args: Arguments to pass to the async function.
+        round (TournamentRound): The scheduled round, with its start time set.
     """
-    task = partial(func, *args)  # Bind the arguments to the function
-    thread = Thread(target=lambda: start_async_task(task))  # Use lambda to call start_async_task with task
-    thread.start()
+    queue_round_deadline(round.id, round.start_time)
+    print(f"Round {round.number} of tournament {round.tournament_id} is scheduled to start at {round.start_time}.")
 
 
-async def start_round_timer(start_time, round_id):
+def start_round(round_id):
     """
-    Waits until a specified start time is reached to perform checks on participants' readiness
-    in a tournament round, potentially eliminating unready participants.
+    Starts a round whose ready check has expired: players who are not ready are eliminated and the whole
+    progression this causes is written at once.
 
     Args:
-        start_time (datetime): The scheduled start time for the round.
-        round_id (int): The ID of the round to check.
+        round_id (int): The ID of the round to start.
     """
-
-    sleep_seconds = max(0, (start_time - timezone.now()).total_seconds())
-    await asyncio.sleep(sleep_seconds)
-    print("Round timer has expired.")
-    matches = await eliminate_not_ready_players(round_id)
-    for match in matches:
-        await eliminate_both_players(match)
+    print(f"Checking if all participants are ready for round {round_id}...")
+    with transaction.atomic():
+        try:
+            round = TournamentRound.objects.get(id=round_id)
+        except TournamentRound.DoesNotExist:
+            print(f"Error: Round {round_id} does not exist.")
+            return
+        bracket = Bracket.load(round.tournament_id)
+        round = bracket.rounds[round.number]
+        if round.status != 'scheduled':
+            return
+        bracket.start_round(round)
+        save_bracket(bracket)
 
 
-@database_sync_to_async
-def eliminate_not_ready_players(round_id):
+def complete_tournament_matches(tournament_id, results):
     """
-    Identifies and processes matches within a round to eliminate participants who are not ready
-    by the round's start time, marking their matches accordingly or determining a winner if applicable.
+    Completes matches of a tournament and applies everything that follows from them in one transaction:
+    the bracket is loaded in memory, progressed, and written back with one bulk update per table. A format whose
+    matches only change their own round, like Swiss, loads just these matches until their round is over.
 
     Args:
-        round_id (int): The ID of the round for which to check participant readiness.
+        tournament_id (int): The tournament the matches belong to.
+        results (list): (match id, winner user id) tuples, the winner is None if both players are eliminated.
 
     Returns:
-        list: A list of matches where actions were taken due to participants not being ready.
+        Bracket: The progressed bracket.
     """
+    with transaction.atomic():
+        bracket = Bracket.load(tournament_id, [match_id for match_id, _ in results])
+        for match_id, winner_id in results:
+            bracket.complete_match(bracket.matches[match_id], winner_id)
+        save_bracket(bracket)
+    return bracket
 
-    print(f"Checking if all participants are ready for round {round_id}...")
-    matches_to_eliminate = []
-    try:
-        round = TournamentRound.objects.get(id=round_id)
-        if round.status != 'scheduled':
-            return []
-        round.status = 'in progress'
-        round.save()
-        with transaction.atomic():
-            for match in round.matches.all():
-                if all(participant.is_ready for participant in match.participants.all()):
-                    continue
-                if all(not participant.is_ready for participant in match.participants.all()):
-                    print(f"All participants in match {match.id} are not ready. Eliminating them from the tournament.")
-                    matches_to_eliminate.append(match)
-                else:
-                    match.winner = match.participants.get(is_ready=True).player
-                    match.status = 'completed'
-                    match.save()
-                    print(f"Match {match.id} has been completed.")
-    except TournamentRound.DoesNotExist:
-        print(f"Error: Round {round_id} does not exist.")
-    return matches_to_eliminate
-
-
-@database_sync_to_async
-def eliminate_both_players(match):
-    """
-    Marks both participants of a match as eliminated if neither was ready by the round's start time,
-    affecting their status in the tournament and the match's outcome.
 
-    Args:
-        match (TournamentMatch): The match to process.
+def toggle_ready(tournament_id, match_id, user_id, ready):
     """
+    Sets the ready state of a player in a scheduled match of a tournament and, once both its players are ready,
+    starts the match and creates its game session, all in one transaction. Whether both players are ready is
+    answered by the conditional update starting the match, so a match is only started once, however many of its
+    players get ready at the same time. The bracket snapshot is left as is: the toggle only bumps the tournament
+    version, and pages read the ready states from the players' rows (see overlay_live_matches()).
+    A match is only started if this worker can take its game: otherwise the whole toggle is rolled back, and the
+    player can get ready again in a moment.
 
-    tournament = match.round.tournament
-
-    for participant in match.participants.all():
-        try:
-            if participant.player:
-                tournament_participant = TournamentParticipant.objects.get(tournament=tournament,
-                                                                           user=participant.player)
-                tournament_participant.status = 'eliminated'
-                tournament_participant.save()
-                participant.player.tournament_id = None
-                participant.player.save()
-        except TournamentParticipant.DoesNotExist:
-            print(f"Error: TournamentParticipant not found for user {participant.player.alias} "
-                  f"in tournament {tournament.name}.")
-
-    match.status = 'completed'
-    match.save()
-    print(f"Match {match.id} has been completed.")
+    Args:
+        tournament_id (int): The tournament the match belongs to.
+        match_id (int): The match to get ready for.
+        user_id (int): The player.
+        ready (bool): Their new ready state.
 
+    Returns:
+        tuple: The delta message of the change for the tournament group, and the session of the match if it
+            started, with its players loaded, None otherwise. None if the player is not in a scheduled match.
 
-@receiver(post_save, sender=GameSession)
-def handle_game_session_finish(sender, instance, **kwargs):
+    Raises:
+        GameCapacityError: If both players are ready but the worker is too loaded to host their game.
     """
-    Handles the finish of a game session by updating the corresponding tournament match,
-    marking it as completed and setting the winner.
+    with transaction.atomic():
+        # The version is bumped first, so toggles take the tournament row in the same order as bracket changes.
+        if not Tournament.objects.filter(id=tournament_id).update(version=F('version') + 1):
+            return None
+        updated = MatchParticipant.objects.filter(match_id=match_id, player_id=user_id, match__status='scheduled',
+                                                  match__round__tournament_id=tournament_id).update(is_ready=ready)
+        if not updated:
+            transaction.set_rollback(True)
+            return None
+        # The players of the match in slot order, along with the version just written
+        players = list(MatchParticipant.objects.filter(match_id=match_id).order_by('id')
+                       .values_list('player_id', 'match__round__tournament__version'))
+        version = players[0][1]
+        events = [{'event': 'ready_toggled', 'match_id': match_id,
+                   'slot': [player_id for player_id, _ in players].index(user_id), 'player_id': user_id, 'ready': ready}]
+        game_session = None
+        if ready and start_ready_match(match_id):
+            GOVERNOR.check_admission()
+            game_session = create_match_game_session(match_id)
+            events.append({'event': 'match_started', 'match_id': match_id})
+    return delta_message(version, events), game_session
+
+
+def start_ready_match(match_id):
+    """Mark a scheduled match in progress if both its players are ready. Returns whether it was started."""
+    ready_players = MatchParticipant.objects.filter(match_id=OuterRef('pk'), player__isnull=False, is_ready=True) \
+        .values('match_id').annotate(count=Count('id')).values('count')
+    return bool(TournamentMatch.objects.filter(id=match_id, status='scheduled')
+                .alias(ready_players=Subquery(ready_players)).filter(ready_players=2)
+                .update(status='in progress'))
+
+
+def create_match_game_session(match_id):
+    """
+    Create the game session of a match just started, its players left then right, and move them to it.
 
-    Args:
-        sender (Model class): The model class of the sender.
-        instance (GameSession): The instance of the GameSession that was saved.
-        **kwargs: Extra keyword arguments.
+    Returns:
+        GameSession: The session, with its players loaded.
     """
-
-    if instance.status == 'finished':
-        try:
-            match = TournamentMatch.objects.get(game_session_id=instance.id)
-            match.status = 'completed'
-            match.winner = instance.winner
-            match.save()
-            print(f"Match {match.id} has been completed.")
-        except TournamentMatch.DoesNotExist:
-            print("No corresponding TournamentMatch found for the GameSession.")
+    players = [participant.player for participant in
+               MatchParticipant.objects.filter(match_id=match_id).select_related('player').order_by('id')]
+    game_session = GameSession.objects.create(player1=players[0], player2=players[1], mode='tournament')
+    TournamentMatch.objects.filter(id=match_id).update(game_session=game_session)
+    get_user_model().objects.filter(id__in=[player.id for player in players]).update(session_id=game_session.id)
+    for player in players:
+        player.session_id = game_session.id
+    return game_session
 
 
-@receiver(post_save, sender=TournamentMatch)
-def handle_match_completion(sender, instance, **kwargs):
+def save_bracket(bracket):
     """
-    Handles the completion of a tournament match. It progresses the tournament
-    and broadcasts a message to update participants about the tournament's progress.
+    Persists a progressed bracket along with its side effects, all in the transaction that progressed it:
+    the schedules of the rounds it scheduled and the recording of a completed tournament on the blockchain go to
+    the task queue, and its messages to the outbox, to be broadcast once the transaction commits.
 
     Args:
-        sender (Model class): The model class of the sender.
-        instance (TournamentMatch): The instance of the TournamentMatch that was saved.
-        **kwargs: Extra keyword arguments.
+        bracket (Bracket): The progressed bracket, loaded in the current transaction.
     """
-
-    if instance.status == 'completed':
-        progress_tournament(instance)
-        group_name = f"tournament_{instance.round.tournament.id}"
-        message_data = {
-            'type': 'tournament_message',
-            'message': f"Tournament {instance.round.tournament.name} has been updated."
-        }
-        run_async_task_in_thread(broadcast_message, group_name, message_data)
+    bracket.persist()
+    for round in bracket.scheduled_rounds:
+        schedule_round(round)
+    if bracket.completed:
+        async_task('tournaments.tasks.record_tournament_task', bracket.tournament.id, bracket.participant_aliases())
+        print(f"Tournament {bracket.tournament.id} has been completed.")
+    DISPATCHER.send_on_commit(bracket.messages)
 
 
-def progress_tournament(match):
+@receiver(post_save, sender=GameSession)
+def handle_game_session_finish(sender, instance, update_fields=None, **kwargs):
     """
-    Processes the progression of the tournament after a match completes. This includes
-    eliminating the loser, advancing the winner, and progressing the round.
+    Handles the finish of a game session by completing the corresponding tournament match
+    and progressing the tournament.
 
     Args:
-        match (TournamentMatch): The match that has just been completed.
+        sender (Model class): The model class of the sender.
+        instance (GameSession): The instance of the GameSession that was saved.
+        update_fields (frozenset): The fields saved, None if all of them were.
+        **kwargs: Extra keyword arguments.
     """
 
-    eliminate_loser(match)
-    advance_winner(match)
-    round_progress(match.round)
+    if instance.status != 'finished' or instance.mode != 'tournament':
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    match = (TournamentMatch.objects.filter(game_session_id=instance.id)
+             .values_list('id', 'round__tournament_id').first())
+    if match is None:
+        print("No corresponding TournamentMatch found for the GameSession.")
+        return
+    match_id, tournament_id = match
+    complete_tournament_matches(tournament_id, [(match_id, instance.winner_id)])
+    print(f"Match {match_id} has been completed.")
 
 
 User = get_user_model()
@@ -312,162 +393,3 @@ def user_post_save(sender, instance, **kwargs):
     """
     # Log the current state of the tournament_id for the user instance that was saved
     print(f"Post-save signal for {instance.alias}: tournament_id is now {instance.tournament_id}")
-
-
-@transaction.atomic
-def eliminate_loser(match):
-    """
-    Eliminates the loser of a match from the tournament, updating both the match and
-    participant records accordingly. Wrapped in a transaction to ensure atomicity.
-
-    Args:
-        match (TournamentMatch): The match whose loser needs to be eliminated.
-    """
-    losers = match.participants.exclude(player=match.winner).all()
-    for loser in losers:
-        loser_user = loser.player
-        if not loser_user:
-            continue
-
-        # Attempt to update tournament_id to None
-        loser_user.tournament_id = None
-        loser_user.save(update_fields=['tournament_id'])
-        print(f"{loser_user.alias}'s tournament ID updated to {loser_user.tournament_id}.")
-
-        tournament = match.round.tournament
-        try:
-            tournament_participant = TournamentParticipant.objects.get(
-                tournament=tournament,
-                user=loser_user
-            )
-            tournament_participant.status = 'eliminated'
-            tournament_participant.save()
-            print(f"{loser_user.alias} has been eliminated from the tournament.")
-        except TournamentParticipant.DoesNotExist:
-            print(f"TournamentParticipant not found for user {loser_user.alias} in tournament {tournament.name}.")
-            
-        run_async_task_in_thread(broadcast_message, f"tournament_{tournament.id}", 
-                                 {'type': 'tournament_message',
-                                  'message': f"{loser_user.alias} has been eliminated from the tournament."})
-        run_async_task_in_thread(broadcast_message, loser_user.alias, {'type': "leave_message"})
-
-
-def advance_winner(match):
-    """
-    Advances the winner of a match to their next match in the tournament or marks the tournament as completed
-    if the match was the final one.
-
-    Args:
-        match (TournamentMatch): The match that has just been completed.
-    """
-
-    tournament = match.round.tournament
-
-    if match.round == tournament.rounds.last():
-        complete_tournament(tournament, match)
-    else:
-        place_winner_in_next_round(match, tournament)
-
-
-def complete_tournament(tournament, match):
-    """
-    Marks the tournament as completed and updates the status of the winning participant.
-
-    Args:
-        tournament (Tournament): The tournament to be marked as completed.
-        match (TournamentMatch): The final match of the tournament containing the winner.
-    """
-    tournament.status = 'completed'
-    tournament.save()
-
-    if match.winner:
-        match.winner.tournament_id = None
-        match.winner.save()
-        tournament.winner = match.winner
-        tournament.save()
-        run_async_task_in_thread(broadcast_message, f"tournament_{tournament.id}", 
-                                 {'type': 'tournament_message',
-                                  'message': f"{match.winner.alias} has won the tournament !"})
-        run_async_task_in_thread(broadcast_message, match.winner.alias, {'type': "leave_message"})
-
-    participants_string_array = get_participants_string_array(tournament)
-    run_async_task_in_thread(set_tournament_in_blockchain,tournament, participants_string_array)
-
-    print(f"Tournament {tournament.id} has been completed.")
-
-def get_participants_string_array(tournament):
-    participants_string_array = []
-
-    for participant in tournament.participants.all():
-        participants_string_array.append(participant.user.alias)
-
-    # To handle empty slots after both player fail the ready check in a match
-    participants_string_array.append("None")
-
-    return participants_string_array
-
-
-
-
-def place_winner_in_next_round(match, tournament):
-    """
-    Places the winner of a match into the next scheduled match in the tournament.
-
-    Args:
-        match (TournamentMatch): The match whose winner is to be advanced.
-        tournament (Tournament): The tournament containing the match and its subsequent rounds.
-    """
-    try:
-        next_round = tournament.rounds.get(number=match.round.number + 1)
-        next_match_number = (match.number + 1) // 2
-        next_match = next_round.matches.get(number=next_match_number)
-        participant = next_match.participants.filter(player=None).first()
-        participant.player = match.winner
-        participant.save()
-        print(f"Round {match.round.number}: Winner of match {match.number} has been placed in match {next_match_number}\
-              of Round {next_round.number}.")
-    except TournamentRound.DoesNotExist:
-        print(f"Error: Next round does not exist for round number {match.round.number + 1}.")
-    except TournamentMatch.DoesNotExist:
-        print(f"Error: Match number {next_match_number} in round {match.round.number + 1} does not exist.")
-    except MatchParticipant.DoesNotExist:
-        print(f"Error: No participant placeholder found for match number {next_match_number} in round \
-        {match.round.number + 1}.")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-
-
-def round_progress(round):
-    """
-    Marks a round as completed if all matches within the round are completed, and prepares the tournament
-    for the next round.
-
-    Args:
-        round (TournamentRound): The round to check and update the status of.
-    """
-    if all(match.status == 'completed' for match in round.matches.all()):
-        round.status = 'completed'
-        round.save()
-        print(f"Round {round.number} of tournament {round.tournament.id} has been completed.")
-
-        setup_next_round(round)
-
-
-def setup_next_round(round):
-    """
-    Schedules the next round in the tournament, updating the statuses of the matches to scheduled.
-
-    Args:
-        round (TournamentRound): The round that has just been completed.
-    """
-    try:
-        if round != round.tournament.rounds.last():
-            next_round = round.tournament.rounds.get(number=round.number + 1)
-            schedule_round(next_round)
-            print(f"Round {next_round.number} of tournament {round.tournament.id} is now scheduled.")
-            for match in next_round.matches.all():
-                match.status = "scheduled"
-                match.save()
-
-    except TournamentRound.DoesNotExist:
-        print(f"No next round exists for round number {round.number + 1} in tournament {round.tournament.id}.")
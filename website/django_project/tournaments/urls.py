@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import tournament_list, create_tournament, join_tournament, leave_tournament, tournament_view
+from .views import (tournament_list, create_tournament, join_tournament, leave_tournament, tournament_view,
+                    tournament_state)
 
 urlpatterns = [
     path('', tournament_list, name='tournaments_view'),
@@ -7,4 +8,5 @@ urlpatterns = [
     path('join/<int:tournament_id>/', join_tournament, name='join_tournament'),
     path('leave/<int:tournament_id>/', leave_tournament, name='leave_tournament'),
     path('<int:tournament_id>/', tournament_view, name='tournament_view'),
+    path('<int:tournament_id>/state.json', tournament_state, name='tournament_state'),
 ]
@@ -1,13 +1,15 @@
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import JsonResponse, HttpResponse
 from django.template.loader import render_to_string
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, condition
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
-from pong_app.consumers import broadcast_message, broadcast_messages
 from main.utils import render_template
 from .models import Tournament, TournamentParticipant, TournamentMatch
 from .forms import TournamentCreationForm
-from .tournaments import add_participant_to_tournament, start_tournament, run_async_task_in_thread
+from .tournaments import add_participant_to_tournament, remove_participant_from_tournament, start_tournament
+from .bracket import ensure_snapshot, overlay_live_matches
+from .fragments import LANGUAGES, get_tournament_fragment, render_for_player
 
 
 @login_required
@@ -18,25 +20,46 @@ def tournament_list(request):
 
 @login_required
 def tournament_view(request, tournament_id):
-    tournament = get_object_or_404(Tournament, id=tournament_id)
-    user = request.user
+    """
+    Renders a tournament from the page cached for its current version, putting in the ready button of the player.
+    The page itself is rendered once per version and language in each process, however many players load it at the
+    same time.
+    """
+    tournament = get_object_or_404(Tournament.objects.defer('bracket'), id=tournament_id)
+    language = request.GET.get('language', 'en')
+    if language not in LANGUAGES:
+        language = 'en'
+    fragment = get_tournament_fragment(tournament, language)
+    return HttpResponse(render_for_player(fragment, request.user.id, language))
 
-    participant = None
 
-    for _round in tournament.rounds.all():
-        for match in _round.matches.all():
-            if match.participants.filter(player=user).exists() and match.status != 'completed':
-                participant = match.participants.get(player=user)
-                break
-        if participant:
-            break
+def tournament_state_etag(request, tournament_id):
+    """The ETag of a tournament's state: its version, read without touching the bracket."""
+    version = Tournament.objects.filter(id=tournament_id).values_list('version', flat=True).first()
+    return None if version is None else f'{tournament_id}-{version}'
 
-    context = {
-        'tournament': tournament,
-        'participant': participant,
-    }
 
-    return render_template(request, 'tournament.html', context)
+@login_required
+@condition(etag_func=tournament_state_etag)
+def tournament_state(request, tournament_id):
+    """
+    The state of a tournament as JSON, for clients polling it: the bracket snapshot with the ready states of its
+    pending matches, plus the participants while the tournament is open. Polls sending the ETag of the current version get a 304 from one indexed read.
+    """
+    tournament = get_object_or_404(Tournament, id=tournament_id)
+    state = {
+        'id': tournament.id,
+        'name': tournament.name,
+        'size': tournament.size,
+        'status': tournament.status,
+        'winner': None,
+        'rounds': [],
+        **(overlay_live_matches(tournament.id, ensure_snapshot(tournament)) or {}),
+        'version': tournament.version,
+    }
+    if tournament.status == 'open':
+        state['participants'] = list(tournament.participants.order_by('id').values_list('user__alias', flat=True))
+    return JsonResponse(state)
 
 
 @login_required
@@ -78,14 +101,17 @@ def join_tournament(request, tournament_id):
     except Tournament.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Tournament not found'}, status=404)
 
-    if add_participant_to_tournament(tournament, request.user):
-        request.user.tournament_id = tournament.id
-        if tournament.participants.count() == tournament.size:
+    # Joining and the start it may trigger commit together, and their broadcasts go out as one delta
+    with transaction.atomic():
+        joined = add_participant_to_tournament(tournament, request.user)
+        if joined and tournament.participant_count == tournament.size:
             start_tournament(tournament)
+    if joined:
+        request.user.tournament_id = tournament.id
         return JsonResponse({'success': True, 'message': 'Successfully joined the tournament',
                              'next_url': f'/tournaments/{tournament.id}/'})
     else:
-        if tournament.participants.count() >= tournament.size:
+        if tournament.participant_count >= tournament.size:
             return JsonResponse({'success': False, 'message': 'Tournament is already full'}, status=400)
         return JsonResponse({'success': False,
                              'message': 'Could not join the tournament. You may already be registered or your alias is already used.'}, status=401)
@@ -95,24 +121,10 @@ def join_tournament(request, tournament_id):
 @require_POST
 def leave_tournament(request, tournament_id):
     try:
-        tournament = Tournament.objects.get(id=tournament_id)
-        participant = TournamentParticipant.objects.get(tournament=tournament, user=request.user)
-        participant.delete()
-        request.user.tournament_id = None
-        request.user.save()
-        # Broadcast a message indicating the user has left the tournament
-        messages = [
-            {'group_name': f"{request.user.alias}", 'message_data': {'type': 'leave_message'}},
-            {'group_name': f"tournament_{tournament.id}",
-             'message_data': {'type': 'tournament_message',
-                              'message': f"{request.user.alias} has left the tournament."}}
-        ]
-        run_async_task_in_thread(broadcast_messages, messages)
-        if not TournamentParticipant.objects.filter(tournament=tournament).exists():
-            tournament.delete()
+        with transaction.atomic():
+            remove_participant_from_tournament(Tournament.objects.get(id=tournament_id), request.user)
         return JsonResponse({'success': True, 'message': 'Successfully left the tournament'})
     except Tournament.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Tournament not found'}, status=404)
     except TournamentParticipant.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'You are not a participant in this tournament'}, status=402)
-        
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import CustomUser
+from .models import CustomUser, PlayerStats
 
 # Register your models here.
 admin.site.register(CustomUser)
+admin.site.register(PlayerStats)
 
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.models import PlayerStats
+from users.stats import compute_player_stats, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Compare the stored player statistics with the statistics computed from the full history.'
+
+    def handle(self, *args, **options):
+        expected = compute_player_stats()
+        mismatches = 0
+        checked = set()
+        for stored in PlayerStats.objects.iterator(chunk_size=CHUNK_SIZE):
+            checked.add(stored.user_id)
+            computed = expected.get(stored.user_id, PlayerStats(user_id=stored.user_id))
+            differences = {field: (getattr(stored, field), getattr(computed, field))
+                           for field in PlayerStats.COUNTERS if getattr(stored, field) != getattr(computed, field)}
+            if differences:
+                mismatches += 1
+                self.stdout.write(f'User {stored.user_id}: ' + ', '.join(
+                    f'{field} is {stored_value}, expected {computed_value}'
+                    for field, (stored_value, computed_value) in differences.items()))
+        for user_id in expected.keys() - checked:
+            mismatches += 1
+            self.stdout.write(f'User {user_id}: statistics row missing')
+
+        if mismatches:
+            raise CommandError(f'{mismatches} players have inconsistent statistics, '
+                               f'run rebuild_player_stats to fix them.')
+        self.stdout.write(self.style.SUCCESS(f'Statistics of {len(checked)} players are consistent.'))
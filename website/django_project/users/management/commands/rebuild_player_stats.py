@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.models import PlayerStats
+from users.stats import compute_player_stats, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Recompute every player\'s statistics from the full game and tournament history. '
+            'Only needed for backfills: statistics are otherwise updated incrementally.')
+
+    def handle(self, *args, **options):
+        stats = compute_player_stats()
+        with transaction.atomic():
+            PlayerStats.objects.all().delete()
+            PlayerStats.objects.bulk_create(stats.values(), batch_size=CHUNK_SIZE)
+        self.stdout.write(self.style.SUCCESS(f'Statistics rebuilt for {len(stats)} players.'))
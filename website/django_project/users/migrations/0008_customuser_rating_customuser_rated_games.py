@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2024-06-03 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_alter_customuser_alias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='rating',
+            field=models.FloatField(db_index=True, default=1000),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='rated_games',
+            field=models.IntegerField(default=0),
+        ),
+    ]
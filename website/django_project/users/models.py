@@ -5,6 +5,8 @@ class CustomUser(AbstractUser):
     session_id = models.IntegerField(null=True, blank=True, default=None)
     tournament_id = models.IntegerField(null=True, blank=True, default=None)
     alias = models.CharField(max_length=20, blank=True, default='')
+    rating = models.FloatField(default=1000, db_index=True)
+    rated_games = models.IntegerField(default=0)
 
     def save(self, *args, **kwargs):
         if not self.alias:
@@ -15,5 +17,43 @@ class CustomUser(AbstractUser):
         return f'{self.alias}'
 
 
+class PlayerStats(models.Model):
+    """
+    Statistics of a player's online and tournament games, kept up to date when games finish and tournaments
+    complete, so they never have to be computed from the game history when displayed.
+    """
+    user = models.OneToOneField(CustomUser, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    wins = models.IntegerField(default=0)
+    losses = models.IntegerField(default=0)
+    points_for = models.IntegerField(default=0)
+    points_against = models.IntegerField(default=0)
+    # Positive while on a winning streak, negative while on a losing streak.
+    current_streak = models.IntegerField(default=0)
+    best_streak = models.IntegerField(default=0)
+    tournaments_played = models.IntegerField(default=0)
+    tournaments_won = models.IntegerField(default=0)
 
+    COUNTERS = ['wins', 'losses', 'points_for', 'points_against', 'current_streak', 'best_streak',
+                'tournaments_played', 'tournaments_won']
 
+    @property
+    def games_played(self):
+        return self.wins + self.losses
+
+    @property
+    def win_rate(self):
+        return round(100 * self.wins / self.games_played) if self.games_played else 0
+
+    def record_game(self, won, points_for, points_against):
+        self.wins += int(won)
+        self.losses += int(not won)
+        self.points_for += points_for
+        self.points_against += points_against
+        if won:
+            self.current_streak = self.current_streak + 1 if self.current_streak > 0 else 1
+        else:
+            self.current_streak = self.current_streak - 1 if self.current_streak < 0 else -1
+        self.best_streak = max(self.best_streak, self.current_streak)
+
+    def __str__(self):
+        return f'{self.user.alias}: {self.wins}W - {self.losses}L'
@@ -0,0 +1,73 @@
+from django.db.models import F
+from matchmaking.models import GameSession
+from matchmaking.ratings import FINISH_ORDER, is_rated
+from tournaments.models import Tournament, TournamentParticipant
+from .models import PlayerStats
+
+# Rows read from the database per round trip when computing the statistics from history.
+CHUNK_SIZE = 2000
+
+
+def locked_stats(user_ids):
+    """Statistics rows of the given users, created if missing and locked until the end of the transaction."""
+    PlayerStats.objects.bulk_create([PlayerStats(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    return PlayerStats.objects.select_for_update().in_bulk(user_ids)
+
+
+def record_game_result(session):
+    """
+    Account a finished game in the statistics of both players.
+    Must run in the transaction that marks the session finished, so every game is accounted exactly once.
+    """
+    if not is_rated(session):
+        return
+    stats = locked_stats([session.player1_id, session.player2_id])
+    stats[session.player1_id].record_game(session.winner_id == session.player1_id,
+                                          session.player1_score, session.player2_score)
+    stats[session.player2_id].record_game(session.winner_id == session.player2_id,
+                                          session.player2_score, session.player1_score)
+    PlayerStats.objects.bulk_update(stats.values(), PlayerStats.COUNTERS)
+
+
+def record_tournament_result(tournament, participant_ids=None):
+    """Account a completed tournament in the statistics of its participants and winner."""
+    if participant_ids is None:
+        participant_ids = list(tournament.participants.values_list('user_id', flat=True))
+    PlayerStats.objects.bulk_create([PlayerStats(user_id=user_id) for user_id in participant_ids],
+                                    ignore_conflicts=True)
+    PlayerStats.objects.filter(user_id__in=participant_ids).update(tournaments_played=F('tournaments_played') + 1)
+    if tournament.winner_id:
+        PlayerStats.objects.filter(user_id=tournament.winner_id).update(tournaments_won=F('tournaments_won') + 1)
+
+
+def compute_player_stats():
+    """
+    Compute the statistics of every player from the full history, streaming the finished games in the order they
+    were accounted, so streaks come out as they were kept. Returns unsaved PlayerStats keyed by user id.
+    """
+    stats = {}
+
+    def stats_for(user_id):
+        if user_id not in stats:
+            stats[user_id] = PlayerStats(user_id=user_id)
+        return stats[user_id]
+
+    games = (GameSession.objects.filter(status='finished', winner__isnull=False).exclude(mode='local')
+             .order_by(*FINISH_ORDER)
+             .values_list('mode', 'player1_id', 'player2_id', 'winner_id', 'player1_score', 'player2_score')
+             .iterator(chunk_size=CHUNK_SIZE))
+    for mode, player1_id, player2_id, winner_id, player1_score, player2_score in games:
+        if player1_id == player2_id:
+            continue
+        stats_for(player1_id).record_game(winner_id == player1_id, player1_score, player2_score)
+        stats_for(player2_id).record_game(winner_id == player2_id, player2_score, player1_score)
+
+    participants = (TournamentParticipant.objects.filter(tournament__status='completed')
+                    .values_list('user_id', flat=True).iterator(chunk_size=CHUNK_SIZE))
+    for user_id in participants:
+        stats_for(user_id).tournaments_played += 1
+    winners = (Tournament.objects.filter(status='completed', winner__isnull=False)
+               .values_list('winner_id', flat=True).iterator(chunk_size=CHUNK_SIZE))
+    for user_id in winners:
+        stats_for(user_id).tournaments_won += 1
+    return stats
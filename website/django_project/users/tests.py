@@ -1,3 +1,63 @@
-from django.test import TestCase
+from io import StringIO
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+from matchmaking.models import GameSession
+from pong_app.consumers import update_game_session_status
+from .models import PlayerStats
 
-# Create your tests here.
+
+class PlayerStatsTest(TransactionTestCase):
+    """
+    Statistics are kept as games finish, and the history rebuilds them to the same values, streaks included,
+    whatever order the games were created in. Games are ended through the consumers' database hop, which closes
+    the connection it ran on, so the test runs outside a test transaction.
+    """
+
+    def setUp(self):
+        User = get_user_model()
+        self.first, self.second = User.objects.bulk_create([User(username='stats1', alias='stats1'),
+                                                            User(username='stats2', alias='stats2')])
+
+    def start(self, winner, score=(3, 1)):
+        return GameSession.objects.create(player1=self.first, player2=self.second, winner=winner,
+                                          player1_score=score[0], player2_score=score[1], status='in progress')
+
+    def finish(self, session):
+        async_to_sync(update_game_session_status)(session, 'finished')
+
+    def stats(self):
+        return {user_id: {field: getattr(stats, field) for field in PlayerStats.COUNTERS}
+                for user_id, stats in PlayerStats.objects.in_bulk().items()}
+
+    def test_games_are_accounted_as_they_finish(self):
+        for session in [self.start(self.first), self.start(self.first, (3, 2)), self.start(self.second, (0, 3))]:
+            self.finish(session)
+        first = PlayerStats.objects.get(user=self.first)
+        self.assertEqual((first.wins, first.losses, first.points_for, first.points_against), (2, 1, 6, 6))
+        self.assertEqual((first.current_streak, first.best_streak), (-1, 2))
+        second = PlayerStats.objects.get(user=self.second)
+        self.assertEqual((second.current_streak, second.best_streak), (1, 1))
+
+    def test_rebuild_replays_games_in_finish_order(self):
+        # The game created first finishes last, so creation order would end the streaks the other way round
+        lost, won = self.start(self.second), self.start(self.first)
+        self.finish(won)
+        self.finish(lost)
+        incremental = self.stats()
+        self.assertEqual(incremental[self.first.id]['current_streak'], -1)
+
+        call_command('check_player_stats', stdout=StringIO())
+        PlayerStats.objects.update(wins=0, current_streak=0)
+        call_command('rebuild_player_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+    def test_check_reports_drift(self):
+        self.finish(self.start(self.first))
+        PlayerStats.objects.filter(user=self.first).update(wins=5)
+        output = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_player_stats', stdout=output)
+        self.assertIn(f'User {self.first.id}: wins is 5, expected 1', output.getvalue())
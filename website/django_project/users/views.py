@@ -7,6 +7,8 @@ from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from .forms import CustomUserCreationForm, CustomLoginForm
 from main.utils import render_template
+from .models import PlayerStats
+from matchmaking.leaderboard import RATING_RANKS, get_rating_leaderboard, get_wins_leaderboard
 
 def register_view(request):
     """
@@ -79,7 +81,21 @@ def logout_view(request):
 
 @login_required
 def user_profile_view(request):
-    return render_template(request, 'user_profile.html')
+    """
+    Display the user's profile with their statistics, rating and rank, the rating leaderboard and the wins
+    leaderboard of the requested period. Statistics are read from their precomputed row. Leaderboards come from the cache and the rank from the in-memory rank tree.
+    """
+    period = request.GET.get('period', 'week')
+    if period not in ('week', 'month'):
+        period = 'week'
+    context = {
+        'stats': PlayerStats.objects.filter(user=request.user).first() or PlayerStats(user=request.user),
+        'rank': RATING_RANKS.rank(request.user.rating),
+        'rating_leaderboard': get_rating_leaderboard(),
+        'wins_leaderboard': get_wins_leaderboard(period),
+        'period': period,
+    }
+    return render_template(request, 'user_profile.html', context)
 
 @login_required
 def get_user_session(request):